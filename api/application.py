@@ -36,6 +36,7 @@ async def startup() -> None:
 
 async def shutdown() -> None:
     await appManager.database.disconnect()
+    await appManager.strategyManager.uniswapClient.ampClient.close_connections()
 
 
 app = Starlette(
@@ -0,0 +1,61 @@
+import asyncio
+import os
+
+from core import logging
+from core.queues.message_queue_processor import MessageQueueProcessor
+
+from rangeseeker.app_manager import AppManager
+from rangeseeker.create_app_manager import create_app_manager
+from rangeseeker.create_app_manager import create_rebalance_queue
+from rangeseeker.rebalance_message_processor import RebalanceMessageProcessor
+
+name = os.environ.get('NAME', 'rangeseeker-executor')
+version = os.environ.get('VERSION', 'local')
+environment = os.environ.get('ENV', 'dev')
+isRunningDebugMode = environment == 'dev'
+
+if isRunningDebugMode:
+    logging.init_basic_logging()
+else:
+    logging.init_json_logging(name=name, version=version, environment=environment)
+
+# Rebalances sign and broadcast transactions so only a few run at once per executor process
+AGENT_REBALANCE_CONCURRENCY = int(os.environ.get('AGENT_REBALANCE_CONCURRENCY', '5'))
+AGENT_REBALANCE_TIMEOUT_SECONDS = float(os.environ.get('AGENT_REBALANCE_TIMEOUT_SECONDS', '600'))
+QUEUE_SLEEP_SECONDS = int(os.environ.get('QUEUE_SLEEP_SECONDS', '5'))
+CLIENT_STATS_LOG_SECONDS = int(os.environ.get('CLIENT_STATS_LOG_SECONDS', '300'))
+
+
+async def log_client_stats(appManager: AppManager) -> None:
+    while True:
+        await asyncio.sleep(CLIENT_STATS_LOG_SECONDS)
+        appManager.log_client_stats()
+
+
+async def main() -> None:
+    logging.info(f'[REBALANCE_EXECUTOR] Starting rebalance executor with {AGENT_REBALANCE_CONCURRENCY} consumers')
+    appManager = create_app_manager()
+    await appManager.database.connect()
+    rebalanceQueue = create_rebalance_queue(database=appManager.database)
+    await rebalanceQueue.connect()
+    await appManager.warm_up()
+    messageProcessor = RebalanceMessageProcessor(appManager=appManager, rebalanceTimeoutSeconds=AGENT_REBALANCE_TIMEOUT_SECONDS)
+    # The message stays invisible for a little longer than a rebalance may take, so a crashed executor's message is retried
+    expectedProcessingSeconds = int(AGENT_REBALANCE_TIMEOUT_SECONDS) + 60
+    try:
+        await asyncio.gather(
+            *[
+                MessageQueueProcessor(queue=rebalanceQueue, messageProcessor=messageProcessor, notificationClients=[]).run(expectedProcessingSeconds=expectedProcessingSeconds, sleepTime=QUEUE_SLEEP_SECONDS)  # type: ignore[arg-type]
+                for _ in range(AGENT_REBALANCE_CONCURRENCY)
+            ],
+            log_client_stats(appManager=appManager),
+        )
+    finally:
+        await rebalanceQueue.disconnect()
+        await appManager.database.disconnect()
+        await appManager.requester.close_connections()
+        await appManager.strategyManager.uniswapClient.ampClient.close_connections()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
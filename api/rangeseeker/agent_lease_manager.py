@@ -0,0 +1,105 @@
+import math
+import uuid
+
+import sqlalchemy
+from core import logging
+from core.store.database import Database
+from core.store.database import DatabaseConnection
+from core.util import date_util
+from sqlalchemy.dialects import postgresql as sqlalchemy_psql
+
+from rangeseeker.store import schema
+
+
+class AgentLeaseManager:
+    # Splits agents between worker processes. Every live worker (one with a recent heartbeat) aims to hold
+    # ceil(agents / live workers) leases, claiming unowned or expired ones with FOR UPDATE SKIP LOCKED so that
+    # concurrent workers never claim the same agent, and releasing any it holds above its share.
+    def __init__(self, database: Database, workerId: str, leaseSeconds: int) -> None:
+        self.database = database
+        self.workerId = workerId
+        self.leaseSeconds = leaseSeconds
+
+    async def heartbeat(self) -> None:
+        await schema.WorkerHeartbeatsRepository.upsert(
+            database=self.database,
+            constraintColumnNames=[schema.WorkerHeartbeatsTable.c.workerId.key],
+            workerId=self.workerId,
+            heartbeatDate=date_util.datetime_from_now(),
+        )
+
+    async def _create_missing_leases(self, connection: DatabaseConnection) -> None:
+        query = sqlalchemy.select(schema.AgentsTable.c.agentId).where(
+            ~sqlalchemy.exists().where(schema.AgentLeasesTable.c.agentId == schema.AgentsTable.c.agentId),
+        )
+        result = await self.database.execute(query=query, connection=connection)
+        agentIds = [agentId for (agentId,) in result]
+        if len(agentIds) == 0:
+            return
+        currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+        insertQuery = sqlalchemy_psql.insert(schema.AgentLeasesTable).values(
+            [
+                {
+                    schema.AgentLeasesTable.c.agentLeaseId.key: uuid.uuid4(),
+                    schema.AgentLeasesTable.c.createdDate.key: currentDate,
+                    schema.AgentLeasesTable.c.updatedDate.key: currentDate,
+                    schema.AgentLeasesTable.c.agentId.key: agentId,
+                }
+                for agentId in agentIds
+            ]
+        )
+        await self.database.execute(query=insertQuery.on_conflict_do_nothing(index_elements=[schema.AgentLeasesTable.c.agentId]), connection=connection)  # type: ignore[arg-type]
+
+    async def claim_agent_leases(self) -> set[str]:
+        leasesTable = schema.AgentLeasesTable
+        async with self.database.create_transaction() as connection:
+            await self._create_missing_leases(connection=connection)
+            currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+            expiryDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now(seconds=self.leaseSeconds))
+            liveWorkerDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now(seconds=-self.leaseSeconds))
+            liveWorkerCountQuery = sqlalchemy.select(sqlalchemy.func.count()).select_from(schema.WorkerHeartbeatsTable).where(schema.WorkerHeartbeatsTable.c.heartbeatDate > liveWorkerDate)
+            liveWorkerCount = (await self.database.execute(query=liveWorkerCountQuery, connection=connection)).scalar_one()
+            leaseCountQuery = sqlalchemy.select(sqlalchemy.func.count()).select_from(leasesTable)
+            leaseCount = (await self.database.execute(query=leaseCountQuery, connection=connection)).scalar_one()
+            targetLeaseCount = math.ceil(leaseCount / max(liveWorkerCount, 1))
+            heldQuery = (
+                sqlalchemy.select(leasesTable.c.agentId)
+                .where(leasesTable.c.workerId == self.workerId)
+                .where(leasesTable.c.expiryDate > currentDate)
+                .order_by(leasesTable.c.agentId)
+                .with_for_update()
+            )
+            heldAgentIds = [agentId for (agentId,) in await self.database.execute(query=heldQuery, connection=connection)]
+            if len(heldAgentIds) > targetLeaseCount:
+                releasedAgentIds = heldAgentIds[targetLeaseCount:]
+                heldAgentIds = heldAgentIds[:targetLeaseCount]
+                releaseQuery = leasesTable.update().where(leasesTable.c.agentId.in_(releasedAgentIds)).values({leasesTable.c.workerId: None, leasesTable.c.expiryDate: None, leasesTable.c.updatedDate: currentDate})
+                await self.database.execute(query=releaseQuery, connection=connection)  # type: ignore[arg-type]
+                logging.info(f'[AGENT_LEASE] Worker {self.workerId} released {len(releasedAgentIds)} leases')
+            elif len(heldAgentIds) < targetLeaseCount:
+                claimQuery = (
+                    sqlalchemy.select(leasesTable.c.agentId)
+                    .where(sqlalchemy.or_(leasesTable.c.workerId.is_(None), leasesTable.c.expiryDate.is_(None), leasesTable.c.expiryDate <= currentDate))
+                    .order_by(leasesTable.c.expiryDate.asc().nulls_first())
+                    .limit(targetLeaseCount - len(heldAgentIds))
+                    .with_for_update(skip_locked=True)
+                )
+                claimedAgentIds = [agentId for (agentId,) in await self.database.execute(query=claimQuery, connection=connection)]
+                heldAgentIds += claimedAgentIds
+                if len(claimedAgentIds) > 0:
+                    logging.info(f'[AGENT_LEASE] Worker {self.workerId} claimed {len(claimedAgentIds)} leases')
+            if len(heldAgentIds) > 0:
+                renewQuery = leasesTable.update().where(leasesTable.c.agentId.in_(heldAgentIds)).values({leasesTable.c.workerId: self.workerId, leasesTable.c.expiryDate: expiryDate, leasesTable.c.updatedDate: currentDate})
+                await self.database.execute(query=renewQuery, connection=connection)  # type: ignore[arg-type]
+        logging.info(f'[AGENT_LEASE] Worker {self.workerId} holds {len(heldAgentIds)} of {leaseCount} leases across {liveWorkerCount} live workers')
+        return {str(agentId) for agentId in heldAgentIds}
+
+    async def release_agent_leases(self) -> None:
+        leasesTable = schema.AgentLeasesTable
+        currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+        async with self.database.create_transaction() as connection:
+            releaseQuery = leasesTable.update().where(leasesTable.c.workerId == self.workerId).values({leasesTable.c.workerId: None, leasesTable.c.expiryDate: None, leasesTable.c.updatedDate: currentDate})
+            await self.database.execute(query=releaseQuery, connection=connection)  # type: ignore[arg-type]
+            deleteQuery = schema.WorkerHeartbeatsTable.delete().where(schema.WorkerHeartbeatsTable.c.workerId == self.workerId)
+            await self.database.execute(query=deleteQuery, connection=connection)  # type: ignore[arg-type]
+        logging.info(f'[AGENT_LEASE] Worker {self.workerId} released all leases')
@@ -145,6 +145,9 @@ class UniswapPosition(BaseModel):
     token0ValueUsd: float
     token1ValueUsd: float
     totalValueUsd: float
+    token0UncollectedFees: int = 0
+    token1UncollectedFees: int = 0
+    uncollectedFeesValueUsd: float = 0.0
 
 
 class Wallet(BaseModel):
@@ -3,7 +3,6 @@ import base64
 import datetime
 import math
 import typing
-from typing import cast
 
 from core import logging
 from core.caching.dict_cache import DictCache
@@ -11,14 +10,16 @@ from core.exceptions import ForbiddenException
 from core.exceptions import KibaException
 from core.exceptions import NotFoundException
 from core.exceptions import UnauthorizedException
+from core.requester import Requester
 from core.store.database import Database
 from core.util import chain_util
-from core.util.typing_util import JsonObject
 from core.web3.eth_client import RestEthClient
 from eth_account.messages import encode_defunct
 from siwe import SiweMessage  # type: ignore[import-untyped]
 from web3.types import HexStr
+from web3.types import Nonce
 from web3.types import TxParams
+from web3.types import TxReceipt
 from web3.types import Wei
 
 from rangeseeker import constants
@@ -28,9 +29,13 @@ from rangeseeker.api.v1_resources import PoolData
 from rangeseeker.api.v1_resources import PoolHistoricalData
 from rangeseeker.api.v1_resources import PricePoint
 from rangeseeker.erc_abis import ERC20_ABI
+from rangeseeker.external.batching_eth_client import BatchingRestEthClient
+from rangeseeker.external.multicall_client import MulticallClient
 from rangeseeker.external.pyth_client import PythClient
+from rangeseeker.external.uniswap_data_client import PositionRange
 from rangeseeker.external.zerox_client import ZeroxClient
 from rangeseeker.model import Agent
+from rangeseeker.model import AgentPosition
 from rangeseeker.model import Asset
 from rangeseeker.model import AssetBalance
 from rangeseeker.model import AssetPrice
@@ -40,36 +45,88 @@ from rangeseeker.model import UniswapPosition
 from rangeseeker.model import User
 from rangeseeker.model import UserWallet
 from rangeseeker.model import Wallet
+from rangeseeker.model import WalletSnapshot
+from rangeseeker.nonce_manager import NonceManager
+from rangeseeker.position_index import DEFAULT_EDGE_BAND_FRACTION
+from rangeseeker.position_index import IndexedPosition
+from rangeseeker.position_index import PositionTickIndex
+from rangeseeker.position_ownership_manager import OWNERSHIP_MAX_CURSOR_LAG_BLOCKS
+from rangeseeker.position_ownership_manager import PositionOwnershipManager
+from rangeseeker.strategy_compiler import ACTION_NONE
+from rangeseeker.strategy_compiler import AgentStrategyInput
+from rangeseeker.strategy_compiler import MarketSnapshot
+from rangeseeker.strategy_compiler import StrategyBatchEvaluator
 from rangeseeker.strategy_manager import StrategyManager
 from rangeseeker.strategy_parser import StrategyDefinition
-from rangeseeker.uniswap_abis import UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI
+from rangeseeker.uniswap_abis import UNISWAP_V3_COLLECT_SELECTOR
+from rangeseeker.uniswap_abis import UNISWAP_V3_INCREASE_LIQUIDITY_EVENT_TOPIC
+from rangeseeker.uniswap_abis import UNISWAP_V3_POSITION_MANAGER_MULTICALL_ABI
 from rangeseeker.user_manager import UserManager
 
 PYTH_ETH_USD_PRICE_ID = '0xff61491a931112ddf1bd8147cd1b641375f79f5825126d665480874634fd0ace'
 PYTH_USDC_USD_PRICE_ID = '0xeaa020c61cc479712813461ce153894a96a6c00b21ed0cfc2798d1f9a9e9c94a'
 MIN_WETH_DIFF = 0.0001
 MIN_USDC_DIFF = 0.01
+MAX_UINT256 = 2**256 - 1
+# Fixed gas limits for transactions broadcast before the ones they depend on are mined, when estimating would revert or undercount
+MINT_GAS_LIMIT = 600_000
+WITHDRAW_GAS_LIMIT_PER_POSITION = 250_000
+# Share of the expected balances a single transaction exit-and-remint asks the mint for
+REMINT_DESIRED_AMOUNT_FRACTION = 0.995
+# Strategies react to the 24h realized volatility, which barely moves between worker cycles
+VOLATILITY_CACHE_SECONDS = 60 * 5
+# Base produces a block every 2 seconds, so a polled wallet is at most ~10 seconds behind the chain
+WALLET_SNAPSHOT_MAX_BLOCK_AGE = 5
 
 
 class AppManager(Authorizer):
     def __init__(
         self,
         database: Database,
+        requester: Requester,
         userManager: UserManager,
         strategyManager: StrategyManager,
         pythClient: PythClient,
         ethClient: RestEthClient,
         zeroxClient: ZeroxClient,
+        positionIndex: PositionTickIndex,
+        nonceManager: NonceManager,
+        multicallClient: MulticallClient,
+        positionOwnershipManager: PositionOwnershipManager,
     ) -> None:
         self.database = database
+        self.requester = requester
         self.userManager = userManager
         self.strategyManager = strategyManager
         self.pythClient = pythClient
         self.ethClient = ethClient
         self.zeroxClient = zeroxClient
+        self.positionIndex = positionIndex
+        self.nonceManager = nonceManager
+        self.multicallClient = multicallClient
+        self.positionOwnershipManager = positionOwnershipManager
         self._signatureSignerMap: dict[str, str] = {}
         self._poolDataCache = DictCache()
         self._poolHistoricalDataCache = DictCache()
+        self._volatilityCache = DictCache()
+        # Approvals that have been broadcast but not mined, by hash, as (walletAddress, assetAddress, spenderAddress)
+        self._pendingApprovals: dict[str, tuple[str, str, str]] = {}
+        self._walletSnapshots: dict[str, WalletSnapshot] = {}
+        self._positionIndexWatermark: tuple[int, datetime.datetime | None] | None = None
+
+    async def warm_up(self) -> None:
+        # Opens the upstream connections and fills the client caches so the first requests or worker cycle don't pay for them
+        await asyncio.gather(
+            self.strategyManager.uniswapClient.warm_up(tokenPairs=[(constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID], constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID])]),
+            self.pythClient.warm_up(priceIds=[PYTH_ETH_USD_PRICE_ID, PYTH_USDC_USD_PRICE_ID]),
+        )
+
+    def log_client_stats(self) -> None:
+        singleFlights = [self.pythClient.singleFlight, self.strategyManager.uniswapClient.ampClient.singleFlight]
+        if isinstance(self.ethClient, BatchingRestEthClient):
+            singleFlights.append(self.ethClient.singleFlight)
+        for singleFlight in singleFlights:
+            singleFlight.log_stats()
 
     async def _retrieve_signature_signer_address(self, signatureString: str) -> str:
         if signatureString in self._signatureSignerMap:
@@ -136,16 +193,31 @@ class AppManager(Authorizer):
 
     async def get_agent_wallet(self, userId: str, agentId: str) -> Wallet:
         agentWallet = await self.userManager.get_agent_wallet(userId=userId, agentId=agentId)
+        walletAddress = chain_util.normalize_address(value=agentWallet.walletAddress)
+        latestBlockNumber, agentPositions = await asyncio.gather(
+            self.ethClient.get_latest_block_number(),
+            self.userManager.list_agent_positions(agentId=agentWallet.agentId),
+        )
+        # Rebalances run in the executor too, so a changed set of positions also means the snapshot is out of date
+        positionTokenIds = sorted(agentPosition.tokenId for agentPosition in agentPositions)
+        walletSnapshot = self._walletSnapshots.get(walletAddress)
+        if walletSnapshot is not None and walletSnapshot.positionTokenIds == positionTokenIds and latestBlockNumber - walletSnapshot.blockNumber <= WALLET_SNAPSHOT_MAX_BLOCK_AGE:
+            return walletSnapshot.wallet
         assetBalances, uniswapPositions = await asyncio.gather(
             self.get_wallet_balances(chainId=8453, walletAddress=agentWallet.walletAddress),
-            self.get_wallet_uniswap_positions(walletAddress=agentWallet.walletAddress),
+            self.get_agent_uniswap_positions(agentId=agentWallet.agentId),
         )
-        return Wallet(
+        wallet = Wallet(
             walletAddress=agentWallet.walletAddress,
             assetBalances=assetBalances,
             uniswapPositions=uniswapPositions,
             delegatedSmartWallet=agentWallet.delegatedSmartWallet,
         )
+        self._walletSnapshots[walletAddress] = WalletSnapshot(blockNumber=latestBlockNumber, positionTokenIds=positionTokenIds, wallet=wallet)
+        return wallet
+
+    def invalidate_wallet_snapshot(self, walletAddress: str) -> None:
+        self._walletSnapshots.pop(chain_util.normalize_address(value=walletAddress), None)
 
     async def get_wallet_balances(self, chainId: int, walletAddress: str) -> list[AssetBalance]:
         clientBalances = await self.userManager.coinbaseCdpClient.get_wallet_asset_balances(chainId=chainId, walletAddress=walletAddress)
@@ -181,71 +253,212 @@ class AppManager(Authorizer):
             assetBalances.append(AssetBalance(asset=asset, assetPrice=assetPrice, balance=clientBalance.balance))
         return assetBalances
 
-    async def get_wallet_uniswap_positions(self, walletAddress: str) -> list[UniswapPosition]:
-        positions = await self.strategyManager.uniswapClient.get_wallet_positions(walletAddress=walletAddress)
+    def _build_uniswap_position(self, tokenId: int, poolAddress: str, tickLower: int, tickUpper: int, amount0: int, amount1: int, uncollectedFees0: int, uncollectedFees1: int, ethPriceUsd: float, usdcPriceUsd: float) -> UniswapPosition:
+        # For now, hardcode WETH/USDC since that's what we're using
+        # TODO(krishan): Fetch token details from on-chain or TheGraph
+        token0 = Asset(
+            assetId=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
+            createdDate=datetime.datetime.now(tz=datetime.UTC),
+            updatedDate=datetime.datetime.now(tz=datetime.UTC),
+            chainId=constants.BASE_CHAIN_ID,
+            address=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
+            name='Wrapped Ether',
+            symbol='WETH',
+            decimals=18,
+        )
+        token1 = Asset(
+            assetId=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
+            createdDate=datetime.datetime.now(tz=datetime.UTC),
+            updatedDate=datetime.datetime.now(tz=datetime.UTC),
+            chainId=constants.BASE_CHAIN_ID,
+            address=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
+            name='USD Coin',
+            symbol='USDC',
+            decimals=6,
+        )
+
+        # Calculate USD values
+        token0ValueUsd = (amount0 / 10**18) * ethPriceUsd
+        token1ValueUsd = (amount1 / 10**6) * usdcPriceUsd
+        totalValueUsd = token0ValueUsd + token1ValueUsd
+        uncollectedFeesValueUsd = (uncollectedFees0 / 10**18) * ethPriceUsd + (uncollectedFees1 / 10**6) * usdcPriceUsd
+        return UniswapPosition(
+            tokenId=tokenId,
+            poolAddress=poolAddress,
+            token0=token0,
+            token1=token1,
+            token0Amount=amount0,
+            token1Amount=amount1,
+            token0ValueUsd=token0ValueUsd,
+            token1ValueUsd=token1ValueUsd,
+            totalValueUsd=totalValueUsd,
+            token0UncollectedFees=uncollectedFees0,
+            token1UncollectedFees=uncollectedFees1,
+            uncollectedFeesValueUsd=uncollectedFeesValueUsd,
+            tickLower=tickLower,
+            tickUpper=tickUpper,
+        )
+
+    async def get_wallet_uniswap_positions(self, walletAddress: str, maxLagBlocks: int = OWNERSHIP_MAX_CURSOR_LAG_BLOCKS) -> list[UniswapPosition]:
+        # Reconstructs positions from chain data, only needed when the agent positions table can't be trusted (e.g. before a withdrawal)
+        tokenIds = await self.positionOwnershipManager.get_owned_token_ids(walletAddress=walletAddress, maxLagBlocks=maxLagBlocks)
+        positions = await self.strategyManager.uniswapClient.get_wallet_positions(walletAddress=walletAddress, tokenIds=tokenIds)
         prices = await self.pythClient.get_prices(priceIds=[PYTH_ETH_USD_PRICE_ID, PYTH_USDC_USD_PRICE_ID])
         ethPriceUsd = prices.get(PYTH_ETH_USD_PRICE_ID, 0.0)
         usdcPriceUsd = prices.get(PYTH_USDC_USD_PRICE_ID, 0.0)
-        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[constants.BASE_CHAIN_ID]
-        uniswapPositions = []
-        for position in positions:
-            # Fetch tick information from position manager contract
-            positionData = await self.ethClient.call_function_by_name(
-                toAddress=positionManagerAddress,
-                contractAbi=UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI,
-                functionName='positions',
-                fromAddress=walletAddress,
-                arguments={'tokenId': position.tokenId},
+        return [
+            self._build_uniswap_position(
+                tokenId=position.tokenId,
+                poolAddress=position.poolAddress,
+                tickLower=position.tickLower,
+                tickUpper=position.tickUpper,
+                amount0=position.amount0,
+                amount1=position.amount1,
+                uncollectedFees0=position.uncollectedFees0,
+                uncollectedFees1=position.uncollectedFees1,
+                ethPriceUsd=ethPriceUsd,
+                usdcPriceUsd=usdcPriceUsd,
             )
-            # positionData returns: [nonce, operator, token0, token1, fee, tickLower, tickUpper, liquidity, ...]
-            tickLower = int(positionData[5])
-            tickUpper = int(positionData[6])
-
-            # For now, hardcode WETH/USDC since that's what we're using
-            # TODO(krishan): Fetch token details from on-chain or TheGraph
-            token0 = Asset(
-                assetId=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
-                createdDate=datetime.datetime.now(tz=datetime.UTC),
-                updatedDate=datetime.datetime.now(tz=datetime.UTC),
-                chainId=constants.BASE_CHAIN_ID,
-                address=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
-                name='Wrapped Ether',
-                symbol='WETH',
-                decimals=18,
-            )
-            token1 = Asset(
-                assetId=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
-                createdDate=datetime.datetime.now(tz=datetime.UTC),
-                updatedDate=datetime.datetime.now(tz=datetime.UTC),
-                chainId=constants.BASE_CHAIN_ID,
-                address=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
-                name='USD Coin',
-                symbol='USDC',
-                decimals=6,
+            for position in positions
+        ]
+
+    async def get_agent_uniswap_positions(self, agentId: str) -> list[UniswapPosition]:
+        agentPositions = await self.userManager.list_agent_positions(agentId=agentId)
+        if len(agentPositions) == 0:
+            return []
+        positionRanges = [PositionRange(tokenId=agentPosition.tokenId, poolAddress=agentPosition.poolAddress, tickLower=agentPosition.tickLower, tickUpper=agentPosition.tickUpper) for agentPosition in agentPositions]
+        prices, positionValues = await asyncio.gather(
+            self.pythClient.get_prices(priceIds=[PYTH_ETH_USD_PRICE_ID, PYTH_USDC_USD_PRICE_ID]),
+            self.strategyManager.uniswapClient.get_position_values(positionRanges=positionRanges),
+        )
+        ethPriceUsd = prices.get(PYTH_ETH_USD_PRICE_ID, 0.0)
+        usdcPriceUsd = prices.get(PYTH_USDC_USD_PRICE_ID, 0.0)
+        return [
+            self._build_uniswap_position(
+                tokenId=agentPosition.tokenId,
+                poolAddress=agentPosition.poolAddress,
+                tickLower=agentPosition.tickLower,
+                tickUpper=agentPosition.tickUpper,
+                amount0=positionValue.amount0,
+                amount1=positionValue.amount1,
+                uncollectedFees0=positionValue.uncollectedFees0,
+                uncollectedFees1=positionValue.uncollectedFees1,
+                ethPriceUsd=ethPriceUsd,
+                usdcPriceUsd=usdcPriceUsd,
             )
+            for agentPosition, positionValue in zip(agentPositions, positionValues, strict=True)
+        ]
 
-            # Calculate USD values
-            token0ValueUsd = (position.amount0 / 10**18) * ethPriceUsd
-            token1ValueUsd = (position.amount1 / 10**6) * usdcPriceUsd
-            totalValueUsd = token0ValueUsd + token1ValueUsd
-
-            uniswapPositions.append(
-                UniswapPosition(
-                    tokenId=position.tokenId,
-                    poolAddress=position.poolAddress or '',
-                    token0=token0,
-                    token1=token1,
-                    token0Amount=position.amount0,
-                    token1Amount=position.amount1,
-                    token0ValueUsd=token0ValueUsd,
-                    token1ValueUsd=token1ValueUsd,
-                    totalValueUsd=totalValueUsd,
-                    tickLower=tickLower,
-                    tickUpper=tickUpper,
-                )
+    @staticmethod
+    def _indexed_position_from_agent_position(agentPosition: AgentPosition, edgeBandFraction: float) -> IndexedPosition:
+        return IndexedPosition(
+            agentId=agentPosition.agentId,
+            tokenId=agentPosition.tokenId,
+            poolAddress=agentPosition.poolAddress,
+            tickLower=agentPosition.tickLower,
+            tickUpper=agentPosition.tickUpper,
+            edgeBandFraction=edgeBandFraction,
+        )
+
+    async def _get_agent_edge_band_fraction(self, agentId: str) -> float:
+        agent = await self.userManager.get_agent_raw(agentId=agentId)
+        compiledStrategy = await self.strategyManager.get_compiled_strategy(strategyId=agent.strategyId)
+        return compiledStrategy.rangeRule.rebalanceBuffer
+
+    async def index_agent_positions(self, agentId: str) -> None:
+        agentPositions = await self.userManager.list_agent_positions(agentId=agentId)
+        edgeBandFraction = await self._get_agent_edge_band_fraction(agentId=agentId)
+        self.positionIndex.set_agent_positions(agentId=agentId, positions=[self._indexed_position_from_agent_position(agentPosition=agentPosition, edgeBandFraction=edgeBandFraction) for agentPosition in agentPositions])
+
+    async def rebuild_position_index(self) -> None:
+        # The watermark is read first so a change made while rebuilding is picked up by the next refresh
+        self._positionIndexWatermark = await self.userManager.get_agent_positions_watermark()
+        agentPositions = await self.userManager.list_all_agent_positions()
+        agents = await self.userManager.list_all_agents()
+        compiledStrategies = await self.strategyManager.get_compiled_strategies(strategyIds=[agent.strategyId for agent in agents])
+        # Each position's edge band is its strategy's rebalanceBuffer so the index flags the same positions the strategy evaluation does
+        agentEdgeBandFractions = {agent.agentId: compiledStrategies[agent.strategyId].rangeRule.rebalanceBuffer for agent in agents if agent.strategyId in compiledStrategies}
+        agentIndexedPositions: dict[str, list[IndexedPosition]] = {}
+        for agentPosition in agentPositions:
+            edgeBandFraction = agentEdgeBandFractions.get(agentPosition.agentId, DEFAULT_EDGE_BAND_FRACTION)
+            agentIndexedPositions.setdefault(agentPosition.agentId, []).append(self._indexed_position_from_agent_position(agentPosition=agentPosition, edgeBandFraction=edgeBandFraction))
+        self.positionIndex.clear()
+        for agentId, indexedPositions in agentIndexedPositions.items():
+            self.positionIndex.set_agent_positions(agentId=agentId, positions=indexedPositions)
+        logging.info(f'[POSITION_INDEX] Indexed {len(agentPositions)} positions for {len(agentIndexedPositions)} agents')
+
+    async def refresh_position_index(self) -> None:
+        # Positions are minted and burned by the executor, a cheap watermark query tells the worker when its index needs rebuilding
+        positionIndexWatermark = await self.userManager.get_agent_positions_watermark()
+        if positionIndexWatermark != self._positionIndexWatermark:
+            await self.rebuild_position_index()
+
+    async def _get_pool_volatility(self, poolAddress: str) -> float:
+        cacheKey = f'volatility-{poolAddress}'
+        cachedVolatility = await self._volatilityCache.get(key=cacheKey)
+        if cachedVolatility is not None:
+            return float(cachedVolatility)
+        volatilityData = await self.strategyManager.uniswapClient.get_pool_volatility(poolAddress=poolAddress, hoursBack=24)
+        await self._volatilityCache.set(key=cacheKey, value=str(volatilityData.realized), expirySeconds=VOLATILITY_CACHE_SECONDS)
+        return volatilityData.realized
+
+    async def get_market_snapshot(self) -> MarketSnapshot:
+        pool = await self.strategyManager.uniswapClient.get_pool(
+            token0Address=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
+            token1Address=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
+            feeTier=500,
+        )
+        prices, volatility = await asyncio.gather(
+            self.pythClient.get_prices(priceIds=[PYTH_ETH_USD_PRICE_ID]),
+            self._get_pool_volatility(poolAddress=pool.address),
+        )
+        return MarketSnapshot(priceUsd=prices.get(PYTH_ETH_USD_PRICE_ID, 0.0), tick=pool.tick, volatility=volatility)
+
+    async def evaluate_agent_strategies(self, agents: list[Agent], snapshot: MarketSnapshot) -> dict[str, str]:
+        # Evaluates every agent's strategy against the same snapshot using the positions in the index, returning only the agents with something to do
+        compiledStrategies = await self.strategyManager.get_compiled_strategies(strategyIds=[agent.strategyId for agent in agents])
+        agentInputs = [
+            AgentStrategyInput(
+                agentId=agent.agentId,
+                compiledStrategy=compiledStrategies[agent.strategyId],
+                positionTicks=[(position.tickLower, position.tickUpper) for position in self.positionIndex.get_agent_positions(agentId=agent.agentId)],
             )
+            for agent in agents
+            if agent.strategyId in compiledStrategies
+        ]
+        return StrategyBatchEvaluator(agentInputs=agentInputs).evaluate(snapshot=snapshot)
+
+    async def get_agent_action(self, agent: Agent, snapshot: MarketSnapshot) -> str:
+        # Reloads the agent's positions first as this process's index may not have seen its latest mint or withdrawal
+        await self.index_agent_positions(agentId=agent.agentId)
+        agentActions = await self.evaluate_agent_strategies(agents=[agent], snapshot=snapshot)
+        action = agentActions.get(agent.agentId, ACTION_NONE)
+        logging.info(f'[STRATEGY] Agent {agent.agentId} action is {action} at tick {snapshot.tick}, price {snapshot.priceUsd:.2f}, volatility {snapshot.volatility:.4f}')
+        return action
 
-        return uniswapPositions
+    async def sync_agent_positions_from_chain(self, agentId: str, walletAddress: str) -> list[AgentPosition]:
+        # Rebuilds the agent's rows in the positions table from chain data, used to backfill positions minted outside of _deposit_to_uniswap_v3
+        tokenIds = await self.positionOwnershipManager.get_owned_token_ids(walletAddress=walletAddress, maxLagBlocks=0)
+        positions = await self.strategyManager.uniswapClient.get_wallet_positions(walletAddress=walletAddress, tokenIds=tokenIds)
+        agentPositions = []
+        for position in positions:
+            agentPosition = await self.userManager.upsert_agent_position(
+                agentId=agentId,
+                walletAddress=walletAddress,
+                tokenId=position.tokenId,
+                poolAddress=position.poolAddress,
+                tickLower=position.tickLower,
+                tickUpper=position.tickUpper,
+                liquidity=position.liquidity,
+                mintBlockNumber=None,
+            )
+            agentPositions.append(agentPosition)
+        syncedTokenIds = {agentPosition.tokenId for agentPosition in agentPositions}
+        for agentPosition in await self.userManager.list_agent_positions(agentId=agentId):
+            if agentPosition.tokenId not in syncedTokenIds:
+                await self.userManager.delete_agent_position(tokenId=agentPosition.tokenId)
+        await self.index_agent_positions(agentId=agentId)
+        return agentPositions
 
     async def parse_strategy(self, description: str) -> StrategyDefinition:
         return await self.strategyManager.parse_strategy(description=description)
@@ -259,22 +472,19 @@ class AppManager(Authorizer):
             return PoolData.model_validate_json(cachedData)
         pool = await self.strategyManager.uniswapClient.get_pool(token0Address=token0Address, token1Address=token1Address)
         poolAddress = pool.address
-        currentPrice = await self.strategyManager.uniswapClient.get_current_price(poolAddress=poolAddress)
-        volatilityData24h = await self.strategyManager.uniswapClient.get_pool_volatility(poolAddress=poolAddress, hoursBack=24)
-        volatilityData7d = await self.strategyManager.uniswapClient.get_pool_volatility(poolAddress=poolAddress, hoursBack=168)
-        feeGrowth7d = await self.strategyManager.uniswapClient.get_pool_fee_growth(poolAddress=poolAddress, hoursBack=168)
+        poolAnalytics = await self.strategyManager.uniswapClient.get_pool_analytics(poolAddress=poolAddress)
         feeRate = pool.fee / 1_000_000.0
         poolData = PoolData(
             chainId=chainId,
             token0Address=token0Address,
             token1Address=token1Address,
             poolAddress=poolAddress,
-            currentPrice=currentPrice,
-            volatility24h=volatilityData24h.realized,
-            volatility7d=volatilityData7d.realized,
-            volatilityAnnualized=volatilityData24h.annualized,
-            volatilityRealized=volatilityData24h.realized,
-            feeGrowth7d=feeGrowth7d,
+            currentPrice=poolAnalytics.currentPrice,
+            volatility24h=poolAnalytics.volatility24h.realized,
+            volatility7d=poolAnalytics.volatility7d.realized,
+            volatilityAnnualized=poolAnalytics.volatility24h.annualized,
+            volatilityRealized=poolAnalytics.volatility24h.realized,
+            feeGrowth7d=poolAnalytics.feeGrowth7d,
             feeRate=feeRate,
         )
         await self._poolDataCache.set(key=cacheKey, value=poolData.model_dump_json(), expirySeconds=60 * 10)
@@ -289,16 +499,9 @@ class AppManager(Authorizer):
             return PoolHistoricalData.model_validate_json(cachedData)
         pool = await self.strategyManager.uniswapClient.get_pool(token0Address=token0Address, token1Address=token1Address)
         poolAddress = pool.address
-        swaps = await self.strategyManager.uniswapClient.get_pool_swaps(poolAddress=poolAddress, hoursBack=hoursBack)
-        pricePoints = []
-        for swap in swaps:
-            price = self.strategyManager.uniswapClient.calculate_price_from_sqrt_price_x96(swap.sqrtPriceX96)
-            pricePoints.append(
-                PricePoint(
-                    timestamp=swap.timestamp,
-                    price=price,
-                )
-            )
+        priceHistory = await self.strategyManager.uniswapClient.get_pool_price_history(poolAddress=poolAddress, hoursBack=hoursBack)
+        # Newest first, as the api has always returned them
+        pricePoints = [PricePoint(timestamp=timestamp, price=price) for timestamp, price in zip(reversed(priceHistory.column('timestamp').to_pylist()), reversed(priceHistory.column('price').to_pylist()), strict=True)]
         poolHistoricalData = PoolHistoricalData(
             chainId=chainId,
             token0Address=token0Address,
@@ -309,66 +512,108 @@ class AppManager(Authorizer):
         await self._poolHistoricalDataCache.set(key=cacheKey, value=poolHistoricalData.model_dump_json(), expirySeconds=60 * 10)
         return poolHistoricalData
 
-    async def _get_erc20_allowance(self, chainId: int, assetAddress: str, walletAddress: str, spenderAddress: str) -> int:  # noqa: ARG002
-        currentAllowanceResponse = await self.ethClient.call_function_by_name(
-            toAddress=assetAddress,
-            contractAbi=ERC20_ABI,
-            functionName='allowance',
-            fromAddress=walletAddress,
-            arguments={
-                'owner': walletAddress,
-                'spender': spenderAddress,
-            },
-        )
-        return int(currentAllowanceResponse[0])
-
-    async def _approve_token_if_needed(self, chainId: int, walletAddress: str, assetAddress: str, spenderAddress: str, amount: int) -> None:
-        currentAllowance = await self._get_erc20_allowance(
-            chainId=chainId,
-            assetAddress=assetAddress,
-            walletAddress=walletAddress,
-            spenderAddress=spenderAddress,
-        )
-        logging.info(f'[APPROVE] Current allowance for {assetAddress} -> {spenderAddress}: {currentAllowance}')
-        if currentAllowance < amount:
-            logging.info(f'[APPROVE] Insufficient allowance ({currentAllowance} < {amount}). Approving for max amount')
-            maxUint256 = 2**256 - 1
-            transactionDict: TxParams = {
-                'from': chain_util.normalize_address(value=walletAddress),
-                'to': chain_util.normalize_address(value=assetAddress),
-                'value': Wei(0),
-                'data': chain_util.encode_transaction_data_by_name(
-                    contractAbi=ERC20_ABI,
-                    functionName='approve',
-                    arguments={
-                        'spender': spenderAddress,
-                        'amount': maxUint256,
-                    },
-                ),
-            }
+    async def _send_transaction(self, chainId: int, walletAddress: str, transactionDict: TxParams, gas: int | None = None) -> str:
+        # Broadcasts without waiting to be mined, the nonce comes from the nonce manager so several can be in flight at once
+        nonce = await self.nonceManager.reserve_nonce(walletAddress=walletAddress)
+        try:
             filledTransaction = await self.ethClient.fill_transaction_params(
                 params=transactionDict,
                 fromAddress=walletAddress,
+                gas=gas,
                 chainId=chainId,
             )
+            # fill_transaction_params uses the mined transaction count, which is behind while earlier transactions are pending
+            filledTransaction['nonce'] = Nonce(nonce)
             signedTx = await self.userManager.coinbaseCdpClient.sign_transaction(
                 walletAddress=walletAddress,
                 transactionDict=filledTransaction,
             )
-            txHash = await self.ethClient.send_raw_transaction(transactionData=signedTx)
-            logging.info(f'[APPROVE] Approval transaction broadcast: {txHash}')
-            receipt = await self.ethClient.wait_for_transaction_receipt(transactionHash=txHash)
-            logging.info(f'[APPROVE] Approval mined in block {receipt["blockNumber"]}')
-            await asyncio.sleep(3)
-            newAllowance = await self._get_erc20_allowance(
-                chainId=chainId,
-                assetAddress=assetAddress,
-                walletAddress=walletAddress,
-                spenderAddress=spenderAddress,
-            )
-            logging.info(f'[APPROVE] New allowance after approval: {newAllowance}')
-        else:
-            logging.info(f'[APPROVE] Allowance already sufficient ({currentAllowance} >= {amount})')
+            return await self.ethClient.send_raw_transaction(transactionData=signedTx)
+        except Exception:
+            self.nonceManager.reset(walletAddress=walletAddress)
+            raise
+
+    async def _wait_for_transactions(self, walletAddress: str, transactionHashes: list[str]) -> list[TxReceipt]:
+        try:
+            receipts = list(await asyncio.gather(*[self.ethClient.wait_for_transaction_receipt(transactionHash=transactionHash) for transactionHash in transactionHashes]))
+        except Exception:
+            for transactionHash in transactionHashes:
+                self._pendingApprovals.pop(transactionHash, None)
+            # A failure may have been caused by an allowance the cache got wrong, so the next attempt reads them from chain
+            await self.userManager.delete_wallet_allowances(walletAddress=chain_util.normalize_address(value=walletAddress))
+            raise
+        finally:
+            # Once everything in flight is mined (or has failed) the chain's count is the source of truth again
+            self.nonceManager.reset(walletAddress=walletAddress)
+            self.invalidate_wallet_snapshot(walletAddress=walletAddress)
+        for transactionHash in transactionHashes:
+            pendingApproval = self._pendingApprovals.pop(transactionHash, None)
+            if pendingApproval is not None:
+                approvalWalletAddress, assetAddress, spenderAddress = pendingApproval
+                await self.userManager.upsert_wallet_allowance(walletAddress=approvalWalletAddress, assetAddress=assetAddress, spenderAddress=spenderAddress, amount=MAX_UINT256)
+        return receipts
+
+    async def _record_allowance_spend(self, walletAddress: str, assetAddress: str, spenderAddress: str, amount: int) -> None:
+        # Keeps a cached allowance in step with what the spender has pulled, tokens that don't decrement an unlimited allowance are just undercounted
+        walletAddress = chain_util.normalize_address(value=walletAddress)
+        assetAddress = chain_util.normalize_address(value=assetAddress)
+        spenderAddress = chain_util.normalize_address(value=spenderAddress)
+        cachedAllowance = await self.userManager.get_wallet_allowance(walletAddress=walletAddress, assetAddress=assetAddress, spenderAddress=spenderAddress)
+        if cachedAllowance is None:
+            return
+        await self.userManager.upsert_wallet_allowance(walletAddress=walletAddress, assetAddress=assetAddress, spenderAddress=spenderAddress, amount=max(cachedAllowance.amount - amount, 0))
+
+    async def _approve_token(self, chainId: int, walletAddress: str, assetAddress: str, spenderAddress: str) -> str:
+        # Broadcasts an unlimited approval and returns its hash, the allowance cache is updated once it is mined
+        logging.info(f'[APPROVE] Approving {spenderAddress} for max amount of {assetAddress}')
+        transactionDict: TxParams = {
+            'from': chain_util.normalize_address(value=walletAddress),
+            'to': chain_util.normalize_address(value=assetAddress),
+            'value': Wei(0),
+            'data': chain_util.encode_transaction_data_by_name(
+                contractAbi=ERC20_ABI,
+                functionName='approve',
+                arguments={
+                    'spender': spenderAddress,
+                    'amount': MAX_UINT256,
+                },
+            ),
+        }
+        txHash = await self._send_transaction(chainId=chainId, walletAddress=walletAddress, transactionDict=transactionDict)
+        logging.info(f'[APPROVE] Approval transaction broadcast: {txHash}')
+        self._pendingApprovals[txHash] = (chain_util.normalize_address(value=walletAddress), chain_util.normalize_address(value=assetAddress), chain_util.normalize_address(value=spenderAddress))
+        return txHash
+
+    async def _approve_tokens_if_needed(self, chainId: int, walletAddress: str, spenderAddress: str, assetAmounts: list[tuple[str, int]]) -> list[str]:
+        # Returns the hashes of the approvals that were broadcast, callers wait for them together with the transactions that depend on them
+        walletAddress = chain_util.normalize_address(value=walletAddress)
+        spenderAddress = chain_util.normalize_address(value=spenderAddress)
+        uncheckedAssetAmounts: list[tuple[str, int]] = []
+        for rawAssetAddress, amount in assetAmounts:
+            assetAddress = chain_util.normalize_address(value=rawAssetAddress)
+            cachedAllowance = await self.userManager.get_wallet_allowance(walletAddress=walletAddress, assetAddress=assetAddress, spenderAddress=spenderAddress)
+            if cachedAllowance is not None and cachedAllowance.amount >= amount:
+                logging.info(f'[APPROVE] Cached allowance for {assetAddress} -> {spenderAddress} already sufficient')
+                continue
+            uncheckedAssetAmounts.append((assetAddress, amount))
+        if len(uncheckedAssetAmounts) == 0:
+            return []
+        # The remaining allowances are read in one multicall rather than an eth_call per token
+        currentAllowances = await self.multicallClient.get_erc20_allowances(
+            walletAddress=walletAddress,
+            assetSpenderAddresses=[(assetAddress, spenderAddress) for assetAddress, _ in uncheckedAssetAmounts],
+        )
+        approvalHashes: list[str] = []
+        for assetAddress, amount in uncheckedAssetAmounts:
+            currentAllowance = currentAllowances[(assetAddress, spenderAddress)]
+            logging.info(f'[APPROVE] Current allowance for {assetAddress} -> {spenderAddress}: {currentAllowance}')
+            if currentAllowance >= amount:
+                logging.info(f'[APPROVE] Allowance already sufficient ({currentAllowance} >= {amount})')
+                await self.userManager.upsert_wallet_allowance(walletAddress=walletAddress, assetAddress=assetAddress, spenderAddress=spenderAddress, amount=currentAllowance)
+                continue
+            logging.info(f'[APPROVE] Insufficient allowance ({currentAllowance} < {amount})')
+            approvalHashes.append(await self._approve_token(chainId=chainId, walletAddress=walletAddress, assetAddress=assetAddress, spenderAddress=spenderAddress))
+        return approvalHashes
 
     async def preview_deposit(self, userId: str, agentId: str, token0Amount: float, token1Amount: float) -> PreviewDeposit:
         agent = await self.get_agent(userId=userId, agentId=agentId)
@@ -379,13 +624,9 @@ class AppManager(Authorizer):
         if usdcPrice == 0:
             usdcPrice = 1.0
         currentPrice = ethPrice / usdcPrice
-        rangePercent = 0.1
-        rules = strategy.rulesJson
-        for rule in rules:
-            if rule.get('type') == 'RANGE_WIDTH':
-                params = cast(JsonObject, rule.get('parameters', {}))
-                rangePercent = float(cast(float, params.get('baseRangePercent', 10))) / 100.0
-                break
+        compiledStrategy = await self.strategyManager.get_compiled_strategy(strategyId=strategy.strategyId)
+        snapshot = await self.get_market_snapshot()
+        rangePercent = compiledStrategy.get_range_percent(volatility=snapshot.volatility) / 100.0
         priceLower = currentPrice * (1 - rangePercent)
         priceUpper = currentPrice * (1 + rangePercent)
         sqrtP = math.sqrt(currentPrice)
@@ -424,19 +665,9 @@ class AppManager(Authorizer):
         strategy = await self.strategyManager.get_strategy(strategyId=agent.strategyId)
         logging.info(f'[REBALANCE] Strategy loaded: {strategy.strategyId}')
 
-        # Check for existing Uniswap positions and withdraw them first
-        positions = await self.get_wallet_uniswap_positions(walletAddress=agentWallet.walletAddress)
-        if positions:
-            logging.info(f'[REBALANCE] Found {len(positions)} existing Uniswap positions, withdrawing...')
-            for position in positions:
-                logging.info(f'[REBALANCE] Withdrawing position {position.tokenId}')
-                await self._withdraw_from_uniswap_v3(
-                    chainId=8453,
-                    walletAddress=agentWallet.walletAddress,
-                    tokenId=position.tokenId,
-                )
-            logging.info('[REBALANCE] All positions withdrawn')
-
+        # Existing Uniswap positions count towards the balances, they are withdrawn before (or in the same transaction as) the new mint
+        positions = await self.get_wallet_uniswap_positions(walletAddress=agentWallet.walletAddress, maxLagBlocks=0)
+        logging.info(f'[REBALANCE] Found {len(positions)} existing Uniswap positions')
         balances = await self.get_wallet_balances(chainId=8453, walletAddress=agentWallet.walletAddress)
         logging.info(f'[REBALANCE] Fetched {len(balances)} token balances')
         wethBalance = next((b for b in balances if b.asset.address == constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID]), None)
@@ -444,9 +675,9 @@ class AppManager(Authorizer):
         if not wethBalance or not usdcBalance:
             logging.error(f'[REBALANCE] Missing balances - WETH: {wethBalance is not None}, USDC: {usdcBalance is not None}')
             raise KibaException('Agent wallet must have WETH and USDC balances')
-        token0Amount = float(wethBalance.balance) / (10**wethBalance.asset.decimals)
-        token1Amount = float(usdcBalance.balance) / (10**usdcBalance.asset.decimals)
-        logging.info(f'[REBALANCE] Current balances - WETH: {token0Amount:.6f}, USDC: {token1Amount:.2f}')
+        token0Amount = float(wethBalance.balance + sum(position.token0Amount + position.token0UncollectedFees for position in positions)) / (10**wethBalance.asset.decimals)
+        token1Amount = float(usdcBalance.balance + sum(position.token1Amount + position.token1UncollectedFees for position in positions)) / (10**usdcBalance.asset.decimals)
+        logging.info(f'[REBALANCE] Current balances including positions - WETH: {token0Amount:.6f}, USDC: {token1Amount:.2f}')
         # 2. Calculate optimal swap amounts using existing logic
         prices = await self.pythClient.get_prices(priceIds=[PYTH_ETH_USD_PRICE_ID, PYTH_USDC_USD_PRICE_ID])
         ethPrice = prices.get(PYTH_ETH_USD_PRICE_ID, 0.0)
@@ -454,13 +685,9 @@ class AppManager(Authorizer):
         if usdcPrice == 0:
             usdcPrice = 1.0
         currentPrice = ethPrice / usdcPrice
-        rangePercent = 0.1
-        rules = strategy.rulesJson
-        for rule in rules:
-            if rule.get('type') == 'RANGE_WIDTH':
-                params = cast(JsonObject, rule.get('parameters', {}))
-                rangePercent = float(cast(float, params.get('baseRangePercent', 10))) / 100.0
-                break
+        compiledStrategy = await self.strategyManager.get_compiled_strategy(strategyId=strategy.strategyId)
+        snapshot = await self.get_market_snapshot()
+        rangePercent = compiledStrategy.get_range_percent(volatility=snapshot.volatility) / 100.0
         priceLower = currentPrice * (1 - rangePercent)
         priceUpper = currentPrice * (1 + rangePercent)
         sqrtP = math.sqrt(currentPrice)
@@ -476,6 +703,22 @@ class AppManager(Authorizer):
         usdcDiff = yFinal - token1Amount
         logging.info(f'[REBALANCE] Optimal amounts - WETH: {xFinal:.6f}, USDC: {yFinal:.2f}')
         logging.info(f'[REBALANCE] Differences - WETH: {wethDiff:.6f}, USDC: {usdcDiff:.2f}')
+        if positions and wethDiff <= MIN_WETH_DIFF and usdcDiff <= MIN_USDC_DIFF:
+            logging.info('[REBALANCE] No swap needed - withdrawing and re-minting in one transaction')
+            mintedPosition = await self._exit_and_remint_uniswap_v3(
+                chainId=8453,
+                agentId=agent.agentId,
+                walletAddress=agentWallet.walletAddress,
+                tokenIds=[position.tokenId for position in positions],
+                wethBalance=wethBalance.balance,
+                usdcBalance=usdcBalance.balance,
+                rangePercent=rangePercent,
+                edgeBandFraction=compiledStrategy.rangeRule.rebalanceBuffer,
+            )
+            self.positionIndex.set_agent_positions(agentId=agent.agentId, positions=[mintedPosition] if mintedPosition is not None else [])
+            logging.info('[REBALANCE] Rebalance completed successfully!')
+            return
+        await self._withdraw_all_agent_positions(agentId=agent.agentId, walletAddress=agentWallet.walletAddress, positions=positions)
         if wethDiff > MIN_WETH_DIFF:
             swapAmountUsdc = int(-usdcDiff * (10**usdcBalance.asset.decimals))
             logging.info(f'[REBALANCE] Swapping {-usdcDiff:.2f} USDC for {wethDiff:.6f} WETH (amount: {swapAmountUsdc})')
@@ -511,14 +754,53 @@ class AppManager(Authorizer):
         finalUsdcAmount = float(usdcBalance.balance) / (10**usdcBalance.asset.decimals)
         logging.info(f'[REBALANCE] Final balances - WETH: {finalWethAmount:.6f}, USDC: {finalUsdcAmount:.2f}')
         logging.info(f'[REBALANCE] Starting Uniswap V3 deposit - WETH: {wethBalance.balance}, USDC: {usdcBalance.balance}')
-        await self._deposit_to_uniswap_v3(
+        mintedPosition = await self._deposit_to_uniswap_v3(
             chainId=8453,
+            agentId=agent.agentId,
             walletAddress=agentWallet.walletAddress,
             wethAmount=wethBalance.balance,
             usdcAmount=usdcBalance.balance,
+            rangePercent=rangePercent,
+            edgeBandFraction=compiledStrategy.rangeRule.rebalanceBuffer,
         )
+        if mintedPosition is not None:
+            self.positionIndex.set_agent_positions(agentId=agent.agentId, positions=[mintedPosition])
         logging.info('[REBALANCE] Rebalance completed successfully!')
 
+    async def _withdraw_all_agent_positions(self, agentId: str, walletAddress: str, positions: list[UniswapPosition] | None = None) -> None:
+        if positions is None:
+            positions = await self.get_wallet_uniswap_positions(walletAddress=walletAddress, maxLagBlocks=0)
+        if not positions:
+            return
+        logging.info(f'[REBALANCE] Withdrawing {len(positions)} existing Uniswap positions in one transaction')
+        tokenIds = [position.tokenId for position in positions]
+        withdrawCalls = await self._encode_withdraw_calls(chainId=8453, walletAddress=walletAddress, tokenIds=tokenIds)
+        await self._send_position_manager_multicall(chainId=8453, walletAddress=walletAddress, calls=withdrawCalls, approvalHashes=[])
+        logging.info('[REBALANCE] All positions withdrawn')
+        for tokenId in tokenIds:
+            await self.userManager.delete_agent_position(tokenId=tokenId)
+        self.positionIndex.set_agent_positions(agentId=agentId, positions=[])
+
+    async def exit_agent_to_stable(self, userId: str, agentId: str) -> None:
+        logging.info(f'[EXIT_TO_STABLE] Exiting agent {agentId} to USDC')
+        agent = await self.userManager.get_agent(userId=userId, agentId=agentId)
+        agentWallet = await self.userManager.get_agent_wallet(userId=userId, agentId=agent.agentId)
+        await self._withdraw_all_agent_positions(agentId=agent.agentId, walletAddress=agentWallet.walletAddress)
+        balances = await self.get_wallet_balances(chainId=8453, walletAddress=agentWallet.walletAddress)
+        wethBalance = next((b for b in balances if b.asset.address == constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID]), None)
+        if wethBalance is None or float(wethBalance.balance) / (10**wethBalance.asset.decimals) <= MIN_WETH_DIFF:
+            logging.info('[EXIT_TO_STABLE] No WETH left to swap')
+            return
+        logging.info(f'[EXIT_TO_STABLE] Swapping {wethBalance.balance} WETH to USDC')
+        await self._execute_swap(
+            chainId=8453,
+            walletAddress=agentWallet.walletAddress,
+            fromToken=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
+            toToken=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
+            fromAmount=str(wethBalance.balance),
+        )
+        logging.info(f'[EXIT_TO_STABLE] Agent {agentId} exited to USDC')
+
     async def _execute_swap(self, chainId: int, walletAddress: str, fromToken: str, toToken: str, fromAmount: str) -> None:
         logging.info(f'[SWAP] Executing swap - from: {fromToken}, to: {toToken}, amount: {fromAmount}')
         amount = int(fromAmount)
@@ -530,67 +812,43 @@ class AppManager(Authorizer):
             fromWalletAddress=walletAddress,
         )
         logging.info('[SWAP] 0x swap response received')
+        transactionHashes: list[str] = []
         allowanceIssue = swapResponse['issues'].get('allowance')
         if allowanceIssue:
             spender = typing.cast(str | None, allowanceIssue.get('spender'))
             if spender:
                 spender = chain_util.normalize_address(value=spender)
                 logging.info(f'[SWAP] Allowance issue detected for spender: {spender}')
-                await self._approve_token_if_needed(
-                    chainId=chainId,
-                    walletAddress=walletAddress,
-                    assetAddress=fromToken,
-                    spenderAddress=spender,
-                    amount=amount,
-                )
-                logging.info('[SWAP] Refreshing swap quote after approval')
-                swapResponse = await self.zeroxClient.prepare_quote(
-                    chainId=chainId,
-                    amount=amount,
-                    fromAssetAddress=fromToken,
-                    toAssetAddress=toToken,
-                    fromWalletAddress=walletAddress,
-                )
-                logging.info('[SWAP] Refreshed swap response received')
+                # 0x has already read the allowance on chain, so there's nothing to check before approving
+                approvalHash = await self._approve_token(chainId=chainId, walletAddress=walletAddress, assetAddress=fromToken, spenderAddress=spender)
+                transactionHashes.append(approvalHash)
         transactionData = swapResponse['transaction']
         toAddress = chain_util.normalize_address(value=typing.cast(str, transactionData['to']))
         data = typing.cast(str, transactionData['data'])
         value = int(typing.cast(str, transactionData.get('value', '0')))
+        # The quote's gas is used as is, estimating again would revert while the approval is still pending
         gasFromSwap = int(typing.cast(str, transactionData.get('gas', '300000')))
         logging.info(f'[SWAP] Transaction details - to: {toAddress}, value: {value}, gas: {gasFromSwap}, data length: {len(data)}')
-
-        # Build base transaction params
         transactionDict: TxParams = {
             'from': chain_util.normalize_address(value=walletAddress),
             'to': chain_util.normalize_address(value=toAddress),
             'value': Wei(value),
             'data': typing.cast(HexStr, data),
         }
-
-        # Fill in gas, nonce, and fee parameters automatically
-        filledTransaction = await self.ethClient.fill_transaction_params(
-            params=transactionDict,
-            fromAddress=walletAddress,
-            gas=gasFromSwap,
-            chainId=chainId,
-        )
-
-        signedTx = await self.userManager.coinbaseCdpClient.sign_transaction(
-            walletAddress=walletAddress,
-            transactionDict=filledTransaction,
-        )
-        logging.info('[SWAP] Transaction signed, broadcasting...')
         try:
-            txHash = await self.ethClient.send_raw_transaction(transactionData=signedTx)
+            txHash = await self._send_transaction(chainId=chainId, walletAddress=walletAddress, transactionDict=transactionDict, gas=gasFromSwap)
             logging.info(f'[SWAP] Transaction broadcast successfully: {txHash}')
-            receipt = await self.ethClient.wait_for_transaction_receipt(transactionHash=txHash)
-            logging.info(f'[SWAP] Transaction mined in block {receipt["blockNumber"]}, status: {receipt["status"]}')
+            transactionHashes.append(txHash)
+            receipts = await self._wait_for_transactions(walletAddress=walletAddress, transactionHashes=transactionHashes)
+            logging.info(f'[SWAP] Transaction mined in block {receipts[-1]["blockNumber"]}, status: {receipts[-1]["status"]}')
+            await self._record_allowance_spend(walletAddress=walletAddress, assetAddress=fromToken, spenderAddress=toAddress, amount=amount)
         except Exception as e:
             logging.exception(f'[SWAP] Transaction failed: {e}')
             logging.exception(f'[SWAP] Transaction dict: {transactionDict}')
             raise
 
-    async def _deposit_to_uniswap_v3(self, chainId: int, walletAddress: str, wethAmount: int, usdcAmount: int) -> None:
+    async def _encode_mint_call(self, chainId: int, walletAddress: str, wethAmount: int, usdcAmount: int, rangePercent: float) -> tuple[str, str, int, int]:
+        # Returns the pool address, the mint call data and the tick range it mints
         # Get the actual pool to get current tick and calculate proper tick range
         pool = await self.strategyManager.uniswapClient.get_pool(
             token0Address=constants.CHAIN_WETH_MAP[chainId],
@@ -599,8 +857,6 @@ class AppManager(Authorizer):
         )
         currentTick = pool.tick
 
-        # Calculate tick range as percentage from current tick
-        rangePercent = 0.1  # 10% range
         # Tick spacing for 0.05% fee tier is 10
         tickSpacing = 10
 
@@ -612,7 +868,6 @@ class AppManager(Authorizer):
         logging.info(f'[UNISWAP] Current pool tick: {currentTick}')
         logging.info(f'[UNISWAP] Calculated tick range - lower: {tickLower}, upper: {tickUpper}')
 
-        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
         token0 = constants.CHAIN_WETH_MAP[chainId]
         token1 = constants.CHAIN_USDC_MAP[chainId]
         fee = 500  # 0.05% fee tier
@@ -620,13 +875,6 @@ class AppManager(Authorizer):
         amount1Min = 0  # Allow any amount of token1 (more flexible for price movements)
         deadline = int(datetime.datetime.now(tz=datetime.UTC).timestamp()) + 1200
         logging.info(f'[UNISWAP] Token amounts - WETH: {wethAmount}, USDC: {usdcAmount}, deadline: {deadline}')
-        logging.info(f'[UNISWAP] Checking/approving WETH ({token0}) to position manager')
-        await self._approve_token_if_needed(chainId, walletAddress, token0, positionManagerAddress, wethAmount)
-        logging.info(f'[UNISWAP] Checking/approving USDC ({token1}) to position manager')
-        await self._approve_token_if_needed(chainId, walletAddress, token1, positionManagerAddress, usdcAmount)
-        logging.info('[UNISWAP] Token approval checks completed')
-        # Encode mint call data (simplified - using hex encoding)
-        # In production, use proper ABI encoder like eth_abi
         data = self._encode_mint_params(
             token0=token0,
             token1=token1,
@@ -640,6 +888,48 @@ class AppManager(Authorizer):
             recipient=walletAddress,
             deadline=deadline,
         )
+        return pool.address, data, tickLower, tickUpper
+
+    async def _approve_position_manager_if_needed(self, chainId: int, walletAddress: str, wethAmount: int, usdcAmount: int) -> list[str]:
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
+        token0 = constants.CHAIN_WETH_MAP[chainId]
+        token1 = constants.CHAIN_USDC_MAP[chainId]
+        logging.info(f'[UNISWAP] Checking/approving WETH ({token0}) and USDC ({token1}) to position manager')
+        approvalHashes = await self._approve_tokens_if_needed(chainId=chainId, walletAddress=walletAddress, spenderAddress=positionManagerAddress, assetAmounts=[(token0, wethAmount), (token1, usdcAmount)])
+        logging.info(f'[UNISWAP] Token approval checks completed, {len(approvalHashes)} approvals pending')
+        return approvalHashes
+
+    async def _record_minted_position(self, chainId: int, agentId: str, walletAddress: str, poolAddress: str, tickLower: int, tickUpper: int, receipt: TxReceipt, edgeBandFraction: float) -> IndexedPosition | None:
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
+        increaseLiquidityTopic = bytes.fromhex(UNISWAP_V3_INCREASE_LIQUIDITY_EVENT_TOPIC[2:])
+        for log in receipt['logs']:
+            if chain_util.normalize_address(log['address']) == chain_util.normalize_address(positionManagerAddress) and bytes(log['topics'][0]) == increaseLiquidityTopic:
+                tokenId = int.from_bytes(bytes(log['topics'][1]), 'big')
+                # IncreaseLiquidity data is (uint128 liquidity, uint256 amount0, uint256 amount1)
+                liquidity = int.from_bytes(bytes(log['data'])[:32], 'big')
+                amount0 = int.from_bytes(bytes(log['data'])[32:64], 'big')
+                amount1 = int.from_bytes(bytes(log['data'])[64:96], 'big')
+                logging.info(f'[UNISWAP] Minted position {tokenId} with liquidity {liquidity}')
+                await self._record_allowance_spend(walletAddress=walletAddress, assetAddress=constants.CHAIN_WETH_MAP[chainId], spenderAddress=positionManagerAddress, amount=amount0)
+                await self._record_allowance_spend(walletAddress=walletAddress, assetAddress=constants.CHAIN_USDC_MAP[chainId], spenderAddress=positionManagerAddress, amount=amount1)
+                agentPosition = await self.userManager.upsert_agent_position(
+                    agentId=agentId,
+                    walletAddress=walletAddress,
+                    tokenId=tokenId,
+                    poolAddress=poolAddress,
+                    tickLower=tickLower,
+                    tickUpper=tickUpper,
+                    liquidity=liquidity,
+                    mintBlockNumber=int(receipt['blockNumber']),
+                )
+                return self._indexed_position_from_agent_position(agentPosition=agentPosition, edgeBandFraction=edgeBandFraction)
+        logging.warning('[UNISWAP] Could not find minted position in mint receipt')
+        return None
+
+    async def _deposit_to_uniswap_v3(self, chainId: int, agentId: str, walletAddress: str, wethAmount: int, usdcAmount: int, rangePercent: float, edgeBandFraction: float) -> IndexedPosition | None:
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
+        approvalHashes = await self._approve_position_manager_if_needed(chainId=chainId, walletAddress=walletAddress, wethAmount=wethAmount, usdcAmount=usdcAmount)
+        poolAddress, data, tickLower, tickUpper = await self._encode_mint_call(chainId=chainId, walletAddress=walletAddress, wethAmount=wethAmount, usdcAmount=usdcAmount, rangePercent=rangePercent)
         logging.info('[UNISWAP] Broadcasting mint transaction')
         transactionDict: TxParams = {
             'from': chain_util.normalize_address(value=walletAddress),
@@ -647,103 +937,86 @@ class AppManager(Authorizer):
             'value': Wei(0),
             'data': typing.cast(HexStr, data),
         }
-        filledTransaction = await self.ethClient.fill_transaction_params(
-            params=transactionDict,
-            fromAddress=walletAddress,
+        # Gas can't be estimated for the mint while its approvals are still pending
+        txHash = await self._send_transaction(chainId=chainId, walletAddress=walletAddress, transactionDict=transactionDict, gas=MINT_GAS_LIMIT if approvalHashes else None)
+        logging.info(f'[UNISWAP] Mint transaction broadcast successfully: {txHash}')
+        receipts = await self._wait_for_transactions(walletAddress=walletAddress, transactionHashes=[*approvalHashes, txHash])
+        receipt = receipts[-1]
+        logging.info(f'[UNISWAP] Mint transaction mined in block {receipt["blockNumber"]}')
+        return await self._record_minted_position(chainId=chainId, agentId=agentId, walletAddress=walletAddress, poolAddress=poolAddress, tickLower=tickLower, tickUpper=tickUpper, receipt=receipt, edgeBandFraction=edgeBandFraction)
+
+    async def _exit_and_remint_uniswap_v3(self, chainId: int, agentId: str, walletAddress: str, tokenIds: list[int], wethBalance: int, usdcBalance: int, rangePercent: float, edgeBandFraction: float) -> IndexedPosition | None:
+        # Withdraws every existing position and mints the new one in a single multicall, used when the withdrawn tokens need no swap first
+        withdrawCalls = await self._encode_withdraw_calls(chainId=chainId, walletAddress=walletAddress, tokenIds=tokenIds)
+        collectedWethAmount, collectedUsdcAmount = await self._simulate_withdraw_calls(chainId=chainId, walletAddress=walletAddress, calls=withdrawCalls)
+        logging.info(f'[UNISWAP] Withdrawal will collect WETH: {collectedWethAmount}, USDC: {collectedUsdcAmount}')
+        # Collected amounts move with the price until the transaction is mined, asking for slightly less keeps the mint from pulling more than the wallet holds
+        wethAmount = int((wethBalance + collectedWethAmount) * REMINT_DESIRED_AMOUNT_FRACTION)
+        usdcAmount = int((usdcBalance + collectedUsdcAmount) * REMINT_DESIRED_AMOUNT_FRACTION)
+        approvalHashes = await self._approve_position_manager_if_needed(chainId=chainId, walletAddress=walletAddress, wethAmount=wethAmount, usdcAmount=usdcAmount)
+        poolAddress, mintCall, tickLower, tickUpper = await self._encode_mint_call(chainId=chainId, walletAddress=walletAddress, wethAmount=wethAmount, usdcAmount=usdcAmount, rangePercent=rangePercent)
+        receipt = await self._send_position_manager_multicall(
             chainId=chainId,
-        )
-        signedTx = await self.userManager.coinbaseCdpClient.sign_transaction(
             walletAddress=walletAddress,
-            transactionDict=filledTransaction,
+            calls=[*withdrawCalls, mintCall],
+            approvalHashes=approvalHashes,
+            gas=(len(tokenIds) * WITHDRAW_GAS_LIMIT_PER_POSITION + MINT_GAS_LIMIT) if approvalHashes else None,
         )
-        txHash = await self.ethClient.send_raw_transaction(transactionData=signedTx)
-        logging.info(f'[UNISWAP] Mint transaction broadcast successfully: {txHash}')
-        receipt = await self.ethClient.wait_for_transaction_receipt(transactionHash=txHash)
-        logging.info(f'[UNISWAP] Mint transaction mined in block {receipt["blockNumber"]}')
+        for tokenId in tokenIds:
+            await self.userManager.delete_agent_position(tokenId=tokenId)
+        return await self._record_minted_position(chainId=chainId, agentId=agentId, walletAddress=walletAddress, poolAddress=poolAddress, tickLower=tickLower, tickUpper=tickUpper, receipt=receipt, edgeBandFraction=edgeBandFraction)
 
-    async def _withdraw_from_uniswap_v3(self, chainId: int, walletAddress: str, tokenId: int) -> None:
-        logging.info(f'[UNISWAP] Withdrawing position {tokenId}')
+    async def _encode_withdraw_calls(self, chainId: int, walletAddress: str, tokenIds: list[int]) -> list[str]:
+        # Returns the decreaseLiquidity (for positions that still have liquidity) and collect calls that empty each position
         positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
         deadline = int(datetime.datetime.now(tz=datetime.UTC).timestamp()) + 1200
+        positionManagerPositions = await self.multicallClient.get_positions(positionManagerAddress=positionManagerAddress, tokenIds=tokenIds)
+        # collect(uint256 tokenId, address recipient, uint128 amount0Max, uint128 amount1Max)
+        maxAmount = (2**128) - 1
+        calls: list[str] = []
+        for tokenId, positionManagerPosition in zip(tokenIds, positionManagerPositions, strict=True):
+            liquidity = positionManagerPosition.liquidity
+            logging.info(f'[UNISWAP] Position {tokenId} has liquidity: {liquidity}')
+            if liquidity == 0:
+                logging.info(f'[UNISWAP] Position {tokenId} has no liquidity, skipping decreaseLiquidity')
+            else:
+                calls.append(self._encode_decrease_liquidity_params(tokenId=tokenId, liquidity=liquidity, amount0Min=0, amount1Min=0, deadline=deadline))
+            calls.append(self._encode_collect_params(tokenId=tokenId, recipient=walletAddress, amount0Max=maxAmount, amount1Max=maxAmount))
+        return calls
 
-        # Step 1: Get position data to find actual liquidity amount
-        # positions(uint256 tokenId) returns (nonce, operator, token0, token1, fee, tickLower, tickUpper, liquidity, ...)
-        positionData = await self.ethClient.call_function_by_name(
+    async def _simulate_withdraw_calls(self, chainId: int, walletAddress: str, calls: list[str]) -> tuple[int, int]:
+        # Runs the withdrawal as an eth_call and sums the (amount0, amount1) returned by each collect
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
+        response = await self.ethClient.call_function_by_name(
             toAddress=positionManagerAddress,
-            contractAbi=UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI,
-            functionName='positions',
+            contractAbi=UNISWAP_V3_POSITION_MANAGER_MULTICALL_ABI,
+            functionName='multicall',
             fromAddress=walletAddress,
-            arguments={'tokenId': tokenId},
-        )
-
-        liquidity = int(positionData[7])
-        logging.info(f'[UNISWAP] Position {tokenId} has liquidity: {liquidity}')
-
-        if liquidity == 0:
-            logging.info(f'[UNISWAP] Position {tokenId} has no liquidity, skipping decreaseLiquidity')
-        else:
-            # Step 2: Decrease liquidity to 0
-            # decreaseLiquidity(uint256 tokenId, uint128 liquidity, uint256 amount0Min, uint256 amount1Min, uint256 deadline)
-            decreaseLiquidityData = self._encode_decrease_liquidity_params(
-                tokenId=tokenId,
-                liquidity=liquidity,
-                amount0Min=0,
-                amount1Min=0,
-                deadline=deadline,
-            )
-
-            logging.info('[UNISWAP] Broadcasting decreaseLiquidity transaction')
-            transactionDict: TxParams = {
-                'from': chain_util.normalize_address(value=walletAddress),
-                'to': chain_util.normalize_address(value=positionManagerAddress),
-                'value': Wei(0),
-                'data': typing.cast(HexStr, decreaseLiquidityData),
-            }
-            filledTransaction = await self.ethClient.fill_transaction_params(
-                params=transactionDict,
-                fromAddress=walletAddress,
-                chainId=chainId,
-            )
-            signedTx = await self.userManager.coinbaseCdpClient.sign_transaction(
-                walletAddress=walletAddress,
-                transactionDict=filledTransaction,
-            )
-            txHash = await self.ethClient.send_raw_transaction(transactionData=signedTx)
-            logging.info(f'[UNISWAP] decreaseLiquidity transaction broadcast: {txHash}')
-            receipt = await self.ethClient.wait_for_transaction_receipt(transactionHash=txHash)
-            logging.info(f'[UNISWAP] decreaseLiquidity transaction mined in block {receipt["blockNumber"]}')
-
-        # Step 3: Collect the tokens (including any fees)
-        # collect(uint256 tokenId, address recipient, uint128 amount0Max, uint128 amount1Max)
-        maxAmount = (2**128) - 1
-        collectData = self._encode_collect_params(
-            tokenId=tokenId,
-            recipient=walletAddress,
-            amount0Max=maxAmount,
-            amount1Max=maxAmount,
+            arguments={'data': [bytes.fromhex(call[2:]) for call in calls]},
         )
+        results = typing.cast(list[bytes], response[0])
+        amount0 = 0
+        amount1 = 0
+        for call, result in zip(calls, results, strict=True):
+            if call.startswith(UNISWAP_V3_COLLECT_SELECTOR):
+                amount0 += int.from_bytes(result[:32], 'big')
+                amount1 += int.from_bytes(result[32:64], 'big')
+        return amount0, amount1
 
-        logging.info('[UNISWAP] Broadcasting collect transaction')
-        transactionDict = {
+    async def _send_position_manager_multicall(self, chainId: int, walletAddress: str, calls: list[str], approvalHashes: list[str], gas: int | None = None) -> TxReceipt:
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[chainId]
+        logging.info(f'[UNISWAP] Broadcasting multicall transaction with {len(calls)} calls')
+        transactionDict: TxParams = {
             'from': chain_util.normalize_address(value=walletAddress),
             'to': chain_util.normalize_address(value=positionManagerAddress),
             'value': Wei(0),
-            'data': typing.cast(HexStr, collectData),
+            'data': typing.cast(HexStr, self._encode_multicall_params(calls=calls)),
         }
-        filledTransaction = await self.ethClient.fill_transaction_params(
-            params=transactionDict,
-            fromAddress=walletAddress,
-            chainId=chainId,
-        )
-        signedTx = await self.userManager.coinbaseCdpClient.sign_transaction(
-            walletAddress=walletAddress,
-            transactionDict=filledTransaction,
-        )
-        txHash = await self.ethClient.send_raw_transaction(transactionData=signedTx)
-        logging.info(f'[UNISWAP] collect transaction broadcast: {txHash}')
-        receipt = await self.ethClient.wait_for_transaction_receipt(transactionHash=txHash)
-        logging.info(f'[UNISWAP] collect transaction mined in block {receipt["blockNumber"]}')
-        logging.info(f'[UNISWAP] Position {tokenId} fully withdrawn')
+        txHash = await self._send_transaction(chainId=chainId, walletAddress=walletAddress, transactionDict=transactionDict, gas=gas)
+        logging.info(f'[UNISWAP] multicall transaction broadcast: {txHash}')
+        receipts = await self._wait_for_transactions(walletAddress=walletAddress, transactionHashes=[*approvalHashes, txHash])
+        logging.info(f'[UNISWAP] multicall transaction mined in block {receipts[-1]["blockNumber"]}')
+        return receipts[-1]
 
     def _encode_decrease_liquidity_params(self, tokenId: int, liquidity: int, amount0Min: int, amount1Min: int, deadline: int) -> str:
         # decreaseLiquidity((uint256,uint128,uint256,uint256,uint256))
@@ -759,7 +1032,7 @@ class AppManager(Authorizer):
 
     def _encode_collect_params(self, tokenId: int, recipient: str, amount0Max: int, amount1Max: int) -> str:
         # collect((uint256,address,uint128,uint128))
-        functionSelector = '0xfc6f7865'
+        functionSelector = UNISWAP_V3_COLLECT_SELECTOR
         params = [
             f'{tokenId:x}'.zfill(64),
             recipient[2:].zfill(64),
@@ -768,6 +1041,21 @@ class AppManager(Authorizer):
         ]
         return functionSelector + ''.join(params)
 
+    def _encode_multicall_params(self, calls: list[str]) -> str:
+        # multicall(bytes[])
+        functionSelector = '0xac9650d8'
+        encodedCalls = [bytes.fromhex(call[2:]) for call in calls]
+        # The array's offset and length, then each element's offset (relative to the first offset) followed by the length-prefixed, right-padded elements
+        params = [f'{32:x}'.zfill(64), f'{len(encodedCalls):x}'.zfill(64)]
+        elements = []
+        elementOffset = 32 * len(encodedCalls)
+        for encodedCall in encodedCalls:
+            params.append(f'{elementOffset:x}'.zfill(64))
+            paddedLength = math.ceil(len(encodedCall) / 32) * 32
+            elements.append(f'{len(encodedCall):x}'.zfill(64) + encodedCall.hex().ljust(paddedLength * 2, '0'))
+            elementOffset += 32 + paddedLength
+        return functionSelector + ''.join(params + elements)
+
     def _encode_mint_params(self, token0: str, token1: str, fee: int, tickLower: int, tickUpper: int, amount0Desired: int, amount1Desired: int, amount0Min: int, amount1Min: int, recipient: str, deadline: int) -> str:
         functionSelector = '0x88316456'
         params = [
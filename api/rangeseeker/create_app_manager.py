@@ -1,16 +1,23 @@
 import os
 
+from core.queues.sqs import SqsMessageQueue
 from core.requester import Requester
 from core.store.database import Database
-from core.web3.eth_client import RestEthClient
 
 from rangeseeker.app_manager import AppManager
 from rangeseeker.external.amp_client import AmpClient
+from rangeseeker.external.batching_eth_client import BatchingRestEthClient
 from rangeseeker.external.coinbase_cdp_client import CoinbaseCdpClient
 from rangeseeker.external.gemini_llm import GeminiLLM
+from rangeseeker.external.multicall_client import MulticallClient
 from rangeseeker.external.pyth_client import PythClient
 from rangeseeker.external.uniswap_data_client import UniswapDataClient
 from rangeseeker.external.zerox_client import ZeroxClient
+from rangeseeker.nonce_manager import NonceManager
+from rangeseeker.position_index import PositionTickIndex
+from rangeseeker.position_ownership_manager import PositionOwnershipManager
+from rangeseeker.store.postgres_message_queue import PostgresMessageQueue
+from rangeseeker.store.swap_store import SwapStore
 from rangeseeker.strategy_manager import StrategyManager
 from rangeseeker.strategy_parser import StrategyParser
 from rangeseeker.user_manager import UserManager
@@ -20,9 +27,14 @@ DB_PORT = os.environ['DB_PORT']
 DB_NAME = os.environ['DB_NAME']
 DB_USERNAME = os.environ['DB_USERNAME']
 DB_PASSWORD = os.environ['DB_PASSWORD']
+REBALANCE_QUEUE_NAME = 'rangeseeker-rebalance'
+AMP_CONNECTION_POOL_SIZE = int(os.environ.get('AMP_CONNECTION_POOL_SIZE', '4'))
+SWAP_STORE_DIRECTORY = os.environ.get('SWAP_STORE_DIRECTORY', '/tmp/rangeseeker/swaps')  # noqa: S108
 
+RebalanceQueue = SqsMessageQueue | PostgresMessageQueue
 
-def create_app_manager() -> AppManager:
+
+def create_app_manager(positionIndex: PositionTickIndex | None = None) -> AppManager:
     database = Database(
         connectionString=Database.create_psql_connection_string(
             host=DB_HOST,
@@ -35,8 +47,7 @@ def create_app_manager() -> AppManager:
     requester = Requester()
     ampToken = os.environ.get('THEGRAPHAMP_API_KEY', '')
     geminiApiKey = os.environ.get('GEMINI_API_KEY', '')
-    ampClient = AmpClient(flightUrl='https://gateway.amp.staging.thegraph.com', token=ampToken)
-    uniswapClient = UniswapDataClient(ampClient=ampClient)
+    ampClient = AmpClient(flightUrl='https://gateway.amp.staging.thegraph.com', token=ampToken, connectionPoolSize=AMP_CONNECTION_POOL_SIZE)
     geminiLlm = GeminiLLM(apiKey=geminiApiKey, requester=requester)
     parser = StrategyParser(llm=geminiLlm)
     coinbaseCdpClient = CoinbaseCdpClient(
@@ -46,7 +57,9 @@ def create_app_manager() -> AppManager:
         apiKeyPrivateKey=os.environ['CDP_API_KEY_PRIVATE_KEY'],
     )
     pythClient = PythClient(requester=requester)
-    baseEthClient = RestEthClient(url=os.environ['RPC_NODE_URL_8453'], chainId=8453, requester=requester)
+    baseEthClient = BatchingRestEthClient(url=os.environ['RPC_NODE_URL_8453'], chainId=8453, requester=requester)
+    multicallClient = MulticallClient(ethClient=baseEthClient)
+    uniswapClient = UniswapDataClient(ampClient=ampClient, ethClient=baseEthClient, multicallClient=multicallClient, swapStore=SwapStore(rootDirectory=SWAP_STORE_DIRECTORY))
     zeroxApiKey = os.environ['ZEROX_API_KEY']
     zeroxClient = ZeroxClient(requester=requester, apiKey=zeroxApiKey, ethClient=baseEthClient)
     userManager = UserManager(
@@ -56,10 +69,28 @@ def create_app_manager() -> AppManager:
     strategyManager = StrategyManager(database=database, uniswapClient=uniswapClient, parser=parser)
     appManager = AppManager(
         database=database,
+        requester=requester,
         userManager=userManager,
         strategyManager=strategyManager,
         pythClient=pythClient,
         ethClient=baseEthClient,
         zeroxClient=zeroxClient,
+        positionIndex=positionIndex or PositionTickIndex(),
+        nonceManager=NonceManager(ethClient=baseEthClient),
+        multicallClient=multicallClient,
+        positionOwnershipManager=PositionOwnershipManager(database=database, ethClient=baseEthClient, uniswapClient=uniswapClient),
     )
     return appManager
+
+
+def create_rebalance_queue(database: Database) -> RebalanceQueue:
+    # SQS in deployed environments, a postgres-backed queue locally so the worker and executor can run without AWS
+    queueUrl = os.environ.get('QUEUE_URL')
+    if queueUrl:
+        return SqsMessageQueue(
+            region=os.environ['AWS_REGION'],
+            accessKeyId=os.environ['AWS_KEY'],
+            accessKeySecret=os.environ['AWS_SECRET'],
+            queueUrl=queueUrl,
+        )
+    return PostgresMessageQueue(database=database, queueName=REBALANCE_QUEUE_NAME)
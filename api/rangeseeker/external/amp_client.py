@@ -1,8 +1,22 @@
+import asyncio
+import re
+import time
 from collections.abc import AsyncIterator
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Self
+from typing import TypeVar
 from typing import Union
 
 import adbc_driver_flightsql.dbapi as flight_sql
+import pyarrow as pa
+from core import logging
+from core.util import chain_util
+
+from rangeseeker.external.single_flight import SingleFlight
 
 SqlValue = Union[
     None,
@@ -14,24 +28,226 @@ SqlValue = Union[
     datetime,
 ]
 
+T = TypeVar('T')
+
+DEFAULT_CONNECTION_POOL_SIZE = 4
+# Idle connections are closed after this long rather than risk the gateway or a load balancer having dropped them
+CONNECTION_IDLE_EXPIRY_SECONDS = 300
+# Connections idle for longer than this are checked with a trivial query before being handed out again
+CONNECTION_HEALTH_CHECK_SECONDS = 30
+FETCH_ROW_COUNT = 1000
+# Template parameters are written as :name, a double colon is left alone so casts like value::BIGINT still work
+_TEMPLATE_PARAMETER_PATTERN = re.compile(r'(?<!:):([A-Za-z][A-Za-z0-9]*)')
+
+
+def address_parameter(address: str) -> bytes:
+    """Return an address in the binary form Amp stores addresses in, for binding as a query parameter."""
+    return bytes.fromhex(chain_util.normalize_address(value=address)[2:])
+
+
+@dataclass(frozen=True)
+class AmpQueryTemplate:
+    # A named query whose values are bound as parameters rather than spliced into the text, so its text never changes,
+    # the gateway can prepare it once per connection, and a bound query's name and parameters identify its results.
+    name: str
+    sql: str
+    parameterNames: tuple[str, ...]
+
+    @classmethod
+    def create(cls, name: str, sql: str) -> Self:
+        parameterNames: list[str] = []
+
+        def replace_parameter(match: re.Match[str]) -> str:
+            parameterName = match.group(1)
+            if parameterName not in parameterNames:
+                parameterNames.append(parameterName)
+            return f'${parameterNames.index(parameterName) + 1}'
+
+        return cls(name=name, sql=_TEMPLATE_PARAMETER_PATTERN.sub(replace_parameter, sql), parameterNames=tuple(parameterNames))
+
+    def bind(self, **parameters: SqlValue) -> 'AmpQuery':
+        if set(parameters) != set(self.parameterNames):
+            raise ValueError(f'Query {self.name} takes parameters {sorted(self.parameterNames)}, got {sorted(parameters)}')
+        return AmpQuery(template=self, parameters=tuple(parameters[parameterName] for parameterName in self.parameterNames))
+
+
+@dataclass(frozen=True)
+class AmpQuery:
+    template: AmpQueryTemplate
+    parameters: tuple[SqlValue, ...]
+
+    @property
+    def cacheKey(self) -> str:
+        parameterKeys = [f'0x{parameter.hex()}' if isinstance(parameter, bytes) else parameter.isoformat() if isinstance(parameter, datetime) else str(parameter) for parameter in self.parameters]
+        return ':'.join([self.template.name, *parameterKeys])
+
+
+class _PooledConnection:
+    def __init__(self, conn: flight_sql.Connection) -> None:
+        self.conn = conn
+        # The driver only prepares a cursor's statement again when its text changes, so keeping one cursor per template reuses the prepared statement
+        self.templateCursors: dict[str, flight_sql.Cursor] = {}
+
+    def get_cursor(self, query: AmpQuery) -> flight_sql.Cursor:
+        cursor = self.templateCursors.get(query.template.name)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self.templateCursors[query.template.name] = cursor
+        return cursor
+
 
 class AmpClient:
-    def __init__(self, flightUrl: str, token: str) -> None:
+    # The flight sql driver is blocking so every call into it runs on a dedicated thread pool, one thread per pooled
+    # connection, leaving the event loop free while queries are in flight. Connections are reused between queries to
+    # avoid repeating the TLS and auth handshake, and a connection whose query failed is closed rather than reused.
+    # Queries are either AmpQuery objects, whose prepared statements are reused, or plain sql for one-off queries.
+    def __init__(self, flightUrl: str, token: str, connectionPoolSize: int = DEFAULT_CONNECTION_POOL_SIZE) -> None:
         self.flightUrl = flightUrl
         self.token = token
+        self.connectionPoolSize = connectionPoolSize
+        self._executor = ThreadPoolExecutor(max_workers=connectionPoolSize, thread_name_prefix='amp-client')
+        self._connectionSemaphore = asyncio.Semaphore(connectionPoolSize)
+        self._idleConnections: list[tuple[_PooledConnection, float]] = []
+        # Identical queries made at the same time (e.g. concurrent requests missing the same cache) share one result
+        self.singleFlight = SingleFlight(name='amp')
 
-    async def execute_sql(self, sql: str) -> AsyncIterator[dict[str, SqlValue]]:
+    async def _run(self, func: Callable[..., T], *args: object) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> _PooledConnection:
         connKwargs = {
             'db_kwargs': {
                 'adbc.flight.sql.client_option.tls_skip_verify': 'false',
                 'adbc.flight.sql.authorization_header': f'Bearer {self.token}',
             }
         }
-        with flight_sql.connect(self.flightUrl, **connKwargs) as conn, conn.cursor() as cursor:
-            cursor.execute(sql)
+        return _PooledConnection(conn=flight_sql.connect(self.flightUrl, **connKwargs))
+
+    @staticmethod
+    def _close_connection(connection: _PooledConnection) -> None:
+        try:
+            for cursor in connection.templateCursors.values():
+                cursor.close()
+            connection.conn.close()
+        except Exception as exception:  # noqa: BLE001
+            logging.info(f'[AMP_CLIENT] Failed to close connection: {exception}')
+
+    @staticmethod
+    def _is_connection_healthy(connection: _PooledConnection) -> bool:
+        try:
+            with connection.conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+        except Exception as exception:  # noqa: BLE001
+            logging.info(f'[AMP_CLIENT] Discarding unhealthy connection: {exception}')
+            return False
+        return True
+
+    async def _get_connection(self) -> _PooledConnection:
+        # The idle list is only ever touched on the event loop, the executor threads just run the driver calls
+        while len(self._idleConnections) > 0:
+            connection, releasedTime = self._idleConnections.pop()
+            idleSeconds = time.time() - releasedTime
+            if idleSeconds > CONNECTION_IDLE_EXPIRY_SECONDS:
+                await self._run(self._close_connection, connection)
+                continue
+            if idleSeconds > CONNECTION_HEALTH_CHECK_SECONDS and not await self._run(self._is_connection_healthy, connection):
+                await self._run(self._close_connection, connection)
+                continue
+            return connection
+        return await self._run(self._connect)
+
+    def _release_connection(self, connection: _PooledConnection) -> None:
+        self._idleConnections.append((connection, time.time()))
+        # The list is ordered by release time, connections left at the bottom of the stack while the newer ones are reused are
+        # closed here once they have expired rather than waiting until they are popped
+        expiryTime = time.time() - CONNECTION_IDLE_EXPIRY_SECONDS
+        expiredCount = next((index for index, (_, releasedTime) in enumerate(self._idleConnections) if releasedTime >= expiryTime), len(self._idleConnections))
+        if expiredCount == 0:
+            return
+        expiredConnections = self._idleConnections[:expiredCount]
+        self._idleConnections = self._idleConnections[expiredCount:]
+        for expiredConnection, _ in expiredConnections:
+            self._executor.submit(self._close_connection, expiredConnection)
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[_PooledConnection]:
+        async with self._connectionSemaphore:
+            connection = await self._get_connection()
+            try:
+                yield connection
+            except BaseException:
+                await self._run(self._close_connection, connection)
+                raise
+            self._release_connection(connection=connection)
+
+    @asynccontextmanager
+    async def _execute(self, query: AmpQuery | str) -> AsyncIterator[flight_sql.Cursor]:
+        async with self._connection() as connection:
+            if isinstance(query, str):
+                cursor = connection.conn.cursor()
+                try:
+                    await self._run(cursor.execute, query)
+                    yield cursor
+                finally:
+                    await self._run(cursor.close)
+            else:
+                cursor = connection.get_cursor(query=query)
+                await self._run(cursor.execute, query.template.sql, list(query.parameters))
+                yield cursor
+
+    @staticmethod
+    def _get_query_key(query: AmpQuery | str) -> str:
+        return query if isinstance(query, str) else query.cacheKey
+
+    async def _fetch_rows(self, query: AmpQuery | str) -> list[dict[str, SqlValue]]:
+        results: list[dict[str, SqlValue]] = []
+        async with self._execute(query=query) as cursor:
             columns = [desc[0] for desc in cursor.description] if cursor.description else []
             while True:
-                row = cursor.fetchone()
-                if row is None:
+                rows = await self._run(cursor.fetchmany, FETCH_ROW_COUNT)
+                if len(rows) == 0:
                     break
-                yield dict(zip(columns, row, strict=True))
+                results += [dict(zip(columns, row, strict=True)) for row in rows]
+        return results
+
+    async def execute_sql(self, query: AmpQuery | str) -> AsyncIterator[dict[str, SqlValue]]:
+        # Rows are buffered until the query has finished so concurrent identical queries can share them, nothing is
+        # yielded before then, use execute_arrow_batches to process a large result as it arrives
+        rows = await self.singleFlight.run(key=f'rows:{self._get_query_key(query=query)}', func=lambda: self._fetch_rows(query=query))
+        for row in rows:
+            yield row
+
+    @staticmethod
+    def _read_next_batch(reader: pa.RecordBatchReader) -> pa.RecordBatch | None:
+        # StopIteration can't be raised through a future so the end of the stream is returned as None
+        try:
+            return reader.read_next_batch()
+        except StopIteration:
+            return None
+
+    async def execute_arrow_batches(self, query: AmpQuery | str) -> AsyncIterator[pa.RecordBatch]:
+        """Yield the query's results as Arrow record batches, as they arrive from the gateway, without building a Python object per row."""
+        # Not coalesced, sharing would mean holding every batch until the query finished
+        async with self._execute(query=query) as cursor:
+            reader = await self._run(cursor.fetch_record_batch)
+            while True:
+                recordBatch = await self._run(self._read_next_batch, reader)
+                if recordBatch is None:
+                    break
+                yield recordBatch
+
+    async def _fetch_arrow_table(self, query: AmpQuery | str) -> pa.Table:
+        async with self._execute(query=query) as cursor:
+            return await self._run(cursor.fetch_arrow_table)
+
+    async def execute_arrow(self, query: AmpQuery | str) -> pa.Table:
+        """Return the query's results as a single Arrow table."""
+        return await self.singleFlight.run(key=f'arrow:{self._get_query_key(query=query)}', func=lambda: self._fetch_arrow_table(query=query))
+
+    async def close_connections(self) -> None:
+        idleConnections = self._idleConnections
+        self._idleConnections = []
+        for connection, _ in idleConnections:
+            await self._run(self._close_connection, connection)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from typing import cast
+
+from core import logging
+from core.exceptions import BadRequestException
+from core.exceptions import NotFoundException
+from core.requester import Requester
+from core.util import chain_util
+from core.util.typing_util import JsonObject
+from core.web3.eth_client import ListAny
+from core.web3.eth_client import RestEthClient
+
+from rangeseeker.external.single_flight import SingleFlight
+
+# Long enough to catch the requests fired by one asyncio.gather, short enough not to be noticed by a single caller
+BATCH_WINDOW_SECONDS = 0.01
+# Most providers cap batch sizes (and count each entry against rate limits), so larger bursts are split
+MAX_BATCH_SIZE = 50
+
+
+class BatchingRestEthClient(RestEthClient):
+    # Every JSON-RPC request made within BATCH_WINDOW_SECONDS of the first one waiting is sent as a single batch POST and
+    # each caller gets its own response back, so the many independent reads in a rebalance (gas and fee fills, nonces,
+    # receipts, block numbers) share one connection and one rate-limited request instead of one each.
+    def __init__(self, url: str, chainId: int, requester: Requester, batchWindowSeconds: float = BATCH_WINDOW_SECONDS, maxBatchSize: int = MAX_BATCH_SIZE) -> None:
+        super().__init__(url=url, chainId=chainId, requester=requester)
+        self.batchWindowSeconds = batchWindowSeconds
+        self.maxBatchSize = maxBatchSize
+        self._pendingRequests: list[tuple[JsonObject, asyncio.Future[JsonObject]]] = []
+        self._nextRequestId = 0
+        self._flushTask: asyncio.Task[None] | None = None
+        self._batchTasks: set[asyncio.Task[None]] = set()
+        # Identical requests made at the same time (e.g. several callers reading the latest block) are only sent once
+        self.singleFlight = SingleFlight(name='eth')
+
+    async def _make_request(self, method: str, params: ListAny | None = None) -> JsonObject:
+        requestKey = f'{method}:{json.dumps(params or [], sort_keys=True, default=str)}'
+        return await self.singleFlight.run(key=requestKey, func=lambda: self._make_batched_request(method=method, params=params))
+
+    async def get_pending_transaction_count(self, address: str) -> int:
+        """Return the address's transaction count including transactions still in the mempool, i.e. its next free nonce."""
+        response = await self._make_request(method='eth_getTransactionCount', params=[chain_util.normalize_address_checksum(value=address), 'pending'])
+        if response['result'] is None:
+            raise NotFoundException
+        return int(cast(str, response['result']), 16)
+
+    async def _make_batched_request(self, method: str, params: ListAny | None = None) -> JsonObject:
+        self._nextRequestId += 1
+        request: JsonObject = {'jsonrpc': '2.0', 'method': method, 'params': params or [], 'id': self._nextRequestId}
+        future: asyncio.Future[JsonObject] = asyncio.get_running_loop().create_future()
+        self._pendingRequests.append((request, future))
+        if len(self._pendingRequests) >= self.maxBatchSize:
+            self._flush()
+        elif self._flushTask is None:
+            self._flushTask = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.batchWindowSeconds)
+        self._flushTask = None
+        self._flush()
+
+    def _flush(self) -> None:
+        if self._flushTask is not None:
+            self._flushTask.cancel()
+            self._flushTask = None
+        batch = self._pendingRequests
+        self._pendingRequests = []
+        if len(batch) == 0:
+            return
+        batchTask = asyncio.create_task(self._send_batch(batch=batch))
+        self._batchTasks.add(batchTask)
+        batchTask.add_done_callback(self._batchTasks.discard)
+
+    async def _send_batch(self, batch: list[tuple[JsonObject, asyncio.Future[JsonObject]]]) -> None:
+        try:
+            response = await self.requester.post_json(url=self.url, dataDict=[request for (request, _) in batch], timeout=100)
+            jsonResponse = response.json()
+        except Exception as exception:  # noqa: BLE001
+            logging.info(f'[ETH_BATCH] Batch of {len(batch)} requests failed: {exception}')
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exception)
+            return
+        # A provider that rejects the whole batch answers with a single error object rather than a list
+        if isinstance(jsonResponse, list):
+            responseMap = {requestResponse.get('id'): requestResponse for requestResponse in cast(list[JsonObject], jsonResponse)}
+            requestResponses = [responseMap.get(request['id']) for (request, _) in batch]
+        else:
+            requestResponses = [cast(JsonObject, jsonResponse) for _ in batch]
+        for (request, future), requestResponse in zip(batch, requestResponses, strict=True):
+            if future.done():
+                continue
+            if requestResponse is None:
+                future.set_exception(BadRequestException(message=f'No response for {request["method"]} in JSON-RPC batch'))
+                continue
+            error = requestResponse.get('error')
+            if error:
+                errorObject = cast(JsonObject, error)
+                future.set_exception(BadRequestException(message=cast(str | None, errorObject.get('message')) or cast(str | None, errorObject.get('details')) or json.dumps(error)))
+                continue
+            future.set_result(requestResponse)
@@ -0,0 +1,141 @@
+import dataclasses
+from typing import cast
+
+from core.exceptions import BadRequestException
+from core.util import chain_util
+from core.web3.eth_client import DictStrAny
+from core.web3.eth_client import ListAny
+from core.web3.eth_client import RestEthClient
+from eth_typing import ABI
+from eth_typing import ABIFunction
+from eth_utils.abi import get_abi_output_types
+from pydantic import BaseModel
+
+from rangeseeker.erc_abis import ERC20_ABI
+from rangeseeker.uniswap_abis import UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI
+
+# Multicall3 is deployed at the same address on every chain we use
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+# Keeps each eth_call well under node gas and response size limits
+MAX_CALLS_PER_MULTICALL = 100
+
+MULTICALL3_ABI: ABI = [
+    {
+        'inputs': [
+            {
+                'components': [
+                    {'name': 'target', 'type': 'address'},
+                    {'name': 'allowFailure', 'type': 'bool'},
+                    {'name': 'callData', 'type': 'bytes'},
+                ],
+                'name': 'calls',
+                'type': 'tuple[]',
+            }
+        ],
+        'name': 'aggregate3',
+        'outputs': [
+            {
+                'components': [
+                    {'name': 'success', 'type': 'bool'},
+                    {'name': 'returnData', 'type': 'bytes'},
+                ],
+                'name': 'returnData',
+                'type': 'tuple[]',
+            }
+        ],
+        'stateMutability': 'payable',
+        'type': 'function',
+    }
+]
+
+
+@dataclasses.dataclass(frozen=True)
+class ContractCall:
+    toAddress: str
+    contractAbi: ABI
+    functionName: str
+    arguments: DictStrAny | None = None
+
+
+class PositionManagerPosition(BaseModel):
+    tokenId: int
+    token0: str
+    token1: str
+    fee: int
+    tickLower: int
+    tickUpper: int
+    liquidity: int
+    feeGrowthInside0LastX128: int
+    feeGrowthInside1LastX128: int
+    tokensOwed0: int
+    tokensOwed1: int
+
+
+class MulticallClient:
+    # Batches view calls through Multicall3's aggregate3 so a group of reads costs one eth_call (per chunk) instead of one
+    # round trip each, and every result in a batch is read at the same block.
+    def __init__(self, ethClient: RestEthClient) -> None:
+        self.ethClient = ethClient
+
+    @staticmethod
+    def _find_function_abi(contractAbi: ABI, functionName: str) -> ABIFunction:
+        functionAbi = next((abi for abi in contractAbi if abi.get('type') == 'function' and abi.get('name') == functionName), None)
+        if functionAbi is None:
+            raise BadRequestException(message=f'Function {functionName} not found in ABI')
+        return cast(ABIFunction, functionAbi)
+
+    async def call(self, calls: list[ContractCall], blockNumber: int | None = None) -> list[ListAny | None]:
+        """Run the calls in as few eth_calls as possible, returning each call's decoded outputs or None if it reverted."""
+        results: list[ListAny | None] = []
+        for chunkStart in range(0, len(calls), MAX_CALLS_PER_MULTICALL):
+            chunkCalls = calls[chunkStart : chunkStart + MAX_CALLS_PER_MULTICALL]
+            aggregateCalls = [
+                (
+                    chain_util.normalize_address_checksum(value=call.toAddress),
+                    True,
+                    bytes.fromhex(chain_util.encode_transaction_data_by_name(contractAbi=call.contractAbi, functionName=call.functionName, arguments=call.arguments or {})[2:]),
+                )
+                for call in chunkCalls
+            ]
+            response = await self.ethClient.call_function_by_name(toAddress=MULTICALL3_ADDRESS, contractAbi=MULTICALL3_ABI, functionName='aggregate3', arguments={'calls': aggregateCalls}, blockNumber=blockNumber)
+            for call, (success, returnData) in zip(chunkCalls, cast(list[tuple[bool, bytes]], response[0]), strict=True):
+                if not success or len(returnData) == 0:
+                    results.append(None)
+                    continue
+                outputTypes = get_abi_output_types(self._find_function_abi(contractAbi=call.contractAbi, functionName=call.functionName))
+                results.append(list(self.ethClient.w3.codec.decode(types=outputTypes, data=returnData)))
+        return results
+
+    async def call_all(self, calls: list[ContractCall], blockNumber: int | None = None) -> list[ListAny]:
+        """Like call but raises if any of the calls reverted."""
+        results = await self.call(calls=calls, blockNumber=blockNumber)
+        for call, result in zip(calls, results, strict=True):
+            if result is None:
+                raise BadRequestException(message=f'Call to {call.functionName} on {call.toAddress} failed')
+        return cast(list[ListAny], results)
+
+    async def get_positions(self, positionManagerAddress: str, tokenIds: list[int], blockNumber: int | None = None) -> list[PositionManagerPosition]:
+        calls = [ContractCall(toAddress=positionManagerAddress, contractAbi=UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI, functionName='positions', arguments={'tokenId': tokenId}) for tokenId in tokenIds]
+        results = await self.call_all(calls=calls, blockNumber=blockNumber)
+        # positions(uint256 tokenId) returns (nonce, operator, token0, token1, fee, tickLower, tickUpper, liquidity, feeGrowthInside0LastX128, feeGrowthInside1LastX128, tokensOwed0, tokensOwed1)
+        return [
+            PositionManagerPosition(
+                tokenId=tokenId,
+                token0=chain_util.normalize_address(value=str(result[2])),
+                token1=chain_util.normalize_address(value=str(result[3])),
+                fee=int(result[4]),
+                tickLower=int(result[5]),
+                tickUpper=int(result[6]),
+                liquidity=int(result[7]),
+                feeGrowthInside0LastX128=int(result[8]),
+                feeGrowthInside1LastX128=int(result[9]),
+                tokensOwed0=int(result[10]),
+                tokensOwed1=int(result[11]),
+            )
+            for tokenId, result in zip(tokenIds, results, strict=True)
+        ]
+
+    async def get_erc20_allowances(self, walletAddress: str, assetSpenderAddresses: list[tuple[str, str]], blockNumber: int | None = None) -> dict[tuple[str, str], int]:
+        calls = [ContractCall(toAddress=assetAddress, contractAbi=ERC20_ABI, functionName='allowance', arguments={'owner': walletAddress, 'spender': spenderAddress}) for (assetAddress, spenderAddress) in assetSpenderAddresses]
+        results = await self.call_all(calls=calls, blockNumber=blockNumber)
+        return {(chain_util.normalize_address(value=assetAddress), chain_util.normalize_address(value=spenderAddress)): int(result[0]) for (assetAddress, spenderAddress), result in zip(assetSpenderAddresses, results, strict=True)}
@@ -1,16 +1,34 @@
+import time
 import urllib.parse
 
 from core.requester import Requester
 
+from rangeseeker.external.single_flight import SingleFlight
+
+PRICE_MAX_AGE_SECONDS = 5
+
 
 class PythClient:
     def __init__(self, requester: Requester) -> None:
         self.requester = requester
         self.baseUrl = 'https://hermes.pyth.network'
+        self._priceCache: dict[str, tuple[float, float]] = {}
+        # Concurrent reads of the same ids (e.g. the parallel valuations in one request) share one fetch
+        self.singleFlight = SingleFlight(name='pyth')
 
-    async def get_prices(self, priceIds: list[str]) -> dict[str, float]:
+    async def warm_up(self, priceIds: list[str]) -> None:
+        await self.get_prices(priceIds=priceIds, maxAgeSeconds=0)
+
+    async def get_prices(self, priceIds: list[str], maxAgeSeconds: float = PRICE_MAX_AGE_SECONDS) -> dict[str, float]:
         if not priceIds:
             return {}
+        # Reads within a few seconds of each other (e.g. across agent checks in one cycle) reuse the last response
+        cachedPrices = {priceId: self._priceCache[priceId] for priceId in priceIds if priceId in self._priceCache}
+        if len(cachedPrices) == len(priceIds) and all(time.time() - fetchTime <= maxAgeSeconds for (_, fetchTime) in cachedPrices.values()):
+            return {priceId: price for priceId, (price, _) in cachedPrices.items()}
+        return await self.singleFlight.run(key=','.join(sorted(set(priceIds))), func=lambda: self._fetch_prices(priceIds=priceIds))
+
+    async def _fetch_prices(self, priceIds: list[str]) -> dict[str, float]:
         # https://hermes.pyth.network/v2/updates/price/latest?ids[]=...
         queryParams = [('ids[]', priceId) for priceId in priceIds]
         queryString = urllib.parse.urlencode(queryParams)
@@ -32,4 +50,5 @@ class PythClient:
             # price * 10^expo
             finalPrice = price * (10**expo)
             prices[priceId] = finalPrice
+            self._priceCache[priceId] = (finalPrice, time.time())
         return prices
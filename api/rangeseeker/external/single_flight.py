@@ -0,0 +1,46 @@
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+from typing import Any
+from typing import TypeVar
+
+from core import logging
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight call instead of each making their own: the first caller
+    # starts it and everyone awaiting the key gets its result (or exception). Nothing is kept once the call finishes,
+    # so this only coalesces calls that overlap and never serves stale results. The shared call runs as its own task so
+    # a caller being cancelled doesn't cancel it for the others.
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.hitCount = 0
+        self.missCount = 0
+        self._inFlightTasks: dict[str, asyncio.Task[Any]] = {}  # type: ignore[explicit-any]
+
+    def _on_task_done(self, key: str, task: asyncio.Task[Any]) -> None:  # type: ignore[explicit-any]
+        if self._inFlightTasks.get(key) is task:
+            del self._inFlightTasks[key]
+        # Retrieves the exception so it isn't reported as unhandled when every caller was cancelled before the call finished
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._inFlightTasks.get(key)
+        if task is not None:
+            self.hitCount += 1
+        else:
+            self.missCount += 1
+            task = asyncio.ensure_future(func())
+            self._inFlightTasks[key] = task
+            task.add_done_callback(lambda doneTask: self._on_task_done(key=key, task=doneTask))
+        result: T = await asyncio.shield(task)
+        return result
+
+    def log_stats(self) -> None:
+        # A hit is a caller that joined a call already in flight instead of making its own
+        callCount = self.hitCount + self.missCount
+        hitPercent = 100 * self.hitCount / callCount if callCount > 0 else 0.0
+        logging.info(f'[SINGLE_FLIGHT] {self.name}: {callCount} calls, {self.hitCount} shared an in-flight call ({hitPercent:.1f}%), {len(self._inFlightTasks)} in flight')
@@ -1,17 +1,124 @@
+import asyncio
 import datetime
 import math
 import statistics
-import typing
+import time
 from typing import cast
 
+import numpy as np
+import numpy.typing as npt
+import pyarrow as pa
+import pyarrow.compute as pc
+from core import logging
 from core.exceptions import NotFoundException
 from core.util import chain_util
+from core.web3.eth_client import RestEthClient
 from pydantic import BaseModel
+from web3.types import LogReceipt
 
+from rangeseeker import constants
+from rangeseeker import uniswap_math
 from rangeseeker.external.amp_client import AmpClient
-from rangeseeker.external.amp_client import SqlValue
+from rangeseeker.external.amp_client import AmpQuery
+from rangeseeker.external.amp_client import AmpQueryTemplate
+from rangeseeker.external.amp_client import address_parameter
+from rangeseeker.external.multicall_client import ContractCall
+from rangeseeker.external.multicall_client import MulticallClient
+from rangeseeker.store.swap_store import SWAP_SCHEMA
+from rangeseeker.store.swap_store import SwapStore
+from rangeseeker.store.swap_store import SwapStoreState
+from rangeseeker.uniswap_abis import UNISWAP_V3_POOL_ABI
+from rangeseeker.uniswap_abis import UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI
+from rangeseeker.uniswap_abis import UNISWAP_V3_SWAP_EVENT_DATA_TYPES
+from rangeseeker.uniswap_abis import UNISWAP_V3_SWAP_EVENT_TOPIC
 
 MIN_DATA_POINTS = 2
+# Base produces a block every 2 seconds so this allows the live state to be at most a couple of blocks old
+POOL_STATE_MAX_AGE_SECONDS = 4
+MAX_LOG_BLOCK_RANGE = 1000
+POSITION_TOKEN_IDS_PAGE_SIZE = 500
+# Swap analytics read the local swap store, which asks Amp for new blocks at most this often per pool
+SWAP_STORE_SYNC_INTERVAL_SECONDS = 10
+SWAP_BUCKET_SECONDS = 15 * 60
+# The longest window the analytics read, older swaps are pruned from the store (and fetched again if a longer window is asked for)
+SWAP_STORE_RETENTION_HOURS = 168
+AMP_DATASET_NAME = 'edgeandnode/uniswap_v3_base@0.0.1'
+
+# Columns are converted to the swap store's schema by the query so the record batches can be stored without touching individual rows
+_POOL_SWAPS_COLUMNS = """
+    CAST(block_num AS BIGINT) as "blockNumber",
+    CAST(log_index AS INT) as "logIndex",
+    CAST(EXTRACT(EPOCH FROM timestamp) AS BIGINT) as "timestamp",
+    CONCAT('0x', ENCODE(tx_hash, 'hex')) as "txHash",
+    CAST(event."sqrtPriceX96" AS VARCHAR) as "sqrtPriceX96",
+    CAST(event."amount0" AS VARCHAR) as "amount0",
+    CAST(event."amount1" AS VARCHAR) as "amount1",
+    CAST(event."liquidity" AS VARCHAR) as "liquidity",
+    CAST(event."tick" AS INT) as "tick"
+"""
+POOL_SWAPS_IN_TIME_RANGE_QUERY = AmpQueryTemplate.create(
+    name='pool-swaps-in-time-range',
+    sql=f"""
+    SELECT {_POOL_SWAPS_COLUMNS}
+    FROM "{AMP_DATASET_NAME}".event__swap
+    WHERE
+        pool_address = :poolAddress
+        AND timestamp > :startDate
+        AND timestamp <= :endDate
+    ORDER BY block_num, log_index
+    """,
+)
+POOL_SWAPS_AFTER_BLOCK_QUERY = AmpQueryTemplate.create(
+    name='pool-swaps-after-block',
+    sql=f"""
+    SELECT {_POOL_SWAPS_COLUMNS}
+    FROM "{AMP_DATASET_NAME}".event__swap
+    WHERE
+        pool_address = :poolAddress
+        AND block_num > :blockNumber
+        AND timestamp > :startDate
+    ORDER BY block_num, log_index
+    """,
+)
+POOL_METADATAS_QUERY = AmpQueryTemplate.create(
+    name='pool-metadatas',
+    sql=f"""
+    SELECT
+        event."pool" as pool_address,
+        event."token0" as token0,
+        event."token1" as token1,
+        event."fee" as fee,
+        event."tickSpacing" as tick_spacing
+    FROM "{AMP_DATASET_NAME}".event__factory_pool_created
+    WHERE
+        (event."token0" = :token0 AND event."token1" = :token1)
+        OR
+        (event."token0" = :token1 AND event."token1" = :token0)
+    """,
+)
+# Currently owned token ids are those whose latest transfer went to the wallet, only tokens it has ever received are ranked
+WALLET_POSITION_TOKEN_IDS_QUERY = AmpQueryTemplate.create(
+    name='wallet-position-token-ids',
+    sql=f"""
+    WITH latest_transfers AS (
+        SELECT
+            event."tokenId" as token_id,
+            event."to" as current_owner,
+            ROW_NUMBER() OVER (PARTITION BY event."tokenId" ORDER BY block_num DESC, log_index DESC) as rn
+        FROM "{AMP_DATASET_NAME}".event__position_manager_transfer
+        WHERE event."tokenId" IN (
+            SELECT event."tokenId"
+            FROM "{AMP_DATASET_NAME}".event__position_manager_transfer
+            WHERE event."to" = :walletAddress
+        )
+    )
+    SELECT DISTINCT token_id
+    FROM latest_transfers
+    WHERE rn = 1 AND current_owner = :walletAddress AND token_id > :afterTokenId
+    ORDER BY token_id
+    LIMIT {POSITION_TOKEN_IDS_PAGE_SIZE}
+    """,
+)
 
 
 class SwapEvent(BaseModel):
@@ -38,6 +145,21 @@ class VolatilityData(BaseModel):
     realized: float
 
 
+class PoolAnalytics(BaseModel):
+    currentPrice: float
+    volatility24h: VolatilityData
+    volatility7d: VolatilityData
+    feeGrowth7d: float
+
+
+class PoolMetadata(BaseModel):
+    address: str
+    token0: str
+    token1: str
+    fee: int
+    tickSpacing: int
+
+
 class Pool(BaseModel):
     address: str
     token0: str
@@ -54,145 +176,159 @@ class WalletPosition(BaseModel):
     poolAddress: str
     token0: str
     token1: str
+    fee: int
+    tickLower: int
+    tickUpper: int
+    liquidity: int
     amount0: int
     amount1: int
+    uncollectedFees0: int
+    uncollectedFees1: int
+
+
+class PositionRange(BaseModel):
+    tokenId: int
+    poolAddress: str
+    tickLower: int
+    tickUpper: int
+
+
+class PositionValue(BaseModel):
+    tokenId: int
+    liquidity: int
+    amount0: int
+    amount1: int
+    uncollectedFees0: int
+    uncollectedFees1: int
 
 
 class UniswapDataClient:
-    def __init__(self, ampClient: AmpClient) -> None:
+    def __init__(self, ampClient: AmpClient, ethClient: RestEthClient, multicallClient: MulticallClient, swapStore: SwapStore) -> None:
         self.ampClient = ampClient
-        self.ampDatasetName = 'edgeandnode/uniswap_v3_base@0.0.1'
-        self._poolAddressCache: dict[str, Pool] = {}
+        self.ethClient = ethClient
+        self.multicallClient = multicallClient
+        self.swapStore = swapStore
+        # Factory data never changes once a pool is created so it is cached forever, live state is cached separately
+        self._poolMetadatasCache: dict[str, list[PoolMetadata]] = {}
+        self._poolStateCache: dict[str, PoolState] = {}
+        self._swapStoreLocks: dict[str, asyncio.Lock] = {}
+        self._swapStoreSyncTimes: dict[str, float] = {}
+
+    async def _fetch_swaps(self, query: AmpQuery) -> pa.Table:
+        recordBatches = [recordBatch.cast(SWAP_SCHEMA) async for recordBatch in self.ampClient.execute_arrow_batches(query=query)]
+        return pa.Table.from_batches(recordBatches, schema=SWAP_SCHEMA)
+
+    async def _sync_swap_store(self, poolAddress: str, startTimestamp: int) -> None:
+        # Historical swaps never change so Amp is only asked for the blocks after the store's cursor, and for older swaps the first time a longer window is read
+        self.swapStore.prune_swaps(poolAddress=poolAddress, startTimestamp=min(startTimestamp, int(time.time()) - SWAP_STORE_RETENTION_HOURS * 3600))
+        state = self.swapStore.get_state(poolAddress=poolAddress)
+        if state is None or startTimestamp < state.startTimestamp:
+            query = POOL_SWAPS_IN_TIME_RANGE_QUERY.bind(
+                poolAddress=address_parameter(address=poolAddress),
+                startDate=datetime.datetime.fromtimestamp(startTimestamp, tz=datetime.UTC),
+                endDate=datetime.datetime.fromtimestamp(state.startTimestamp, tz=datetime.UTC) if state is not None else datetime.datetime.now(tz=datetime.UTC),
+            )
+            swaps = await self._fetch_swaps(query=query)
+            self.swapStore.write_swaps(poolAddress=poolAddress, swaps=swaps)
+            if state is None:
+                self._swapStoreSyncTimes[poolAddress] = time.time()
+                endBlockNumber = max(swaps.column('blockNumber').to_pylist(), default=0)
+            else:
+                endBlockNumber = state.endBlockNumber
+            state = SwapStoreState(startTimestamp=startTimestamp, endBlockNumber=endBlockNumber)
+            self.swapStore.set_state(poolAddress=poolAddress, state=state)
+            logging.info(f'[SWAP_STORE] Stored {swaps.num_rows} older swaps for {poolAddress}')
+        if time.time() - self._swapStoreSyncTimes.get(poolAddress, 0) < SWAP_STORE_SYNC_INTERVAL_SECONDS:
+            return
+        query = POOL_SWAPS_AFTER_BLOCK_QUERY.bind(
+            poolAddress=address_parameter(address=poolAddress),
+            blockNumber=state.endBlockNumber,
+            startDate=datetime.datetime.fromtimestamp(state.startTimestamp, tz=datetime.UTC),
+        )
+        swaps = await self._fetch_swaps(query=query)
+        self.swapStore.write_swaps(poolAddress=poolAddress, swaps=swaps)
+        if swaps.num_rows > 0:
+            self.swapStore.set_state(poolAddress=poolAddress, state=SwapStoreState(startTimestamp=state.startTimestamp, endBlockNumber=max(swaps.column('blockNumber').to_pylist())))
+        self._swapStoreSyncTimes[poolAddress] = time.time()
+
+    async def _read_pool_swaps(self, poolAddress: str, hoursBack: int) -> pa.Table:
+        poolAddress = chain_util.normalize_address(poolAddress)
+        startTimestamp = int(time.time()) - hoursBack * 3600
+        # Other processes can share the store, so the read happens under the same locks as the sync and can't see a partial prune
+        lock = self._swapStoreLocks.setdefault(poolAddress, asyncio.Lock())
+        async with lock, self.swapStore.lock_pool(poolAddress=poolAddress):
+            await self._sync_swap_store(poolAddress=poolAddress, startTimestamp=startTimestamp)
+            return self.swapStore.read_swaps(poolAddress=poolAddress, startTimestamp=startTimestamp)
+
+    @staticmethod
+    def _get_raw_prices(swaps: pa.Table) -> npt.NDArray[np.float64]:
+        sqrtPrices: npt.NDArray[np.float64] = pc.cast(swaps.column('sqrtPriceX96'), pa.float64()).to_numpy() / uniswap_math.Q96
+        return sqrtPrices**2
+
+    @staticmethod
+    def _build_swap_event(swap: dict[str, str | int]) -> SwapEvent:
+        return SwapEvent(
+            timestamp=int(swap['timestamp']),
+            sqrtPriceX96=int(swap['sqrtPriceX96']),
+            amount0=int(swap['amount0']),
+            amount1=int(swap['amount1']),
+            liquidity=int(swap['liquidity']),
+            tick=int(swap['tick']),
+            txHash=str(swap['txHash']),
+            blockNumber=int(swap['blockNumber']),
+        )
+
+    async def _read_bucketed_pool_swaps(self, poolAddress: str, hoursBack: int) -> pa.Table:
+        swaps = await self._read_pool_swaps(poolAddress=poolAddress, hoursBack=hoursBack)
+        if swaps.num_rows == 0:
+            return swaps
+        # Keep the last swap of every 15-minute interval to reduce data size while maintaining good granularity
+        buckets = swaps.column('timestamp').to_numpy() // SWAP_BUCKET_SECONDS
+        lastIndices = np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+        return swaps.take(pa.array(lastIndices))
 
     async def get_pool_swaps(self, poolAddress: str, hoursBack: int = 24) -> list[SwapEvent]:
-        cutoffTime = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(hours=hoursBack)
-        timestampCutoff = cutoffTime.strftime('%Y-%m-%d %H:%M:%S')
-        # Group by 15-minute intervals to reduce data size while maintaining good granularity
-        sql = f"""
-        WITH binned_swaps AS (
-            SELECT
-                FLOOR(EXTRACT(EPOCH FROM timestamp) / (15*60)) as time_bucket,
-                timestamp,
-                event."sqrtPriceX96" as sqrtPriceX96,
-                block_num,
-                tx_hash,
-                log_index,
-                event
-            FROM "{self.ampDatasetName}".event__swap
-            WHERE
-                pool_address = {poolAddress}
-                AND timestamp > TIMESTAMP '{timestampCutoff}'
-        ),
-        ranked_swaps AS (
-            SELECT
-                *,
-                ROW_NUMBER() OVER (PARTITION BY time_bucket ORDER BY block_num DESC) as rn
-            FROM binned_swaps
-        )
-        SELECT
-            timestamp,
-            block_num,
-            tx_hash,
-            log_index,
-            event
-        FROM ranked_swaps
-        WHERE rn = 1
-        ORDER BY timestamp DESC
-        """
-        swaps = []
-        async for row in self.ampClient.execute_sql(sql):
-            event = cast(dict[str, SqlValue], row.get('event', {}))
-            timestamp_val = row.get('timestamp')
-            timestamp = int(timestamp_val.timestamp()) if isinstance(timestamp_val, datetime.datetime) else 0
-            swaps.append(
-                SwapEvent(
-                    timestamp=timestamp,
-                    sqrtPriceX96=int(cast(int, event.get('sqrtPriceX96', 0))),
-                    amount0=int(cast(int, event.get('amount0', 0))),
-                    amount1=int(cast(int, event.get('amount1', 0))),
-                    liquidity=int(cast(int, event.get('liquidity', 0))),
-                    tick=int(cast(int, event.get('tick', 0))),
-                    txHash=str(row.get('tx_hash', '')),
-                    blockNumber=int(cast(int, row.get('block_num', 0))),
-                )
-            )
-        return swaps
+        swaps = await self._read_bucketed_pool_swaps(poolAddress=poolAddress, hoursBack=hoursBack)
+        return [self._build_swap_event(swap=swap) for swap in reversed(swaps.to_pylist())]
+
+    async def get_pool_price_history(self, poolAddress: str, hoursBack: int = 24, token0Decimals: int = 18, token1Decimals: int = 6) -> pa.Table:
+        """Return the pool's price at the end of every 15-minute interval as timestamp and price columns, oldest first."""
+        swaps = await self._read_bucketed_pool_swaps(poolAddress=poolAddress, hoursBack=hoursBack)
+        prices = self._get_raw_prices(swaps=swaps) * 10 ** (token0Decimals - token1Decimals)
+        return pa.table({'timestamp': swaps.column('timestamp'), 'price': pa.array(prices, type=pa.float64())})
 
     async def get_pool_current_state(self, poolAddress: str) -> PoolState | None:
-        sql = f"""
-        SELECT
-            block_num,
-            timestamp,
-            event
-        FROM "{self.ampDatasetName}".event__swap
-        WHERE
-            pool_address = {poolAddress}
-        ORDER BY block_num DESC
-        LIMIT 1
-        """
-        results = [row async for row in self.ampClient.execute_sql(sql)]
-        if not results:
+        swaps = await self._read_pool_swaps(poolAddress=poolAddress, hoursBack=24)
+        if swaps.num_rows == 0:
             return None
-        row = results[0]
-        event = cast(dict[str, SqlValue], row.get('event', {}))
-        timestamp_val = row.get('timestamp')
-        timestamp = int(timestamp_val.timestamp()) if isinstance(timestamp_val, datetime.datetime) else 0
-        return PoolState(
-            blockNumber=int(cast(int, row.get('block_num', 0))),
-            timestamp=timestamp,
-            sqrtPriceX96=int(cast(int, event.get('sqrtPriceX96', 0))),
-            tick=int(cast(int, event.get('tick', 0))),
-            liquidity=int(cast(int, event.get('liquidity', 0))),
-        )
+        swap = self._build_swap_event(swap=swaps.slice(offset=swaps.num_rows - 1).to_pylist()[0])
+        return PoolState(blockNumber=swap.blockNumber, timestamp=swap.timestamp, sqrtPriceX96=swap.sqrtPriceX96, tick=swap.tick, liquidity=swap.liquidity)
 
-    async def get_pool_volatility(self, poolAddress: str, hoursBack: int = 24) -> VolatilityData:
-        cutoffTime = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(hours=hoursBack)
-        timestampCutoff = cutoffTime.strftime('%Y-%m-%d %H:%M:%S')
+    def _calculate_volatility_data(self, swaps: pa.Table, hoursBack: int) -> VolatilityData:
         secondsInYear = 365 * 24 * 3600
         secondsInPeriod = hoursBack * 3600
-        poolAddressLiteral = f"X'{poolAddress[2:]}'" if poolAddress.startswith('0x') else f"'{poolAddress}'"
-        sql = f"""
-        WITH prices AS (
-            SELECT
-                timestamp,
-                POWER(CAST(event."sqrtPriceX96" AS DOUBLE) / 79228162514264337593543950336.0, 2) as price
-            FROM "{self.ampDatasetName}".event__swap
-            WHERE
-                pool_address = {poolAddressLiteral}
-                AND timestamp > TIMESTAMP '{timestampCutoff}'
-        ),
-        returns AS (
-            SELECT
-                timestamp,
-                LN(price / LAG(price) OVER (ORDER BY timestamp)) as log_return
-            FROM prices
-            WHERE price > 0
-        ),
-        stats AS (
-            SELECT
-                STDDEV(log_return) as std_dev,
-                COUNT(*) as count,
-                EXTRACT(EPOCH FROM MAX(timestamp)) - EXTRACT(EPOCH FROM MIN(timestamp)) as duration_seconds
-            FROM returns
-            WHERE log_return IS NOT NULL
-        )
-        SELECT
-            CASE
-                WHEN duration_seconds > 0 AND count >= {MIN_DATA_POINTS} THEN std_dev * SQRT((count / duration_seconds) * {secondsInYear})
-                ELSE 0
-            END as annualized_volatility,
-            CASE
-                WHEN duration_seconds > 0 AND count >= {MIN_DATA_POINTS} THEN std_dev * SQRT((count / duration_seconds) * {secondsInPeriod})
-                ELSE 0
-            END as realized_volatility
-        FROM stats
-        """
-        results = [row async for row in self.ampClient.execute_sql(sql)]
-        if not results:
+        prices = self._get_raw_prices(swaps=swaps)
+        timestamps = swaps.column('timestamp').to_numpy()
+        hasPrice = prices > 0
+        prices = prices[hasPrice]
+        timestamps = timestamps[hasPrice]
+        # Each log return is dated by the later of its two swaps
+        logReturns = np.diff(np.log(prices))
+        count = len(logReturns)
+        if count < MIN_DATA_POINTS:
             return VolatilityData(annualized=0.0, realized=0.0)
+        durationSeconds = float(timestamps[-1] - timestamps[1])
+        if durationSeconds <= 0:
+            return VolatilityData(annualized=0.0, realized=0.0)
+        stdDev = float(np.std(logReturns, ddof=1))
+        return VolatilityData(
+            annualized=stdDev * math.sqrt((count / durationSeconds) * secondsInYear),
+            realized=stdDev * math.sqrt((count / durationSeconds) * secondsInPeriod),
+        )
 
-        row = results[0]
-        return VolatilityData(annualized=float(cast(float, row.get('annualized_volatility', 0.0))), realized=float(cast(float, row.get('realized_volatility', 0.0))))
+    async def get_pool_volatility(self, poolAddress: str, hoursBack: int = 24) -> VolatilityData:
+        swaps = await self._read_pool_swaps(poolAddress=poolAddress, hoursBack=hoursBack)
+        return self._calculate_volatility_data(swaps=swaps, hoursBack=hoursBack)
 
     async def get_current_price(self, poolAddress: str, token0Decimals: int = 18, token1Decimals: int = 6) -> float:
         state = await self.get_pool_current_state(poolAddress)
@@ -206,136 +342,149 @@ class UniswapDataClient:
         adjustedPrice: float = price * (10**token0Decimals) / (10**token1Decimals)
         return adjustedPrice
 
-    async def get_pool(self, token0Address: str, token1Address: str, feeTier: int | None = None) -> Pool:
+    async def get_pool_metadatas(self, token0Address: str, token1Address: str) -> list[PoolMetadata]:
         t0 = chain_util.normalize_address(token0Address)
         t1 = chain_util.normalize_address(token1Address)
-        cacheKey = f'{t0}-{t1}-{feeTier}'
-        if cacheKey in self._poolAddressCache:
-            return self._poolAddressCache[cacheKey]
-        # Step 1: Get all pools for the pair
-        sql_pools = f"""
-        SELECT
-            event."pool" as pool_address,
-            event."token0" as token0,
-            event."token1" as token1,
-            event."fee" as fee,
-            event."tickSpacing" as tick_spacing
-        FROM "{self.ampDatasetName}".event__factory_pool_created
-        WHERE
-            (event."token0" = {t0} AND event."token1" = {t1})
-            OR
-            (event."token0" = {t1} AND event."token1" = {t0})
-        """
-        pool_results = [row async for row in self.ampClient.execute_sql(sql_pools)]
-        if not pool_results:
-            raise NotFoundException
-        pools_map = {}
-        pool_addresses = []
-        for row in pool_results:
-            poolAddressRaw = row.get('pool_address')
-            poolAddress = '0x' + poolAddressRaw.hex() if isinstance(poolAddressRaw, bytes) else str(poolAddressRaw)
-            poolAddress = chain_util.normalize_address(poolAddress)
-            pools_map[poolAddress] = row
-            pool_addresses.append(poolAddress)
-        if not pool_addresses:
-            raise NotFoundException
-        # Step 2: Get latest state for all pools
-        # Use UNION ALL to get latest state for each pool individually, avoiding massive window functions
-        subqueries = [
-            f"""
-                (SELECT
-                    pool_address,
-                    event
-                FROM "{self.ampDatasetName}".event__swap
-                WHERE pool_address = X'{addr[2:]}'
-                ORDER BY block_num DESC
-                LIMIT 1)
-            """
-            for addr in pool_addresses
-        ]
-        sql_state = ' UNION ALL '.join(subqueries)
-        state_results = [row async for row in self.ampClient.execute_sql(sql_state)]
-        states_map: dict[str, typing.Any] = {}  # type: ignore[explicit-any]
-        for row in state_results:
+        cacheKey = '-'.join(sorted([t0, t1]))
+        if cacheKey in self._poolMetadatasCache:
+            return self._poolMetadatasCache[cacheKey]
+        query = POOL_METADATAS_QUERY.bind(token0=address_parameter(address=t0), token1=address_parameter(address=t1))
+        poolMetadatas: list[PoolMetadata] = []
+        async for row in self.ampClient.execute_sql(query=query):
             poolAddressRaw = row.get('pool_address')
             poolAddress = '0x' + poolAddressRaw.hex() if isinstance(poolAddressRaw, bytes) else str(poolAddressRaw)
-            poolAddress = chain_util.normalize_address(poolAddress)
-            states_map[poolAddress] = row.get('event')
-        pools: list[Pool] = []
-        for poolAddress, row in pools_map.items():
-            swapEvent = states_map.get(poolAddress)
-            liquidity = 0
-            sqrtPriceX96 = 0
-            tick = 0
-            if swapEvent and isinstance(swapEvent, dict):
-                liquidity = int(cast(int, swapEvent.get('liquidity', 0)))
-                sqrtPriceX96 = int(cast(int, swapEvent.get('sqrtPriceX96', 0)))
-                tick = int(cast(int, swapEvent.get('tick', 0)))
             token0Raw = row.get('token0')
             token0 = '0x' + token0Raw.hex() if isinstance(token0Raw, bytes) else str(token0Raw)
             token1Raw = row.get('token1')
             token1 = '0x' + token1Raw.hex() if isinstance(token1Raw, bytes) else str(token1Raw)
-            pools.append(
-                Pool(
-                    address=poolAddress,
+            poolMetadatas.append(
+                PoolMetadata(
+                    address=chain_util.normalize_address(poolAddress),
                     token0=chain_util.normalize_address(token0),
                     token1=chain_util.normalize_address(token1),
                     fee=int(cast(int, row.get('fee', 0))),
                     tickSpacing=int(cast(int, row.get('tick_spacing', 0))),
-                    liquidity=liquidity,
-                    sqrtPriceX96=sqrtPriceX96,
-                    tick=tick,
                 )
             )
-        if not pools:
+        if not poolMetadatas:
             raise NotFoundException
-        selectedPool = min(pools, key=lambda p: abs(p.fee - feeTier)) if feeTier is not None else max(pools, key=lambda p: p.liquidity)
-        self._poolAddressCache[cacheKey] = selectedPool
-        return selectedPool
-
-    async def get_pool_fee_growth(self, poolAddress: str, hoursBack: int = 168, token0Decimals: int = 18, token1Decimals: int = 6) -> float:
-        cutoffTime = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(hours=hoursBack)
-        timestampCutoff = cutoffTime.strftime('%Y-%m-%d %H:%M:%S')
+        self._poolMetadatasCache[cacheKey] = poolMetadatas
+        return poolMetadatas
+
+    async def get_pool_live_state(self, poolAddress: str, maxAgeSeconds: float = POOL_STATE_MAX_AGE_SECONDS, maxBlockAge: int | None = None) -> PoolState:
+        poolAddress = chain_util.normalize_address(poolAddress)
+        cachedState = self._poolStateCache.get(poolAddress)
+        latestBlockNumber: int | None = None
+        if cachedState is not None:
+            if maxBlockAge is not None:
+                latestBlockNumber = await self.ethClient.get_latest_block_number()
+                if latestBlockNumber - cachedState.blockNumber <= maxBlockAge:
+                    return cachedState
+            elif time.time() - cachedState.timestamp <= maxAgeSeconds:
+                return cachedState
+        if latestBlockNumber is None:
+            latestBlockNumber = await self.ethClient.get_latest_block_number()
+        # Read slot0 and liquidity in one call at the same block so they describe a consistent state
+        slot0Response, liquidityResponse = await self.multicallClient.call_all(
+            calls=[
+                ContractCall(toAddress=poolAddress, contractAbi=UNISWAP_V3_POOL_ABI, functionName='slot0'),
+                ContractCall(toAddress=poolAddress, contractAbi=UNISWAP_V3_POOL_ABI, functionName='liquidity'),
+            ],
+            blockNumber=latestBlockNumber,
+        )
+        poolState = PoolState(
+            blockNumber=latestBlockNumber,
+            timestamp=int(time.time()),
+            sqrtPriceX96=int(slot0Response[0]),
+            tick=int(slot0Response[1]),
+            liquidity=int(liquidityResponse[0]),
+        )
+        self._poolStateCache[poolAddress] = poolState
+        return poolState
+
+    async def get_pool_swap_states(self, poolAddress: str, startBlockNumber: int, endBlockNumber: int) -> list[PoolState]:
+        """Read the pool state after every swap in the block range straight from the Swap logs, oldest first."""
+        poolAddress = chain_util.normalize_address(poolAddress)
+        swapLogs: list[LogReceipt] = []
+        for chunkStartBlockNumber in range(startBlockNumber, endBlockNumber + 1, MAX_LOG_BLOCK_RANGE):
+            chunkEndBlockNumber = min(chunkStartBlockNumber + MAX_LOG_BLOCK_RANGE - 1, endBlockNumber)
+            swapLogs += await self.ethClient.get_log_entries(topics=[UNISWAP_V3_SWAP_EVENT_TOPIC], startBlockNumber=chunkStartBlockNumber, endBlockNumber=chunkEndBlockNumber, address=poolAddress)
+        # Each state is stamped with its block's time so a state read from lagging logs isn't treated as fresh, the block
+        # reads are fired together so the batching client sends them as one request
+        blockNumbers = sorted({int(log['blockNumber']) for log in swapLogs})
+        blocks = await asyncio.gather(*[self.ethClient.get_block(blockNumber=blockNumber) for blockNumber in blockNumbers])
+        blockTimestamps = {blockNumber: int(block['timestamp']) for blockNumber, block in zip(blockNumbers, blocks, strict=True)}
+        swapStates: list[PoolState] = []
+        for log in sorted(swapLogs, key=lambda log: (log['blockNumber'], log['logIndex'])):
+            _, _, sqrtPriceX96, liquidity, tick = self.ethClient.w3.codec.decode(types=UNISWAP_V3_SWAP_EVENT_DATA_TYPES, data=bytes(log['data']))
+            swapStates.append(PoolState(blockNumber=int(log['blockNumber']), timestamp=blockTimestamps[int(log['blockNumber'])], sqrtPriceX96=int(sqrtPriceX96), tick=int(tick), liquidity=int(liquidity)))
+        if swapStates:
+            # The latest swap is as good as a fresh slot0 read so keep the live state cache warm with it
+            self._poolStateCache[poolAddress] = swapStates[-1]
+        return swapStates
+
+    async def get_pool(self, token0Address: str, token1Address: str, feeTier: int | None = None, maxAgeSeconds: float = POOL_STATE_MAX_AGE_SECONDS) -> Pool:
+        poolMetadatas = await self.get_pool_metadatas(token0Address=token0Address, token1Address=token1Address)
+        if feeTier is not None:
+            poolMetadata = min(poolMetadatas, key=lambda p: abs(p.fee - feeTier))
+            poolState = await self.get_pool_live_state(poolAddress=poolMetadata.address, maxAgeSeconds=maxAgeSeconds)
+        else:
+            poolStates = await asyncio.gather(*[self.get_pool_live_state(poolAddress=p.address, maxAgeSeconds=maxAgeSeconds) for p in poolMetadatas])
+            poolMetadata, poolState = max(zip(poolMetadatas, poolStates, strict=True), key=lambda item: item[1].liquidity)
+        return Pool(
+            address=poolMetadata.address,
+            token0=poolMetadata.token0,
+            token1=poolMetadata.token1,
+            fee=poolMetadata.fee,
+            tickSpacing=poolMetadata.tickSpacing,
+            liquidity=poolState.liquidity,
+            sqrtPriceX96=poolState.sqrtPriceX96,
+            tick=poolState.tick,
+        )
 
-        # Ensure poolAddress is treated as binary literal if it's a hex string
-        poolAddressLiteral = f"X'{poolAddress[2:]}'" if poolAddress.startswith('0x') else f"'{poolAddress}'"
+    async def warm_up(self, tokenPairs: list[tuple[str, str]]) -> None:
+        # Loads the pool metadata (cached for the life of the client) and live state of every pool for each pair before the first read needs them
+        await asyncio.gather(*[self.get_pool(token0Address=token0Address, token1Address=token1Address) for token0Address, token1Address in tokenPairs])
 
+    def _calculate_fee_growth(self, swaps: pa.Table, token0Decimals: int, token1Decimals: int) -> float:
         # Calculate fee growth in USD per unit of liquidity
         # Price P (Token1/Token0) = (sqrtPriceX96 / 2^96)^2 * 10^(dec0 - dec1)
         # We assume Token1 is the quote asset (e.g. USDC) and Token0 is base (e.g. WETH)
         # If amount0 > 0 (input is Token0): FeeUSD = amount0 * P / 10^dec0
         # If amount1 > 0 (input is Token1): FeeUSD = amount1 / 10^dec1
-        # Note: amount0/amount1 are raw integers.
         # We sum (FeeUSD / Liquidity) for all swaps.
+        liquidities = pc.cast(swaps.column('liquidity'), pa.float64()).to_numpy()
+        amounts0 = pc.cast(swaps.column('amount0'), pa.float64()).to_numpy()
+        amounts1 = pc.cast(swaps.column('amount1'), pa.float64()).to_numpy()
+        prices = self._get_raw_prices(swaps=swaps) * 10 ** (token0Decimals - token1Decimals)
+        hasLiquidity = liquidities > 0
+        liquidities = np.where(hasLiquidity, liquidities, 1.0)
+        feeGrowths = np.where(
+            amounts0 > 0,
+            amounts0 / 10**token0Decimals * prices / liquidities,
+            np.where(amounts1 > 0, amounts1 / 10**token1Decimals / liquidities, 0.0),
+        )
+        return float(np.sum(feeGrowths[hasLiquidity]))
 
-        decimalAdjustment = 10 ** (token0Decimals - token1Decimals)
-
-        sql = f"""
-        SELECT
-            SUM(
-                CASE
-                    WHEN CAST(event."amount0" AS DOUBLE) > 0 THEN
-                        (CAST(event."amount0" AS DOUBLE) / POWER(10, {token0Decimals}) *
-                         POWER(CAST(event."sqrtPriceX96" AS DOUBLE) / 79228162514264337593543950336.0, 2) * {decimalAdjustment}) /
-                        CAST(event."liquidity" AS DOUBLE)
-                    WHEN CAST(event."amount1" AS DOUBLE) > 0 THEN
-                        (CAST(event."amount1" AS DOUBLE) / POWER(10, {token1Decimals})) /
-                        CAST(event."liquidity" AS DOUBLE)
-                    ELSE 0
-                END
-            ) as fee_growth_usd
-        FROM "{self.ampDatasetName}".event__swap
-        WHERE
-            pool_address = {poolAddressLiteral}
-            AND timestamp > TIMESTAMP '{timestampCutoff}'
-            AND CAST(event."liquidity" AS DOUBLE) > 0
-        """
-
-        results = [row async for row in self.ampClient.execute_sql(sql)]
-        if not results:
-            return 0.0
-
-        return float(cast(float, results[0].get('fee_growth_usd', 0.0)))
+    async def get_pool_fee_growth(self, poolAddress: str, hoursBack: int = 168, token0Decimals: int = 18, token1Decimals: int = 6) -> float:
+        swaps = await self._read_pool_swaps(poolAddress=poolAddress, hoursBack=hoursBack)
+        return self._calculate_fee_growth(swaps=swaps, token0Decimals=token0Decimals, token1Decimals=token1Decimals)
+
+    async def get_pool_analytics(self, poolAddress: str, token0Decimals: int = 18, token1Decimals: int = 6) -> PoolAnalytics:
+        """Compute the current price, 24h and 7d volatility and 7d fee growth from a single read of the pool's last 7 days of swaps."""
+        swaps7d = await self._read_pool_swaps(poolAddress=poolAddress, hoursBack=168)
+        # The 24h window is the tail of the 7d one, swaps are sorted by block so it is a zero-copy slice
+        swaps24h = swaps7d.slice(offset=int(np.searchsorted(swaps7d.column('timestamp').to_numpy(), int(time.time()) - 24 * 3600, side='right')))
+        currentPrice = 0.0
+        if swaps7d.num_rows > 0:
+            latestSqrtPriceX96 = int(swaps7d.column('sqrtPriceX96')[swaps7d.num_rows - 1].as_py())
+            currentPrice = self.calculate_price_from_sqrt_price_x96(latestSqrtPriceX96, token0Decimals, token1Decimals)
+        return PoolAnalytics(
+            currentPrice=currentPrice,
+            volatility24h=self._calculate_volatility_data(swaps=swaps24h, hoursBack=24),
+            volatility7d=self._calculate_volatility_data(swaps=swaps7d, hoursBack=168),
+            feeGrowth7d=self._calculate_fee_growth(swaps=swaps7d, token0Decimals=token0Decimals, token1Decimals=token1Decimals),
+        )
 
     def calculate_volatility(self, swaps: list[SwapEvent]) -> float:
         if len(swaps) < MIN_DATA_POINTS:
@@ -360,80 +509,95 @@ class UniswapDataClient:
         annualizedVol = stdDev * annualizationFactor
         return annualizedVol
 
-    async def get_wallet_positions(self, walletAddress: str) -> list[WalletPosition]:
-        """Get all active Uniswap V3 positions for a wallet with token balances."""
-        walletAddressNormalized = chain_util.normalize_address(walletAddress)
-
-        # Step 1: Get currently owned position token IDs (check latest transfer event for each token)
-        sql_positions = f"""
-        WITH latest_transfers AS (
-            SELECT
-                event."tokenId" as token_id,
-                event."to" as current_owner,
-                ROW_NUMBER() OVER (PARTITION BY event."tokenId" ORDER BY block_num DESC, log_index DESC) as rn
-            FROM "{self.ampDatasetName}".event__position_manager_transfer
+    async def get_wallet_position_token_ids(self, walletAddress: str) -> list[int]:
+        tokenIds: list[int] = []
+        # Pages through the owned token ids in order so wallets with many positions aren't cut off
+        while True:
+            query = WALLET_POSITION_TOKEN_IDS_QUERY.bind(walletAddress=address_parameter(address=walletAddress), afterTokenId=tokenIds[-1] if tokenIds else 0)
+            pageTokenIds = [int(cast(int, row.get('token_id', 0))) async for row in self.ampClient.execute_sql(query=query)]
+            tokenIds += pageTokenIds
+            if len(pageTokenIds) < POSITION_TOKEN_IDS_PAGE_SIZE:
+                return tokenIds
+
+    async def get_position_values(self, positionRanges: list[PositionRange]) -> list[PositionValue]:
+        """Value positions and their uncollected fees from one batched read of their pools, ticks and position state."""
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[constants.BASE_CHAIN_ID]
+        poolAddresses = sorted({chain_util.normalize_address(positionRange.poolAddress) for positionRange in positionRanges})
+        poolFunctionNames = ['slot0', 'feeGrowthGlobal0X128', 'feeGrowthGlobal1X128']
+        poolCalls = [ContractCall(toAddress=poolAddress, contractAbi=UNISWAP_V3_POOL_ABI, functionName=functionName) for poolAddress in poolAddresses for functionName in poolFunctionNames]
+        positionCalls = [
+            call
+            for positionRange in positionRanges
+            for call in (
+                ContractCall(toAddress=positionManagerAddress, contractAbi=UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI, functionName='positions', arguments={'tokenId': positionRange.tokenId}),
+                ContractCall(toAddress=positionRange.poolAddress, contractAbi=UNISWAP_V3_POOL_ABI, functionName='ticks', arguments={'tick': positionRange.tickLower}),
+                ContractCall(toAddress=positionRange.poolAddress, contractAbi=UNISWAP_V3_POOL_ABI, functionName='ticks', arguments={'tick': positionRange.tickUpper}),
+            )
+        ]
+        results = await self.multicallClient.call_all(calls=[*poolCalls, *positionCalls])
+        poolResults = {poolAddress: results[index * len(poolFunctionNames) : (index + 1) * len(poolFunctionNames)] for index, poolAddress in enumerate(poolAddresses)}
+        positionResults = results[len(poolCalls) :]
+        positionValues = []
+        for index, positionRange in enumerate(positionRanges):
+            slot0Response, feeGrowthGlobal0Response, feeGrowthGlobal1Response = poolResults[chain_util.normalize_address(positionRange.poolAddress)]
+            # positions() returns (..., liquidity, feeGrowthInside0LastX128, feeGrowthInside1LastX128, tokensOwed0, tokensOwed1) and ticks() has feeGrowthOutside0X128, feeGrowthOutside1X128 at 2 and 3
+            positionResponse, lowerTickResponse, upperTickResponse = positionResults[index * 3 : (index + 1) * 3]
+            sqrtPriceX96 = int(slot0Response[0])
+            tick = int(slot0Response[1])
+            liquidity = int(positionResponse[7])
+            amount0, amount1 = uniswap_math.get_position_amounts(sqrtPriceX96=sqrtPriceX96, tickLower=positionRange.tickLower, tickUpper=positionRange.tickUpper, liquidity=liquidity)
+            feeGrowthInside0X128 = uniswap_math.get_fee_growth_inside(tickCurrent=tick, tickLower=positionRange.tickLower, tickUpper=positionRange.tickUpper, feeGrowthGlobalX128=int(feeGrowthGlobal0Response[0]), feeGrowthOutsideLowerX128=int(lowerTickResponse[2]), feeGrowthOutsideUpperX128=int(upperTickResponse[2]))
+            feeGrowthInside1X128 = uniswap_math.get_fee_growth_inside(tickCurrent=tick, tickLower=positionRange.tickLower, tickUpper=positionRange.tickUpper, feeGrowthGlobalX128=int(feeGrowthGlobal1Response[0]), feeGrowthOutsideLowerX128=int(lowerTickResponse[3]), feeGrowthOutsideUpperX128=int(upperTickResponse[3]))
+            positionValues.append(
+                PositionValue(
+                    tokenId=positionRange.tokenId,
+                    liquidity=liquidity,
+                    amount0=amount0,
+                    amount1=amount1,
+                    uncollectedFees0=uniswap_math.get_uncollected_fees(liquidity=liquidity, feeGrowthInsideX128=feeGrowthInside0X128, feeGrowthInsideLastX128=int(positionResponse[8]), tokensOwed=int(positionResponse[10])),
+                    uncollectedFees1=uniswap_math.get_uncollected_fees(liquidity=liquidity, feeGrowthInsideX128=feeGrowthInside1X128, feeGrowthInsideLastX128=int(positionResponse[9]), tokensOwed=int(positionResponse[11])),
+                )
+            )
+        return positionValues
+
+    async def get_wallet_positions(self, walletAddress: str, tokenIds: list[int] | None = None) -> list[WalletPosition]:
+        """Get all active Uniswap V3 positions for a wallet with their current token amounts and uncollected fees."""
+        # Callers that track ownership themselves pass the token ids, otherwise they are looked up in Amp
+        if tokenIds is None:
+            tokenIds = await self.get_wallet_position_token_ids(walletAddress=walletAddress)
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[constants.BASE_CHAIN_ID]
+        positionManagerPositions = await self.multicallClient.get_positions(positionManagerAddress=positionManagerAddress, tokenIds=tokenIds)
+        activePositions = []
+        for positionManagerPosition in positionManagerPositions:
+            # Only include positions that still hold liquidity
+            if positionManagerPosition.liquidity == 0:
+                continue
+            poolMetadatas = await self.get_pool_metadatas(token0Address=positionManagerPosition.token0, token1Address=positionManagerPosition.token1)
+            poolMetadata = next((poolMetadata for poolMetadata in poolMetadatas if poolMetadata.fee == positionManagerPosition.fee), None)
+            if poolMetadata is None:
+                logging.warning(f'[UNISWAP] Could not find pool for position {positionManagerPosition.tokenId}')
+                continue
+            activePositions.append((positionManagerPosition, poolMetadata.address))
+        positionValues = await self.get_position_values(
+            positionRanges=[
+                PositionRange(tokenId=positionManagerPosition.tokenId, poolAddress=poolAddress, tickLower=positionManagerPosition.tickLower, tickUpper=positionManagerPosition.tickUpper)
+                for positionManagerPosition, poolAddress in activePositions
+            ]
         )
-        SELECT DISTINCT token_id
-        FROM latest_transfers
-        WHERE rn = 1 AND current_owner = {walletAddressNormalized}
-        LIMIT 100
-        """
-
-        token_ids = [int(cast(int, row.get('token_id', 0))) async for row in self.ampClient.execute_sql(sql_positions)]
-
-        if not token_ids:
-            return []
-
-        # Step 2: For each token ID, get latest amounts (only non-zero positions)
-        positions = []
-        for token_id in token_ids:
-            # Check if there are any DecreaseLiquidity events - if so, position might be closed
-            sql_amounts = f"""
-            WITH increase_events AS (
-                SELECT
-                    CAST(event."amount0" AS BIGINT) as amount0,
-                    CAST(event."amount1" AS BIGINT) as amount1,
-                    block_num,
-                    log_index
-                FROM "{self.ampDatasetName}".event__position_manager_increase_liquidity
-                WHERE event."tokenId" = {token_id}
-            ),
-            decrease_events AS (
-                SELECT
-                    -CAST(event."amount0" AS BIGINT) as amount0,
-                    -CAST(event."amount1" AS BIGINT) as amount1,
-                    block_num,
-                    log_index
-                FROM "{self.ampDatasetName}".event__position_manager_decrease_liquidity
-                WHERE event."tokenId" = {token_id}
-            ),
-            all_events AS (
-                SELECT * FROM increase_events
-                UNION ALL
-                SELECT * FROM decrease_events
+        return [
+            WalletPosition(
+                tokenId=positionManagerPosition.tokenId,
+                poolAddress=poolAddress,
+                token0=positionManagerPosition.token0,
+                token1=positionManagerPosition.token1,
+                fee=positionManagerPosition.fee,
+                tickLower=positionManagerPosition.tickLower,
+                tickUpper=positionManagerPosition.tickUpper,
+                liquidity=positionValue.liquidity,
+                amount0=positionValue.amount0,
+                amount1=positionValue.amount1,
+                uncollectedFees0=positionValue.uncollectedFees0,
+                uncollectedFees1=positionValue.uncollectedFees1,
             )
-            SELECT
-                SUM(amount0) as total_amount0,
-                SUM(amount1) as total_amount1
-            FROM all_events
-            """
-
-            async for row in self.ampClient.execute_sql(sql_amounts):
-                total_amount0 = int(cast(int, row.get('total_amount0', 0)))
-                total_amount1 = int(cast(int, row.get('total_amount1', 0)))
-
-                # Only include positions with non-zero amounts
-                if total_amount0 > 0 or total_amount1 > 0:
-                    positions.append(
-                        WalletPosition(
-                            tokenId=token_id,
-                            poolAddress='',  # Will fetch on-chain
-                            token0='',  # Will fetch on-chain
-                            token1='',  # Will fetch on-chain
-                            amount0=total_amount0,
-                            amount1=total_amount1,
-                        )
-                    )
-                break
-
-        return positions
+            for (positionManagerPosition, poolAddress), positionValue in zip(activePositions, positionValues, strict=True)
+        ]
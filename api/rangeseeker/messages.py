@@ -0,0 +1,15 @@
+from core.queues.model import MessageContent
+
+
+class RebalanceAgentMessageContent(MessageContent):
+    _COMMAND = 'REBALANCE_AGENT'
+    agentId: str
+    userId: str
+    tick: int
+
+
+class ExitAgentToStableMessageContent(MessageContent):
+    _COMMAND = 'EXIT_AGENT_TO_STABLE'
+    agentId: str
+    userId: str
+    tick: int
@@ -52,6 +52,49 @@ class AgentWallet(BaseModel):
     delegatedSmartWallet: str | None
 
 
+class AgentPosition(BaseModel):
+    agentPositionId: str
+    createdDate: datetime.datetime
+    updatedDate: datetime.datetime
+    agentId: str
+    walletAddress: str
+    tokenId: int
+    poolAddress: str
+    tickLower: int
+    tickUpper: int
+    liquidity: int
+    mintBlockNumber: int | None
+
+
+class WalletAllowance(BaseModel):
+    walletAllowanceId: str
+    createdDate: datetime.datetime
+    updatedDate: datetime.datetime
+    walletAddress: str
+    assetAddress: str
+    spenderAddress: str
+    amount: int
+
+
+class AgentLease(BaseModel):
+    agentLeaseId: str
+    createdDate: datetime.datetime
+    updatedDate: datetime.datetime
+    agentId: str
+    workerId: str | None
+    expiryDate: datetime.datetime | None
+    executionId: str | None
+    executionExpiryDate: datetime.datetime | None
+
+
+class WorkerHeartbeat(BaseModel):
+    workerHeartbeatId: str
+    createdDate: datetime.datetime
+    updatedDate: datetime.datetime
+    workerId: str
+    heartbeatDate: datetime.datetime
+
+
 class Asset(BaseModel):
     assetId: str
     createdDate: datetime.datetime
@@ -88,6 +131,9 @@ class UniswapPosition(BaseModel):
     token0ValueUsd: float
     token1ValueUsd: float
     totalValueUsd: float
+    token0UncollectedFees: int = 0
+    token1UncollectedFees: int = 0
+    uncollectedFeesValueUsd: float = 0.0
     tickLower: int | None = None
     tickUpper: int | None = None
 
@@ -99,6 +145,12 @@ class Wallet(BaseModel):
     delegatedSmartWallet: str | None
 
 
+class WalletSnapshot(BaseModel):
+    blockNumber: int
+    positionTokenIds: list[int]
+    wallet: Wallet
+
+
 class PreviewDeposit(BaseModel):
     swapDescription: str
     depositDescription: str
@@ -0,0 +1,29 @@
+import asyncio
+
+from core.util import chain_util
+
+from rangeseeker.external.batching_eth_client import BatchingRestEthClient
+
+
+class NonceManager:
+    # Hands out consecutive nonces per wallet so a run of transactions can be signed and broadcast back-to-back
+    # instead of each one waiting for the previous one to be mined. The pending count, which includes transactions
+    # still in the mempool, is read from chain the first time a wallet is used and the local counter is dropped with
+    # reset() once the run is mined (or fails), so a nonce that was reserved but never broadcast can't leave a gap
+    # that blocks the wallet.
+    def __init__(self, ethClient: BatchingRestEthClient) -> None:
+        self.ethClient = ethClient
+        self._nextNonces: dict[str, int] = {}
+        self._walletLocks: dict[str, asyncio.Lock] = {}
+
+    async def reserve_nonce(self, walletAddress: str) -> int:
+        walletAddress = chain_util.normalize_address(value=walletAddress)
+        async with self._walletLocks.setdefault(walletAddress, asyncio.Lock()):
+            nonce = self._nextNonces.get(walletAddress)
+            if nonce is None:
+                nonce = await self.ethClient.get_pending_transaction_count(address=walletAddress)
+            self._nextNonces[walletAddress] = nonce + 1
+            return nonce
+
+    def reset(self, walletAddress: str) -> None:
+        self._nextNonces.pop(chain_util.normalize_address(value=walletAddress), None)
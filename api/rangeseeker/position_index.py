@@ -0,0 +1,103 @@
+import bisect
+import dataclasses
+
+from core.util import chain_util
+
+# Matches the worker's rule of rebalancing once the tick is within 10% of either edge of the range
+DEFAULT_EDGE_BAND_FRACTION = 0.1
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexedPosition:
+    agentId: str
+    tokenId: int
+    poolAddress: str
+    tickLower: int
+    tickUpper: int
+    edgeBandFraction: float = DEFAULT_EDGE_BAND_FRACTION
+
+    @property
+    def safeTickLower(self) -> float:
+        return self.tickLower + (self.tickUpper - self.tickLower) * self.edgeBandFraction
+
+    @property
+    def safeTickUpper(self) -> float:
+        return self.tickUpper - (self.tickUpper - self.tickLower) * self.edgeBandFraction
+
+
+class _PoolPositionIntervals:
+    # Each position is stored twice, once ordered by the lower edge of its safe band and once by the upper edge.
+    # A tick then needs a rebalance for every position whose safe lower is above it or whose safe upper is below it,
+    # both of which are a single bisect into a sorted list.
+    def __init__(self) -> None:
+        self.positionsBySafeLower: list[IndexedPosition] = []
+        self.positionsBySafeUpper: list[IndexedPosition] = []
+
+    def add(self, position: IndexedPosition) -> None:
+        bisect.insort(self.positionsBySafeLower, position, key=lambda p: p.safeTickLower)
+        bisect.insort(self.positionsBySafeUpper, position, key=lambda p: p.safeTickUpper)
+
+    def remove(self, position: IndexedPosition) -> None:
+        self.positionsBySafeLower.remove(position)
+        self.positionsBySafeUpper.remove(position)
+
+    def get_positions_to_rebalance(self, tick: int) -> list[IndexedPosition]:
+        lowerIndex = bisect.bisect_right(self.positionsBySafeLower, tick, key=lambda p: p.safeTickLower)
+        upperIndex = bisect.bisect_left(self.positionsBySafeUpper, tick, key=lambda p: p.safeTickUpper)
+        return self.positionsBySafeLower[lowerIndex:] + self.positionsBySafeUpper[:upperIndex]
+
+    def get_positions_crossed(self, fromTick: int, toTick: int) -> list[IndexedPosition]:
+        # A move can only have crossed the positions whose safe band edge (in the direction of the move) lies between the two ticks
+        if toTick < fromTick:
+            startIndex = bisect.bisect_right(self.positionsBySafeLower, toTick, key=lambda p: p.safeTickLower)
+            endIndex = bisect.bisect_right(self.positionsBySafeLower, fromTick, key=lambda p: p.safeTickLower)
+            return self.positionsBySafeLower[startIndex:endIndex]
+        startIndex = bisect.bisect_left(self.positionsBySafeUpper, fromTick, key=lambda p: p.safeTickUpper)
+        endIndex = bisect.bisect_left(self.positionsBySafeUpper, toTick, key=lambda p: p.safeTickUpper)
+        return self.positionsBySafeUpper[startIndex:endIndex]
+
+    def __len__(self) -> int:
+        return len(self.positionsBySafeLower)
+
+
+class PositionTickIndex:
+    def __init__(self) -> None:
+        self._poolIntervals: dict[str, _PoolPositionIntervals] = {}
+        self._agentPositions: dict[str, list[IndexedPosition]] = {}
+
+    def get_agent_positions(self, agentId: str) -> list[IndexedPosition]:
+        return list(self._agentPositions.get(agentId, []))
+
+    def set_agent_positions(self, agentId: str, positions: list[IndexedPosition]) -> None:
+        self.remove_agent(agentId=agentId)
+        self._agentPositions[agentId] = []
+        for position in positions:
+            normalizedPosition = dataclasses.replace(position, poolAddress=chain_util.normalize_address(position.poolAddress))
+            self._poolIntervals.setdefault(normalizedPosition.poolAddress, _PoolPositionIntervals()).add(position=normalizedPosition)
+            self._agentPositions[agentId].append(normalizedPosition)
+
+    def remove_agent(self, agentId: str) -> None:
+        for position in self._agentPositions.pop(agentId, []):
+            poolIntervals = self._poolIntervals[position.poolAddress]
+            poolIntervals.remove(position=position)
+            if len(poolIntervals) == 0:
+                del self._poolIntervals[position.poolAddress]
+
+    def clear(self) -> None:
+        self._poolIntervals = {}
+        self._agentPositions = {}
+
+    def get_positions_to_rebalance(self, poolAddress: str, tick: int) -> list[IndexedPosition]:
+        poolIntervals = self._poolIntervals.get(chain_util.normalize_address(poolAddress))
+        if poolIntervals is None:
+            return []
+        return poolIntervals.get_positions_to_rebalance(tick=tick)
+
+    def get_agent_ids_to_rebalance(self, poolAddress: str, tick: int) -> set[str]:
+        return {position.agentId for position in self.get_positions_to_rebalance(poolAddress=poolAddress, tick=tick)}
+
+    def get_agent_ids_crossed(self, poolAddress: str, fromTick: int, toTick: int) -> set[str]:
+        poolIntervals = self._poolIntervals.get(chain_util.normalize_address(poolAddress))
+        if poolIntervals is None or fromTick == toTick:
+            return set()
+        return {position.agentId for position in poolIntervals.get_positions_crossed(fromTick=fromTick, toTick=toTick)}
@@ -0,0 +1,160 @@
+import uuid
+
+import sqlalchemy
+from core import logging
+from core.store.database import Database
+from core.store.database import DatabaseConnection
+from core.util import chain_util
+from core.util import date_util
+from core.web3.eth_client import RestEthClient
+from sqlalchemy.dialects import postgresql as sqlalchemy_psql
+from web3.types import LogReceipt
+
+from rangeseeker import constants
+from rangeseeker.external.uniswap_data_client import MAX_LOG_BLOCK_RANGE
+from rangeseeker.external.uniswap_data_client import UniswapDataClient
+from rangeseeker.store import schema
+from rangeseeker.uniswap_abis import UNISWAP_V3_POSITION_MANAGER_TRANSFER_EVENT_TOPIC
+
+POSITION_OWNERSHIP_CURSOR_NAME = 'position-ownership'
+# Every sync re-reads this many blocks before the cursor, comfortably deeper than reorgs on Base
+REORG_REWIND_BLOCKS = 20
+# The first sync seeds ownership from Amp, whose data can be a few minutes behind the chain, and reads logs from this far back
+SEED_REWIND_BLOCKS = 300
+# Lookups rely on the worker's periodic sync and only sync themselves when the index has fallen further behind than this
+# (about 90 seconds of Base blocks, longer than the worker's sync interval)
+OWNERSHIP_MAX_CURSOR_LAG_BLOCKS = 45
+# Serializes syncs between processes, any constant unique to this index will do
+POSITION_OWNERSHIP_LOCK_KEY = 7150019
+
+
+class PositionOwnershipManager:
+    # Keeps a local index of the position NFTs our agent wallets own, built from the position manager's Transfer logs
+    # by block cursor. Each sync replaces everything it stored for the last REORG_REWIND_BLOCKS blocks with what the
+    # chain now says, so transfers dropped by a reorg disappear, and ownership lookups become a query on our own database
+    # instead of a window scan over every position manager transfer on Base.
+    def __init__(self, database: Database, ethClient: RestEthClient, uniswapClient: UniswapDataClient) -> None:
+        self.database = database
+        self.ethClient = ethClient
+        self.uniswapClient = uniswapClient
+
+    async def _list_agent_wallet_addresses(self) -> set[str]:
+        result = await self.database.execute(query=sqlalchemy.select(schema.AgentWalletsTable.c.walletAddress))
+        return {chain_util.normalize_address(value=walletAddress) for (walletAddress,) in result}
+
+    async def _get_cursor_block_number(self, connection: DatabaseConnection | None = None) -> int | None:
+        query = sqlalchemy.select(schema.BlockCursorsTable.c.blockNumber).where(schema.BlockCursorsTable.c.name == POSITION_OWNERSHIP_CURSOR_NAME)
+        result = await self.database.execute(query=query, connection=connection)
+        blockNumber = result.scalar_one_or_none()
+        return int(blockNumber) if blockNumber is not None else None
+
+    @staticmethod
+    def _transfer_row_from_log(log: LogReceipt) -> dict[str, str | int]:
+        # Transfer's from, to and tokenId are all indexed so everything is in the topics
+        return {
+            schema.PositionTransfersTable.c.tokenId.key: int.from_bytes(bytes(log['topics'][3]), 'big'),
+            schema.PositionTransfersTable.c.fromAddress.key: chain_util.normalize_address(value=f'0x{bytes(log["topics"][1]).hex()}'),
+            schema.PositionTransfersTable.c.toAddress.key: chain_util.normalize_address(value=f'0x{bytes(log["topics"][2]).hex()}'),
+            schema.PositionTransfersTable.c.blockNumber.key: int(log['blockNumber']),
+            schema.PositionTransfersTable.c.logIndex.key: int(log['logIndex']),
+        }
+
+    async def _apply_transfers(self, startBlockNumber: int, endBlockNumber: int, transferRows: list[dict[str, str | int]]) -> None:
+        table = schema.PositionTransfersTable
+        currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+        async with self.database.create_transaction() as connection:
+            await self.database.execute(query=sqlalchemy.select(sqlalchemy.func.pg_advisory_xact_lock(POSITION_OWNERSHIP_LOCK_KEY)), connection=connection)
+            cursorBlockNumber = await self._get_cursor_block_number(connection=connection)
+            if cursorBlockNumber is not None and cursorBlockNumber >= endBlockNumber:
+                # Another process has already synced at least this far
+                return
+            await self.database.execute(query=table.delete().where(table.c.blockNumber >= startBlockNumber), connection=connection)  # type: ignore[arg-type]
+            if len(transferRows) > 0:
+                insertQuery = sqlalchemy_psql.insert(table).values(
+                    [{table.c.positionTransferId.key: uuid.uuid4(), table.c.createdDate.key: currentDate, table.c.updatedDate.key: currentDate, **transferRow} for transferRow in transferRows]
+                )
+                await self.database.execute(query=insertQuery.on_conflict_do_nothing(), connection=connection)  # type: ignore[arg-type]
+            cursorQuery = sqlalchemy_psql.insert(schema.BlockCursorsTable).values(
+                {
+                    schema.BlockCursorsTable.c.blockCursorId.key: uuid.uuid4(),
+                    schema.BlockCursorsTable.c.createdDate.key: currentDate,
+                    schema.BlockCursorsTable.c.updatedDate.key: currentDate,
+                    schema.BlockCursorsTable.c.name.key: POSITION_OWNERSHIP_CURSOR_NAME,
+                    schema.BlockCursorsTable.c.blockNumber.key: endBlockNumber,
+                }
+            )
+            cursorQuery = cursorQuery.on_conflict_do_update(
+                index_elements=[schema.BlockCursorsTable.c.name],
+                set_={schema.BlockCursorsTable.c.blockNumber: endBlockNumber, schema.BlockCursorsTable.c.updatedDate: currentDate},
+            )
+            await self.database.execute(query=cursorQuery, connection=connection)  # type: ignore[arg-type]
+
+    async def _seed(self, walletAddresses: set[str], latestBlockNumber: int) -> None:
+        # Positions owned before the index existed are recorded as transfers at block 0, which a rewind never reaches
+        logging.info(f'[POSITION_OWNERSHIP] Seeding ownership of {len(walletAddresses)} agent wallets from Amp')
+        transferRows: list[dict[str, str | int]] = []
+        for walletAddress in sorted(walletAddresses):
+            for tokenId in await self.uniswapClient.get_wallet_position_token_ids(walletAddress=walletAddress):
+                transferRows.append(
+                    {
+                        schema.PositionTransfersTable.c.tokenId.key: tokenId,
+                        schema.PositionTransfersTable.c.fromAddress.key: chain_util.BURN_ADDRESS,
+                        schema.PositionTransfersTable.c.toAddress.key: walletAddress,
+                        schema.PositionTransfersTable.c.blockNumber.key: 0,
+                        schema.PositionTransfersTable.c.logIndex.key: 0,
+                    }
+                )
+        seedBlockNumber = max(latestBlockNumber - SEED_REWIND_BLOCKS, 1)
+        # Nothing after the seed block is stored yet, the first sync reads those blocks' logs
+        await self._apply_transfers(startBlockNumber=seedBlockNumber + 1, endBlockNumber=seedBlockNumber, transferRows=transferRows)
+
+    async def sync(self) -> None:
+        """Ingest the position manager transfers involving agent wallets since the cursor, re-reading the last few blocks."""
+        walletAddresses = await self._list_agent_wallet_addresses()
+        latestBlockNumber = await self.ethClient.get_latest_block_number()
+        cursorBlockNumber = await self._get_cursor_block_number()
+        if cursorBlockNumber is None:
+            await self._seed(walletAddresses=walletAddresses, latestBlockNumber=latestBlockNumber)
+            cursorBlockNumber = await self._get_cursor_block_number()
+        if cursorBlockNumber is None or latestBlockNumber <= cursorBlockNumber:
+            return
+        startBlockNumber = max(cursorBlockNumber - REORG_REWIND_BLOCKS + 1, 1)
+        positionManagerAddress = constants.CHAIN_UNISWAP_V3_NONFUNGIBLE_POSITION_MANAGER_MAP[constants.BASE_CHAIN_ID]
+        transferRows: list[dict[str, str | int]] = []
+        for chunkStartBlockNumber in range(startBlockNumber, latestBlockNumber + 1, MAX_LOG_BLOCK_RANGE):
+            chunkEndBlockNumber = min(chunkStartBlockNumber + MAX_LOG_BLOCK_RANGE - 1, latestBlockNumber)
+            logs = await self.ethClient.get_log_entries(topics=[UNISWAP_V3_POSITION_MANAGER_TRANSFER_EVENT_TOPIC], startBlockNumber=chunkStartBlockNumber, endBlockNumber=chunkEndBlockNumber, address=positionManagerAddress)
+            for log in logs:
+                transferRow = self._transfer_row_from_log(log=log)
+                if transferRow[schema.PositionTransfersTable.c.fromAddress.key] in walletAddresses or transferRow[schema.PositionTransfersTable.c.toAddress.key] in walletAddresses:
+                    transferRows.append(transferRow)
+        await self._apply_transfers(startBlockNumber=startBlockNumber, endBlockNumber=latestBlockNumber, transferRows=transferRows)
+        logging.info(f'[POSITION_OWNERSHIP] Synced blocks {startBlockNumber} to {latestBlockNumber}, {len(transferRows)} agent wallet transfers')
+
+    async def get_owned_token_ids(self, walletAddress: str, maxLagBlocks: int = OWNERSHIP_MAX_CURSOR_LAG_BLOCKS) -> list[int]:
+        """Return the position token ids the wallet currently owns, from the local index for agent wallets and from Amp otherwise.
+
+        The index is synced first if it is more than maxLagBlocks behind the chain head, callers about to act on the
+        result (withdrawing, rebalancing, recording positions) pass 0 so a position minted moments ago isn't missed.
+        """
+        walletAddress = chain_util.normalize_address(value=walletAddress)
+        if walletAddress not in await self._list_agent_wallet_addresses():
+            return await self.uniswapClient.get_wallet_position_token_ids(walletAddress=walletAddress)
+        cursorBlockNumber = await self._get_cursor_block_number()
+        if cursorBlockNumber is None or await self.ethClient.get_latest_block_number() - cursorBlockNumber > maxLagBlocks:
+            logging.info(f'[POSITION_OWNERSHIP] Index is behind the chain (cursor {cursorBlockNumber}), syncing before lookup')
+            await self.sync()
+        table = schema.PositionTransfersTable
+        # A token is owned by whoever received its latest transfer, only tokens the wallet has ever received are ranked
+        latestTransfers = (
+            sqlalchemy.select(
+                table.c.tokenId,
+                table.c.toAddress,
+                sqlalchemy.func.row_number().over(partition_by=table.c.tokenId, order_by=(table.c.blockNumber.desc(), table.c.logIndex.desc())).label('rowNumber'),
+            )
+            .where(table.c.tokenId.in_(sqlalchemy.select(table.c.tokenId).where(table.c.toAddress == walletAddress)))
+            .subquery()
+        )
+        query = sqlalchemy.select(latestTransfers.c.tokenId).where(latestTransfers.c.rowNumber == 1).where(latestTransfers.c.toAddress == walletAddress).order_by(latestTransfers.c.tokenId)
+        result = await self.database.execute(query=query)
+        return [int(tokenId) for (tokenId,) in result]
@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+from collections.abc import Awaitable
+
+import sqlalchemy
+from core import logging
+from core.exceptions import KibaException
+from core.queues.message_queue_processor import MessageNeedsReprocessingException
+from core.queues.message_queue_processor import MessageProcessor
+from core.queues.model import Message
+from core.util import date_util
+from sqlalchemy.dialects import postgresql as sqlalchemy_psql
+
+from rangeseeker.app_manager import AppManager
+from rangeseeker.messages import ExitAgentToStableMessageContent
+from rangeseeker.messages import RebalanceAgentMessageContent
+from rangeseeker.store import schema
+from rangeseeker.strategy_compiler import ACTION_EXIT_TO_STABLE
+from rangeseeker.strategy_compiler import ACTION_NONE
+from rangeseeker.strategy_compiler import ACTION_REBALANCE
+
+REBALANCE_MAX_RETRY_COUNT = 3
+REBALANCE_RETRY_DELAY_SECONDS = 60
+# An executor that crashed mid-rebalance holds the agent's execution claim until it expires, a little after the rebalance would have timed out
+AGENT_EXECUTION_CLAIM_MARGIN_SECONDS = 60
+
+
+class RebalanceMessageProcessor(MessageProcessor):
+    def __init__(self, appManager: AppManager, rebalanceTimeoutSeconds: float) -> None:
+        self.appManager = appManager
+        self.rebalanceTimeoutSeconds = rebalanceTimeoutSeconds
+        self._inProgressAgentIds: set[str] = set()
+
+    async def process_message(self, message: Message) -> None:
+        if message.command == RebalanceAgentMessageContent.get_command():
+            messageContent = RebalanceAgentMessageContent.model_validate(message.content)
+            await self._process_agent_action(messageContent=messageContent, action=ACTION_REBALANCE, postCount=message.postCount or 1)
+            return
+        if message.command == ExitAgentToStableMessageContent.get_command():
+            exitMessageContent = ExitAgentToStableMessageContent.model_validate(message.content)
+            await self._process_agent_action(messageContent=exitMessageContent, action=ACTION_EXIT_TO_STABLE, postCount=message.postCount or 1)
+            return
+        raise KibaException(message='Message was unhandled')
+
+    async def _claim_agent_execution(self, agentId: str) -> str | None:
+        # Claims the agent's lease row for this execution unless another executor holds an unexpired claim, each statement
+        # runs in its own short transaction so no connection is held open for the length of the rebalance
+        leasesTable = schema.AgentLeasesTable
+        executionId = str(uuid.uuid4())
+        currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+        executionExpiryDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now(seconds=int(self.rebalanceTimeoutSeconds) + AGENT_EXECUTION_CLAIM_MARGIN_SECONDS))
+        claimQuery = (
+            sqlalchemy_psql.insert(leasesTable)
+            .values(
+                {
+                    leasesTable.c.agentLeaseId.key: uuid.uuid4(),
+                    leasesTable.c.createdDate.key: currentDate,
+                    leasesTable.c.updatedDate.key: currentDate,
+                    leasesTable.c.agentId.key: agentId,
+                    leasesTable.c.executionId.key: executionId,
+                    leasesTable.c.executionExpiryDate.key: executionExpiryDate,
+                }
+            )
+            .on_conflict_do_update(
+                index_elements=[leasesTable.c.agentId],
+                set_={
+                    leasesTable.c.executionId.key: executionId,
+                    leasesTable.c.executionExpiryDate.key: executionExpiryDate,
+                    leasesTable.c.updatedDate.key: currentDate,
+                },
+                where=sqlalchemy.or_(leasesTable.c.executionExpiryDate.is_(None), leasesTable.c.executionExpiryDate < currentDate),
+            )
+            .returning(leasesTable.c.executionId)
+        )
+        async with self.appManager.database.create_transaction() as connection:
+            result = await self.appManager.database.execute(query=claimQuery, connection=connection)  # type: ignore[arg-type]
+            claimedExecutionId = result.scalar_one_or_none()
+        return executionId if claimedExecutionId == executionId else None
+
+    async def _release_agent_execution(self, agentId: str, executionId: str) -> None:
+        leasesTable = schema.AgentLeasesTable
+        releaseQuery = (
+            leasesTable.update()
+            .where(leasesTable.c.agentId == agentId)
+            .where(leasesTable.c.executionId == executionId)
+            .values({leasesTable.c.executionId: None, leasesTable.c.executionExpiryDate: None, leasesTable.c.updatedDate: date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())})
+        )
+        try:
+            async with self.appManager.database.create_transaction() as connection:
+                await self.appManager.database.execute(query=releaseQuery, connection=connection)  # type: ignore[arg-type]
+        except Exception as exception:  # noqa: BLE001
+            # The action has already run, the claim expires by itself so this isn't worth retrying the message for
+            logging.error(f'[REBALANCE_EXECUTOR] Failed to release execution claim on agent {agentId}: {exception}')
+
+    async def _process_agent_action(self, messageContent: RebalanceAgentMessageContent | ExitAgentToStableMessageContent, action: str, postCount: int) -> None:
+        agentId = messageContent.agentId
+        # Duplicate messages for an agent that is already being rebalanced are dropped, the running rebalance covers them
+        if agentId in self._inProgressAgentIds:
+            logging.info(f'[REBALANCE_EXECUTOR] Agent {agentId} is already being rebalanced by this executor, dropping message')
+            return
+        self._inProgressAgentIds.add(agentId)
+        try:
+            # The claim is held for the whole rebalance so executors in other processes skip the agent too
+            executionId = await self._claim_agent_execution(agentId=agentId)
+            if executionId is None:
+                logging.info(f'[REBALANCE_EXECUTOR] Agent {agentId} is already being rebalanced by another executor, dropping message')
+                return
+            try:
+                await self._run_agent_action_if_needed(messageContent=messageContent, action=action, postCount=postCount)
+            finally:
+                await self._release_agent_execution(agentId=agentId, executionId=executionId)
+        except Exception as exception:  # noqa: BLE001
+            # Every failure, including claiming the agent and looking it up, counts towards the retry limit
+            if postCount >= REBALANCE_MAX_RETRY_COUNT:
+                logging.error(f'[REBALANCE_EXECUTOR] Giving up on {action} for agent {agentId} after {postCount} attempts: {exception}')
+                logging.exception(exception)
+                return
+            logging.error(f'[REBALANCE_EXECUTOR] {action} for agent {agentId} failed on attempt {postCount}, retrying: {exception}')
+            raise MessageNeedsReprocessingException(
+                maxRetryCount=REBALANCE_MAX_RETRY_COUNT,
+                delaySeconds=REBALANCE_RETRY_DELAY_SECONDS,
+                originalException=exception if isinstance(exception, KibaException) else KibaException(message=str(exception)),
+            ) from exception
+        finally:
+            self._inProgressAgentIds.discard(agentId)
+
+    async def _run_agent_action_if_needed(self, messageContent: RebalanceAgentMessageContent | ExitAgentToStableMessageContent, action: str, postCount: int) -> None:
+        agentId = messageContent.agentId
+        # The message may be stale (a duplicate, or a retry after an earlier attempt succeeded), so evaluate the strategy against the latest market again
+        agent = await self.appManager.userManager.get_agent(userId=messageContent.userId, agentId=agentId)
+        snapshot = await self.appManager.get_market_snapshot()
+        currentAction = await self.appManager.get_agent_action(agent=agent, snapshot=snapshot)
+        # A rebalance that withdrew but then failed to mint leaves the agent without a position, which the range rule can't
+        # trigger on, so the retry still goes ahead and mints from the wallet's balances rather than leaving the funds idle
+        isUnfinishedRebalance = action == ACTION_REBALANCE and postCount > 1 and currentAction == ACTION_NONE and len(self.appManager.positionIndex.get_agent_positions(agentId=agentId)) == 0
+        if isUnfinishedRebalance:
+            logging.info(f'[REBALANCE_EXECUTOR] Agent {agentId} has no position after an earlier failed {action}, minting from its balances')
+        elif currentAction != action:
+            logging.info(f'[REBALANCE_EXECUTOR] Agent {agentId} no longer needs {action} (queued at tick {messageContent.tick}, now {snapshot.tick} with action {currentAction})')
+            return
+        actionCoroutine: Awaitable[None]
+        if action == ACTION_EXIT_TO_STABLE:
+            actionCoroutine = self.appManager.exit_agent_to_stable(userId=messageContent.userId, agentId=agentId)
+        else:
+            actionCoroutine = self.appManager.deposit_made_to_agent(userId=messageContent.userId, agentId=agentId)
+        logging.info(f'[REBALANCE_EXECUTOR] Running {action} for agent {agentId} (attempt {postCount})')
+        await asyncio.wait_for(actionCoroutine, timeout=self.rebalanceTimeoutSeconds)
+        logging.info(f'[REBALANCE_EXECUTOR] Successfully ran {action} for agent {agentId}')
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import uuid
+from collections.abc import Sequence
+
+import sqlalchemy
+from core.queues.message_queue import MessageQueue
+from core.queues.model import Message
+from core.store.database import Database
+from core.util import date_util
+
+from rangeseeker.store import schema
+
+
+class PostgresMessage(Message):  # type: ignore[explicit-any]
+    queueMessageId: str
+
+
+class PostgresMessageQueue(MessageQueue[PostgresMessage]):
+    # A durable stand-in for SqsMessageQueue for local development: messages are rows that become invisible
+    # for expectedProcessingSeconds when received, and are claimed with SKIP LOCKED so concurrent consumers
+    # never receive the same message.
+    def __init__(self, database: Database, queueName: str) -> None:
+        self.database = database
+        self.queueName = queueName
+
+    async def connect(self) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def send_message(self, message: Message, delaySeconds: int = 0) -> None:
+        await self.send_messages(messages=[message], delaySeconds=delaySeconds)
+
+    async def send_messages(self, messages: Sequence[Message], delaySeconds: int = 0) -> None:
+        currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+        visibleDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now(seconds=delaySeconds))
+        table = schema.QueueMessagesTable
+        async with self.database.create_transaction() as connection:
+            for message in messages:
+                message.prepare_for_send()
+                messageJson = message.model_dump(mode='json', include=set(Message.model_fields))
+                # Re-sent messages (e.g. for reprocessing) are rescheduled in place rather than duplicated
+                if isinstance(message, PostgresMessage):
+                    query = table.update().where(table.c.queueMessageId == uuid.UUID(message.queueMessageId)).values({table.c.messageJson: messageJson, table.c.visibleDate: visibleDate, table.c.updatedDate: currentDate})
+                else:
+                    query = table.insert().values(
+                        {
+                            table.c.queueMessageId: uuid.uuid4(),
+                            table.c.createdDate: currentDate,
+                            table.c.updatedDate: currentDate,
+                            table.c.queueName: self.queueName,
+                            table.c.messageJson: messageJson,
+                            table.c.visibleDate: visibleDate,
+                        }
+                    )
+                await self.database.execute(query=query, connection=connection)  # type: ignore[arg-type]
+
+    async def get_message(self, expectedProcessingSeconds: int = 300, longPollSeconds: int = 0) -> PostgresMessage | None:
+        messages = await self.get_messages(limit=1, expectedProcessingSeconds=expectedProcessingSeconds, longPollSeconds=longPollSeconds)
+        return messages[0] if messages else None
+
+    async def get_messages(self, limit: int = 1, expectedProcessingSeconds: int = 300, longPollSeconds: int = 0) -> list[PostgresMessage]:  # noqa: ARG002
+        currentDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now())
+        invisibleUntilDate = date_util.datetime_to_utc_naive_datetime(dt=date_util.datetime_from_now(seconds=expectedProcessingSeconds))
+        table = schema.QueueMessagesTable
+        async with self.database.create_transaction() as connection:
+            query = (
+                sqlalchemy.select(table.c.queueMessageId, table.c.messageJson)
+                .where(table.c.queueName == self.queueName)
+                .where(table.c.visibleDate <= currentDate)
+                .order_by(table.c.visibleDate.asc())
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            rows = list(await self.database.execute(query=query, connection=connection))
+            if len(rows) == 0:
+                return []
+            updateQuery = table.update().where(table.c.queueMessageId.in_([queueMessageId for (queueMessageId, _) in rows])).values({table.c.visibleDate: invisibleUntilDate, table.c.updatedDate: currentDate})
+            await self.database.execute(query=updateQuery, connection=connection)  # type: ignore[arg-type]
+        return [PostgresMessage(queueMessageId=str(queueMessageId), **messageJson) for (queueMessageId, messageJson) in rows]
+
+    async def delete_message(self, message: PostgresMessage) -> None:
+        table = schema.QueueMessagesTable
+        await self.database.execute(query=table.delete().where(table.c.queueMessageId == uuid.UUID(message.queueMessageId)))  # type: ignore[arg-type]
@@ -2,10 +2,14 @@ import sqlalchemy
 from sqlalchemy.dialects import postgresql as sqlalchemy_psql
 
 from rangeseeker.model import Agent
+from rangeseeker.model import AgentLease
+from rangeseeker.model import AgentPosition
 from rangeseeker.model import AgentWallet
 from rangeseeker.model import Strategy
 from rangeseeker.model import User
 from rangeseeker.model import UserWallet
+from rangeseeker.model import WalletAllowance
+from rangeseeker.model import WorkerHeartbeat
 from rangeseeker.store.entity_repository import EntityRepository
 
 metadata = sqlalchemy.MetaData()
@@ -84,3 +88,117 @@ AgentWalletsTable = sqlalchemy.Table(
 )
 
 AgentWalletsRepository = EntityRepository(table=AgentWalletsTable, modelClass=AgentWallet)
+
+
+AgentPositionsTable = sqlalchemy.Table(
+    'tbl_agent_positions',
+    metadata,
+    sqlalchemy.Column(key='agentPositionId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='agentId', name='agent_id', type_=sqlalchemy_psql.UUID, nullable=False),
+    sqlalchemy.Column(key='walletAddress', name='wallet_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='tokenId', name='token_id', type_=sqlalchemy.BigInteger, nullable=False),
+    sqlalchemy.Column(key='poolAddress', name='pool_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='tickLower', name='tick_lower', type_=sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column(key='tickUpper', name='tick_upper', type_=sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column(key='liquidity', name='liquidity', type_=sqlalchemy.Numeric(precision=78, scale=0), nullable=False),
+    sqlalchemy.Column(key='mintBlockNumber', name='mint_block_number', type_=sqlalchemy.BigInteger, nullable=True),
+    sqlalchemy.UniqueConstraint('tokenId', name='tbl_agent_positions_ux_token_id'),
+    sqlalchemy.Index('tbl_agent_positions_agent_id', 'agentId'),
+)
+
+AgentPositionsRepository = EntityRepository(table=AgentPositionsTable, modelClass=AgentPosition)
+
+
+WalletAllowancesTable = sqlalchemy.Table(
+    'tbl_wallet_allowances',
+    metadata,
+    sqlalchemy.Column(key='walletAllowanceId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='walletAddress', name='wallet_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='assetAddress', name='asset_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='spenderAddress', name='spender_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='amount', name='amount', type_=sqlalchemy.Numeric(precision=78, scale=0), nullable=False),
+    sqlalchemy.UniqueConstraint('walletAddress', 'assetAddress', 'spenderAddress', name='tbl_wallet_allowances_ux_wallet_asset_spender'),
+)
+
+WalletAllowancesRepository = EntityRepository(table=WalletAllowancesTable, modelClass=WalletAllowance)
+
+
+AgentLeasesTable = sqlalchemy.Table(
+    'tbl_agent_leases',
+    metadata,
+    sqlalchemy.Column(key='agentLeaseId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='agentId', name='agent_id', type_=sqlalchemy_psql.UUID, nullable=False),
+    sqlalchemy.Column(key='workerId', name='worker_id', type_=sqlalchemy.Text, nullable=True),
+    sqlalchemy.Column(key='expiryDate', name='expiry_date', type_=sqlalchemy.DateTime, nullable=True),
+    sqlalchemy.Column(key='executionId', name='execution_id', type_=sqlalchemy.Text, nullable=True),
+    sqlalchemy.Column(key='executionExpiryDate', name='execution_expiry_date', type_=sqlalchemy.DateTime, nullable=True),
+    sqlalchemy.UniqueConstraint('agentId', name='tbl_agent_leases_ux_agent_id'),
+    sqlalchemy.Index('tbl_agent_leases_worker_id', 'workerId'),
+)
+
+AgentLeasesRepository = EntityRepository(table=AgentLeasesTable, modelClass=AgentLease)
+
+
+WorkerHeartbeatsTable = sqlalchemy.Table(
+    'tbl_worker_heartbeats',
+    metadata,
+    sqlalchemy.Column(key='workerHeartbeatId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='workerId', name='worker_id', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='heartbeatDate', name='heartbeat_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.UniqueConstraint('workerId', name='tbl_worker_heartbeats_ux_worker_id'),
+)
+
+WorkerHeartbeatsRepository = EntityRepository(table=WorkerHeartbeatsTable, modelClass=WorkerHeartbeat)
+
+
+# Backs PostgresMessageQueue, the local stand-in for SQS
+QueueMessagesTable = sqlalchemy.Table(
+    'tbl_queue_messages',
+    metadata,
+    sqlalchemy.Column(key='queueMessageId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='queueName', name='queue_name', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='messageJson', name='message_json', type_=sqlalchemy_psql.JSONB, nullable=False),
+    sqlalchemy.Column(key='visibleDate', name='visible_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Index('tbl_queue_messages_queue_name_visible_date', 'queueName', 'visibleDate'),
+)
+
+
+# Position manager transfers that involve our agent wallets, maintained by PositionOwnershipManager
+PositionTransfersTable = sqlalchemy.Table(
+    'tbl_position_transfers',
+    metadata,
+    sqlalchemy.Column(key='positionTransferId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='tokenId', name='token_id', type_=sqlalchemy.BigInteger, nullable=False),
+    sqlalchemy.Column(key='fromAddress', name='from_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='toAddress', name='to_address', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='blockNumber', name='block_number', type_=sqlalchemy.BigInteger, nullable=False),
+    sqlalchemy.Column(key='logIndex', name='log_index', type_=sqlalchemy.Integer, nullable=False),
+    sqlalchemy.UniqueConstraint('tokenId', 'blockNumber', 'logIndex', name='tbl_position_transfers_ux_token_id_block_number_log_index'),
+    sqlalchemy.Index('tbl_position_transfers_to_address', 'toAddress'),
+    sqlalchemy.Index('tbl_position_transfers_block_number', 'blockNumber'),
+)
+
+
+# The last block each chain follower has ingested, by follower name
+BlockCursorsTable = sqlalchemy.Table(
+    'tbl_block_cursors',
+    metadata,
+    sqlalchemy.Column(key='blockCursorId', name='id', type_=sqlalchemy_psql.UUID, primary_key=True),
+    sqlalchemy.Column(key='createdDate', name='created_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='updatedDate', name='updated_date', type_=sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column(key='name', name='name', type_=sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column(key='blockNumber', name='block_number', type_=sqlalchemy.BigInteger, nullable=False),
+    sqlalchemy.UniqueConstraint('name', name='tbl_block_cursors_ux_name'),
+)
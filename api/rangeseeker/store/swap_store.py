@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import fcntl
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydantic import BaseModel
+
+# Amounts, prices and liquidity can exceed 64 bits so they are kept as decimal strings, readers cast them to floats for analytics
+SWAP_SCHEMA = pa.schema(
+    [
+        pa.field('blockNumber', pa.int64()),
+        pa.field('logIndex', pa.int32()),
+        pa.field('timestamp', pa.int64()),
+        pa.field('txHash', pa.string()),
+        pa.field('sqrtPriceX96', pa.string()),
+        pa.field('amount0', pa.string()),
+        pa.field('amount1', pa.string()),
+        pa.field('liquidity', pa.string()),
+        pa.field('tick', pa.int32()),
+    ]
+)
+SECONDS_PER_DAY = 24 * 60 * 60
+STATE_FILE_NAME = 'state.json'
+LOCK_FILE_NAME = '.lock'
+
+
+class SwapStoreState(BaseModel):
+    # Every swap with a timestamp after startTimestamp and a block up to endBlockNumber is stored
+    startTimestamp: int
+    endBlockNumber: int
+
+
+class SwapStore:
+    # Keeps each pool's swaps on local disk as one Arrow IPC file per UTC day, sorted by block and log index. Files are
+    # only ever replaced whole (write then rename) so readers can memory-map them and read columns without copying, and a
+    # reader that mapped the previous version of a file keeps a consistent view of it. The api, worker and executor can
+    # share a directory, so writers hold a per-pool file lock and merges drop swaps that are already stored.
+    def __init__(self, rootDirectory: str) -> None:
+        self.rootDirectory = Path(rootDirectory)
+
+    def _get_pool_directory(self, poolAddress: str) -> Path:
+        return self.rootDirectory / poolAddress.lower()
+
+    @staticmethod
+    def _get_partition_name(day: int) -> str:
+        return f'{datetime.datetime.fromtimestamp(day * SECONDS_PER_DAY, tz=datetime.UTC).strftime("%Y-%m-%d")}.arrow'
+
+    @staticmethod
+    def _read_partition(path: Path) -> pa.Table:
+        with pa.memory_map(str(path), 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+    @staticmethod
+    def _get_temporary_path(path: Path) -> Path:
+        return path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+
+    def _write_partition(self, path: Path, swaps: pa.Table) -> None:
+        temporaryPath = self._get_temporary_path(path=path)
+        with pa.OSFile(str(temporaryPath), 'wb') as sink, pa.ipc.new_file(sink, schema=SWAP_SCHEMA) as writer:
+            writer.write_table(swaps)
+        os.replace(temporaryPath, path)
+
+    @asynccontextmanager
+    async def lock_pool(self, poolAddress: str) -> AsyncIterator[None]:
+        """Hold the pool's lock across processes, for a read-merge-write of its partitions and state."""
+        poolDirectory = self._get_pool_directory(poolAddress=poolAddress)
+        poolDirectory.mkdir(parents=True, exist_ok=True)
+        with (poolDirectory / LOCK_FILE_NAME).open('a') as lockFile:
+            # Waiting for another process's sync happens off the event loop, closing the file releases the lock
+            await asyncio.to_thread(fcntl.flock, lockFile.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def get_state(self, poolAddress: str) -> SwapStoreState | None:
+        statePath = self._get_pool_directory(poolAddress=poolAddress) / STATE_FILE_NAME
+        if not statePath.exists():
+            return None
+        return SwapStoreState.model_validate_json(statePath.read_text())
+
+    def set_state(self, poolAddress: str, state: SwapStoreState) -> None:
+        poolDirectory = self._get_pool_directory(poolAddress=poolAddress)
+        poolDirectory.mkdir(parents=True, exist_ok=True)
+        statePath = poolDirectory / STATE_FILE_NAME
+        temporaryPath = self._get_temporary_path(path=statePath)
+        temporaryPath.write_text(state.model_dump_json())
+        os.replace(temporaryPath, statePath)
+
+    def write_swaps(self, poolAddress: str, swaps: pa.Table) -> None:
+        """Merge the swaps into their day partitions, the state should only be moved forward once this has returned."""
+        if swaps.num_rows == 0:
+            return
+        poolDirectory = self._get_pool_directory(poolAddress=poolAddress)
+        poolDirectory.mkdir(parents=True, exist_ok=True)
+        days = swaps.column('timestamp').to_numpy() // SECONDS_PER_DAY
+        for day in np.unique(days):
+            partitionPath = poolDirectory / self._get_partition_name(day=int(day))
+            daySwaps = swaps.filter(pa.array(days == day))
+            if partitionPath.exists():
+                daySwaps = pa.concat_tables([self._read_partition(path=partitionPath), daySwaps])
+            daySwaps = daySwaps.sort_by([('blockNumber', 'ascending'), ('logIndex', 'ascending')])
+            # A swap is identified by its block and log index, a second copy (e.g. from a sync that crashed before moving the state) is dropped
+            blockNumbers = daySwaps.column('blockNumber').to_numpy()
+            logIndices = daySwaps.column('logIndex').to_numpy()
+            isFirstCopy = np.append(True, (blockNumbers[1:] != blockNumbers[:-1]) | (logIndices[1:] != logIndices[:-1]))
+            self._write_partition(path=partitionPath, swaps=daySwaps.filter(pa.array(isFirstCopy)))
+
+    def prune_swaps(self, poolAddress: str, startTimestamp: int) -> None:
+        """Delete the partitions of days that ended before startTimestamp and move the state's start past them."""
+        poolDirectory = self._get_pool_directory(poolAddress=poolAddress)
+        state = self.get_state(poolAddress=poolAddress)
+        if state is None:
+            return
+        startDay = startTimestamp // SECONDS_PER_DAY
+        startPartitionName = self._get_partition_name(day=startDay)
+        for partitionPath in poolDirectory.glob('*.arrow'):
+            if partitionPath.name < startPartitionName:
+                partitionPath.unlink()
+        # Everything from the start of startDay onwards is still stored
+        prunedStartTimestamp = startDay * SECONDS_PER_DAY - 1
+        if state.startTimestamp < prunedStartTimestamp:
+            self.set_state(poolAddress=poolAddress, state=SwapStoreState(startTimestamp=prunedStartTimestamp, endBlockNumber=state.endBlockNumber))
+
+    def read_swaps(self, poolAddress: str, startTimestamp: int) -> pa.Table:
+        """Return the stored swaps after startTimestamp, oldest first, backed by memory-mapped partition files."""
+        poolDirectory = self._get_pool_directory(poolAddress=poolAddress)
+        startPartitionName = self._get_partition_name(day=startTimestamp // SECONDS_PER_DAY)
+        # Partition names sort chronologically so the ones to read are those from the start day onwards
+        partitionPaths = sorted(path for path in poolDirectory.glob('*.arrow') if path.name >= startPartitionName) if poolDirectory.exists() else []
+        if len(partitionPaths) == 0:
+            return SWAP_SCHEMA.empty_table()
+        swaps = pa.concat_tables([self._read_partition(path=partitionPath) for partitionPath in partitionPaths])
+        return swaps.filter(pc.greater(swaps.column('timestamp'), startTimestamp))
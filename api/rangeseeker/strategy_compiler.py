@@ -0,0 +1,171 @@
+import dataclasses
+from typing import cast
+
+import numpy as np
+from core import logging
+from core.util.typing_util import JsonObject
+from pydantic import BaseModel
+
+from rangeseeker.model import Strategy
+from rangeseeker.strategy_parser import PriceThresholdParameters
+from rangeseeker.strategy_parser import RangeWidthParameters
+from rangeseeker.strategy_parser import VolatilityTriggerParameters
+
+ACTION_NONE = 'NONE'
+ACTION_REBALANCE = 'REBALANCE'
+ACTION_EXIT_TO_STABLE = 'EXIT_TO_STABLE'
+ACTION_PAUSE_REBALANCING = 'PAUSE_REBALANCING'
+# Index into this list is the action code used in the evaluator's arrays
+ACTIONS = [ACTION_NONE, ACTION_REBALANCE, ACTION_EXIT_TO_STABLE, ACTION_PAUSE_REBALANCING]
+
+DEFAULT_RANGE_PERCENT = 10.0
+DEFAULT_REBALANCE_BUFFER = 0.1
+DEFAULT_RANGE_PRIORITY = 3
+# Snapshots only carry the ETH price, the pool every agent provides liquidity to is WETH/USDC
+SNAPSHOT_PRICE_ASSETS = {'ETH', 'WETH'}
+
+
+class MarketSnapshot(BaseModel):
+    priceUsd: float
+    tick: int
+    volatility: float
+
+
+class CompiledRangeRule(BaseModel):
+    priority: int
+    baseRangePercent: float
+    rebalanceBuffer: float
+    wideningVolatilityThreshold: float | None
+    widenToPercent: float | None
+
+
+class CompiledPriceThresholdRule(BaseModel):
+    priority: int
+    isLessThan: bool
+    priceUsd: float
+    action: str
+
+
+class CompiledVolatilityTriggerRule(BaseModel):
+    priority: int
+    threshold: float
+    action: str
+
+
+class CompiledStrategy(BaseModel):
+    strategyId: str
+    rangeRule: CompiledRangeRule
+    priceThresholdRules: list[CompiledPriceThresholdRule]
+    volatilityTriggerRules: list[CompiledVolatilityTriggerRule]
+
+    def get_range_percent(self, volatility: float) -> float:
+        if self.rangeRule.wideningVolatilityThreshold is not None and self.rangeRule.widenToPercent is not None and volatility > self.rangeRule.wideningVolatilityThreshold:
+            return self.rangeRule.widenToPercent
+        return self.rangeRule.baseRangePercent
+
+
+def compile_strategy(strategy: Strategy) -> CompiledStrategy:
+    rangeRule = CompiledRangeRule(priority=DEFAULT_RANGE_PRIORITY, baseRangePercent=DEFAULT_RANGE_PERCENT, rebalanceBuffer=DEFAULT_REBALANCE_BUFFER, wideningVolatilityThreshold=None, widenToPercent=None)
+    priceThresholdRules: list[CompiledPriceThresholdRule] = []
+    volatilityTriggerRules: list[CompiledVolatilityTriggerRule] = []
+    hasRangeRule = False
+    for rule in sorted(strategy.rulesJson, key=lambda rule: int(cast(int, rule.get('priority', DEFAULT_RANGE_PRIORITY)))):
+        ruleType = rule.get('type')
+        priority = int(cast(int, rule.get('priority', DEFAULT_RANGE_PRIORITY)))
+        parameters = cast(JsonObject, rule.get('parameters', {}))
+        if ruleType == 'RANGE_WIDTH':
+            # Only the highest priority range rule applies
+            if hasRangeRule:
+                continue
+            hasRangeRule = True
+            rangeParameters = RangeWidthParameters.model_validate(parameters)
+            dynamicWidening = rangeParameters.dynamicWidening if rangeParameters.dynamicWidening and rangeParameters.dynamicWidening.enabled else None
+            rangeRule = CompiledRangeRule(
+                priority=priority,
+                baseRangePercent=rangeParameters.baseRangePercent,
+                rebalanceBuffer=rangeParameters.rebalanceBuffer,
+                wideningVolatilityThreshold=dynamicWidening.volatilityThreshold if dynamicWidening else None,
+                widenToPercent=dynamicWidening.widenToPercent if dynamicWidening else None,
+            )
+        elif ruleType == 'PRICE_THRESHOLD':
+            priceParameters = PriceThresholdParameters.model_validate(parameters)
+            if priceParameters.asset.upper() not in SNAPSHOT_PRICE_ASSETS:
+                logging.warning(f'[STRATEGY_COMPILER] Ignoring price threshold on unsupported asset {priceParameters.asset} in strategy {strategy.strategyId}')
+                continue
+            if priceParameters.action not in ACTIONS:
+                logging.warning(f'[STRATEGY_COMPILER] Ignoring unsupported price threshold action {priceParameters.action} in strategy {strategy.strategyId}')
+                continue
+            priceThresholdRules.append(CompiledPriceThresholdRule(priority=priority, isLessThan=priceParameters.operator == 'LESS_THAN', priceUsd=priceParameters.priceUsd, action=priceParameters.action))
+        elif ruleType == 'VOLATILITY_TRIGGER':
+            volatilityParameters = VolatilityTriggerParameters.model_validate(parameters)
+            if volatilityParameters.action not in ACTIONS:
+                logging.warning(f'[STRATEGY_COMPILER] Ignoring unsupported volatility trigger action {volatilityParameters.action} in strategy {strategy.strategyId}')
+                continue
+            volatilityTriggerRules.append(CompiledVolatilityTriggerRule(priority=priority, threshold=volatilityParameters.threshold, action=volatilityParameters.action))
+        else:
+            logging.warning(f'[STRATEGY_COMPILER] Ignoring unknown rule type {ruleType} in strategy {strategy.strategyId}')
+    return CompiledStrategy(strategyId=strategy.strategyId, rangeRule=rangeRule, priceThresholdRules=priceThresholdRules, volatilityTriggerRules=volatilityTriggerRules)
+
+
+@dataclasses.dataclass(frozen=True)
+class AgentStrategyInput:
+    agentId: str
+    compiledStrategy: CompiledStrategy
+    positionTicks: list[tuple[int, int]]
+
+
+class StrategyBatchEvaluator:
+    # Flattens every agent's compiled rules into one row per rule (and one row per position for the range rule),
+    # so evaluating all agents against a snapshot is a handful of array comparisons followed by picking the
+    # highest priority (lowest number) triggered rule for each agent.
+    def __init__(self, agentInputs: list[AgentStrategyInput]) -> None:
+        self.agentIds = [agentInput.agentId for agentInput in agentInputs]
+        agentCount = len(agentInputs)
+        positionAgentIndices = [agentIndex for agentIndex, agentInput in enumerate(agentInputs) for _ in agentInput.positionTicks]
+        self.positionAgentIndices = np.array(positionAgentIndices, dtype=np.int64)
+        self.positionTickLowers = np.array([tickLower for agentInput in agentInputs for (tickLower, _) in agentInput.positionTicks], dtype=np.float64)
+        self.positionTickUppers = np.array([tickUpper for agentInput in agentInputs for (_, tickUpper) in agentInput.positionTicks], dtype=np.float64)
+        self.agentHasPosition = np.bincount(self.positionAgentIndices, minlength=agentCount) > 0
+        self.agentRebalanceBuffers = np.array([agentInput.compiledStrategy.rangeRule.rebalanceBuffer for agentInput in agentInputs], dtype=np.float64)
+        self.agentRangePriorities = np.array([agentInput.compiledStrategy.rangeRule.priority for agentInput in agentInputs], dtype=np.int64)
+        priceRules = [(agentIndex, rule) for agentIndex, agentInput in enumerate(agentInputs) for rule in agentInput.compiledStrategy.priceThresholdRules]
+        self.priceRuleAgentIndices = np.array([agentIndex for (agentIndex, _) in priceRules], dtype=np.int64)
+        self.priceRuleIsLessThan = np.array([rule.isLessThan for (_, rule) in priceRules], dtype=np.bool_)
+        self.priceRulePrices = np.array([rule.priceUsd for (_, rule) in priceRules], dtype=np.float64)
+        self.priceRulePriorities = np.array([rule.priority for (_, rule) in priceRules], dtype=np.int64)
+        self.priceRuleActions = np.array([ACTIONS.index(rule.action) for (_, rule) in priceRules], dtype=np.int64)
+        volatilityRules = [(agentIndex, rule) for agentIndex, agentInput in enumerate(agentInputs) for rule in agentInput.compiledStrategy.volatilityTriggerRules]
+        self.volatilityRuleAgentIndices = np.array([agentIndex for (agentIndex, _) in volatilityRules], dtype=np.int64)
+        self.volatilityRuleThresholds = np.array([rule.threshold for (_, rule) in volatilityRules], dtype=np.float64)
+        self.volatilityRulePriorities = np.array([rule.priority for (_, rule) in volatilityRules], dtype=np.int64)
+        self.volatilityRuleActions = np.array([ACTIONS.index(rule.action) for (_, rule) in volatilityRules], dtype=np.int64)
+
+    def evaluate(self, snapshot: MarketSnapshot) -> dict[str, str]:
+        agentCount = len(self.agentIds)
+        # Range: a position needs rebalancing once the tick is within rebalanceBuffer of either edge (or outside it)
+        positionWidths = self.positionTickUppers - self.positionTickLowers
+        positionBuffers = self.agentRebalanceBuffers[self.positionAgentIndices]
+        positionTriggered = (snapshot.tick < self.positionTickLowers + positionWidths * positionBuffers) | (snapshot.tick > self.positionTickUppers - positionWidths * positionBuffers)
+        agentRangeTriggered = np.zeros(agentCount, dtype=np.bool_)
+        np.logical_or.at(agentRangeTriggered, self.positionAgentIndices, positionTriggered)
+        priceTriggered = np.where(self.priceRuleIsLessThan, snapshot.priceUsd < self.priceRulePrices, snapshot.priceUsd > self.priceRulePrices)
+        volatilityTriggered = snapshot.volatility > self.volatilityRuleThresholds
+        triggeredAgentIndices = np.concatenate([self.priceRuleAgentIndices[priceTriggered], self.volatilityRuleAgentIndices[volatilityTriggered], np.flatnonzero(agentRangeTriggered)])
+        triggeredPriorities = np.concatenate([self.priceRulePriorities[priceTriggered], self.volatilityRulePriorities[volatilityTriggered], self.agentRangePriorities[agentRangeTriggered]])
+        triggeredActions = np.concatenate([self.priceRuleActions[priceTriggered], self.volatilityRuleActions[volatilityTriggered], np.full(int(agentRangeTriggered.sum()), ACTIONS.index(ACTION_REBALANCE), dtype=np.int64)])
+        # Every action acts on an existing position, agents without one have nothing to do
+        hasPositionMask = self.agentHasPosition[triggeredAgentIndices]
+        triggeredAgentIndices = triggeredAgentIndices[hasPositionMask]
+        triggeredPriorities = triggeredPriorities[hasPositionMask]
+        triggeredActions = triggeredActions[hasPositionMask]
+        # Sort by agent then priority (stable, so price rules win ties over volatility rules over range) and keep each agent's first row
+        order = np.lexsort((triggeredPriorities, triggeredAgentIndices))
+        _, firstIndices = np.unique(triggeredAgentIndices[order], return_index=True)
+        winningRows = order[firstIndices]
+        agentActions: dict[str, str] = {}
+        for agentIndex, actionCode in zip(triggeredAgentIndices[winningRows].tolist(), triggeredActions[winningRows].tolist(), strict=True):
+            action = ACTIONS[actionCode]
+            # Pausing (or any other non-acting rule) winning means the agent is left alone
+            if action in {ACTION_REBALANCE, ACTION_EXIT_TO_STABLE}:
+                agentActions[self.agentIds[agentIndex]] = action
+        return agentActions
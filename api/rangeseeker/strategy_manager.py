@@ -1,3 +1,5 @@
+from core import logging
+from core.exceptions import NotFoundException
 from core.store.database import Database
 from core.util import json_util
 
@@ -5,6 +7,8 @@ from rangeseeker.external.uniswap_data_client import UniswapDataClient
 from rangeseeker.model import Strategy
 from rangeseeker.store import schema
 from rangeseeker.store.entity_repository import UUIDFieldFilter
+from rangeseeker.strategy_compiler import CompiledStrategy
+from rangeseeker.strategy_compiler import compile_strategy
 from rangeseeker.strategy_parser import StrategyDefinition
 from rangeseeker.strategy_parser import StrategyParser
 
@@ -16,6 +20,8 @@ class StrategyManager:
         self.database = database
         self.uniswapClient = uniswapClient
         self.parser = parser
+        # Strategies are never edited once created, so a compiled strategy can be kept for the life of the process
+        self._compiledStrategies: dict[str, CompiledStrategy] = {}
 
     async def parse_strategy(self, description: str) -> StrategyDefinition:
         currentPrice = await self.uniswapClient.get_current_price(POOL_ADDRESS)
@@ -50,3 +56,25 @@ class StrategyManager:
             database=self.database,
             fieldFilters=[UUIDFieldFilter(fieldName=schema.StrategiesTable.c.userId.key, eq=userId)],
         )
+
+    async def get_compiled_strategies(self, strategyIds: list[str]) -> dict[str, CompiledStrategy]:
+        missingStrategyIds = list({strategyId for strategyId in strategyIds if strategyId not in self._compiledStrategies})
+        if len(missingStrategyIds) > 0:
+            strategies = await schema.StrategiesRepository.list_many(
+                database=self.database,
+                fieldFilters=[UUIDFieldFilter(fieldName=schema.StrategiesTable.c.strategyId.key, containedIn=missingStrategyIds)],
+            )
+            for strategy in strategies:
+                # One strategy that no longer compiles shouldn't stop every other agent from being evaluated
+                try:
+                    self._compiledStrategies[strategy.strategyId] = compile_strategy(strategy=strategy)
+                except Exception as error:  # noqa: BLE001
+                    logging.error(f'[STRATEGY] Failed to compile strategy {strategy.strategyId}, skipping it: {error}')
+                    logging.exception(error)
+        return {strategyId: self._compiledStrategies[strategyId] for strategyId in strategyIds if strategyId in self._compiledStrategies}
+
+    async def get_compiled_strategy(self, strategyId: str) -> CompiledStrategy:
+        compiledStrategies = await self.get_compiled_strategies(strategyIds=[strategyId])
+        if strategyId not in compiledStrategies:
+            raise NotFoundException('NO_STRATEGY')
+        return compiledStrategies[strategyId]
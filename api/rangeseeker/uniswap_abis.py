@@ -22,3 +22,81 @@ UNISWAP_V3_POSITION_MANAGER_POSITIONS_ABI: ABI = [
         'type': 'function',
     }
 ]
+
+UNISWAP_V3_POSITION_MANAGER_MULTICALL_ABI: ABI = [
+    {
+        'inputs': [{'name': 'data', 'type': 'bytes[]'}],
+        'name': 'multicall',
+        'outputs': [{'name': 'results', 'type': 'bytes[]'}],
+        'stateMutability': 'payable',
+        'type': 'function',
+    }
+]
+
+# collect((uint256 tokenId, address recipient, uint128 amount0Max, uint128 amount1Max)) returns (uint256 amount0, uint256 amount1)
+UNISWAP_V3_COLLECT_SELECTOR = '0xfc6f7865'
+
+UNISWAP_V3_POOL_ABI: ABI = [
+    {
+        'inputs': [],
+        'name': 'slot0',
+        'outputs': [
+            {'name': 'sqrtPriceX96', 'type': 'uint160'},
+            {'name': 'tick', 'type': 'int24'},
+            {'name': 'observationIndex', 'type': 'uint16'},
+            {'name': 'observationCardinality', 'type': 'uint16'},
+            {'name': 'observationCardinalityNext', 'type': 'uint16'},
+            {'name': 'feeProtocol', 'type': 'uint8'},
+            {'name': 'unlocked', 'type': 'bool'},
+        ],
+        'stateMutability': 'view',
+        'type': 'function',
+    },
+    {
+        'inputs': [],
+        'name': 'liquidity',
+        'outputs': [{'name': '', 'type': 'uint128'}],
+        'stateMutability': 'view',
+        'type': 'function',
+    },
+    {
+        'inputs': [],
+        'name': 'feeGrowthGlobal0X128',
+        'outputs': [{'name': '', 'type': 'uint256'}],
+        'stateMutability': 'view',
+        'type': 'function',
+    },
+    {
+        'inputs': [],
+        'name': 'feeGrowthGlobal1X128',
+        'outputs': [{'name': '', 'type': 'uint256'}],
+        'stateMutability': 'view',
+        'type': 'function',
+    },
+    {
+        'inputs': [{'name': 'tick', 'type': 'int24'}],
+        'name': 'ticks',
+        'outputs': [
+            {'name': 'liquidityGross', 'type': 'uint128'},
+            {'name': 'liquidityNet', 'type': 'int128'},
+            {'name': 'feeGrowthOutside0X128', 'type': 'uint256'},
+            {'name': 'feeGrowthOutside1X128', 'type': 'uint256'},
+            {'name': 'tickCumulativeOutside', 'type': 'int56'},
+            {'name': 'secondsPerLiquidityOutsideX128', 'type': 'uint160'},
+            {'name': 'secondsOutside', 'type': 'uint32'},
+            {'name': 'initialized', 'type': 'bool'},
+        ],
+        'stateMutability': 'view',
+        'type': 'function',
+    },
+]
+
+# IncreaseLiquidity(uint256 indexed tokenId, uint128 liquidity, uint256 amount0, uint256 amount1)
+UNISWAP_V3_INCREASE_LIQUIDITY_EVENT_TOPIC = '0x3067048beee31b25b2f1681f88dac838c8bba36af25bfb2b7cf7473a5847e35f'
+
+# Swap(address indexed sender, address indexed recipient, int256 amount0, int256 amount1, uint160 sqrtPriceX96, uint128 liquidity, int24 tick)
+UNISWAP_V3_SWAP_EVENT_TOPIC = '0xc42079f94a6350d7e6235f29174924f928cc2ac818eb64fed8004e115fbcca67'
+UNISWAP_V3_SWAP_EVENT_DATA_TYPES = ['int256', 'int256', 'uint160', 'uint128', 'int24']
+
+# Transfer(address indexed from, address indexed to, uint256 indexed tokenId) on the position manager
+UNISWAP_V3_POSITION_MANAGER_TRANSFER_EVENT_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
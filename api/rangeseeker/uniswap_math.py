@@ -0,0 +1,85 @@
+# Integer ports of the Uniswap V3 TickMath and LiquidityAmounts libraries, so values match what the contracts compute exactly
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+Q96 = 2**96
+Q128 = 2**128
+MAX_UINT256 = 2**256 - 1
+
+# TickMath multiplies in 1/sqrt(1.0001)^(2^i) as Q128.128 for every bit i set in |tick|
+_TICK_RATIO_FACTORS = [
+    (0x2, 0xFFF97272373D413259A46990580E213A),
+    (0x4, 0xFFF2E50F5F656932EF12357CF3C7FDCC),
+    (0x8, 0xFFE5CACA7E10E4E61C3624EAA0941CD0),
+    (0x10, 0xFFCB9843D60F6159C9DB58835C926644),
+    (0x20, 0xFF973B41FA98C081472E6896DFB254C0),
+    (0x40, 0xFF2EA16466C96A3843EC78B326B52861),
+    (0x80, 0xFE5DEE046A99A2A811C461F1969C3053),
+    (0x100, 0xFCBE86C7900A88AEDCFFC83B479AA3A4),
+    (0x200, 0xF987A7253AC413176F2B074CF7815E54),
+    (0x400, 0xF3392B0822B70005940C7A398E4B70F3),
+    (0x800, 0xE7159475A2C29B7443B29C7FA6E889D9),
+    (0x1000, 0xD097F3BDFD2022B8845AD8F792AA5825),
+    (0x2000, 0xA9F746462D870FDF8A65DC1F90E061E5),
+    (0x4000, 0x70D869A156D2A1B890BB3DF62BAF32F7),
+    (0x8000, 0x31BE135F97D08FD981231505542FCFA6),
+    (0x10000, 0x9AA508B5B7A84E1C677DE54F3E99BC9),
+    (0x20000, 0x5D6AF8DEDB81196699C329225EE604),
+    (0x40000, 0x2216E584F5FA1EA926041BEDFE98),
+    (0x80000, 0x48A170391F7DC42444E8FA2),
+]
+
+
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    """Return sqrt(1.0001^tick) as a Q64.96, identical to TickMath.getSqrtRatioAtTick."""
+    absTick = abs(tick)
+    if absTick > MAX_TICK:
+        raise ValueError(f'Tick {tick} is outside of the valid range')
+    ratio = 0xFFFCB933BD6FAD37AA2D162D1A594001 if absTick & 0x1 != 0 else 0x100000000000000000000000000000000
+    for mask, factor in _TICK_RATIO_FACTORS:
+        if absTick & mask != 0:
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+    # Rounds up when converting from Q128.128 to Q64.96 so getTickAtSqrtRatio is consistent
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_amount0_for_liquidity(sqrtRatioAX96: int, sqrtRatioBX96: int, liquidity: int) -> int:
+    if sqrtRatioAX96 > sqrtRatioBX96:
+        sqrtRatioAX96, sqrtRatioBX96 = sqrtRatioBX96, sqrtRatioAX96
+    return ((liquidity << 96) * (sqrtRatioBX96 - sqrtRatioAX96) // sqrtRatioBX96) // sqrtRatioAX96
+
+
+def get_amount1_for_liquidity(sqrtRatioAX96: int, sqrtRatioBX96: int, liquidity: int) -> int:
+    if sqrtRatioAX96 > sqrtRatioBX96:
+        sqrtRatioAX96, sqrtRatioBX96 = sqrtRatioBX96, sqrtRatioAX96
+    return liquidity * (sqrtRatioBX96 - sqrtRatioAX96) // Q96
+
+
+def get_amounts_for_liquidity(sqrtRatioX96: int, sqrtRatioAX96: int, sqrtRatioBX96: int, liquidity: int) -> tuple[int, int]:
+    """Return the (amount0, amount1) that liquidity between the two prices is worth at the current price, rounded down."""
+    if sqrtRatioAX96 > sqrtRatioBX96:
+        sqrtRatioAX96, sqrtRatioBX96 = sqrtRatioBX96, sqrtRatioAX96
+    if sqrtRatioX96 <= sqrtRatioAX96:
+        return get_amount0_for_liquidity(sqrtRatioAX96=sqrtRatioAX96, sqrtRatioBX96=sqrtRatioBX96, liquidity=liquidity), 0
+    if sqrtRatioX96 < sqrtRatioBX96:
+        return get_amount0_for_liquidity(sqrtRatioAX96=sqrtRatioX96, sqrtRatioBX96=sqrtRatioBX96, liquidity=liquidity), get_amount1_for_liquidity(sqrtRatioAX96=sqrtRatioAX96, sqrtRatioBX96=sqrtRatioX96, liquidity=liquidity)
+    return 0, get_amount1_for_liquidity(sqrtRatioAX96=sqrtRatioAX96, sqrtRatioBX96=sqrtRatioBX96, liquidity=liquidity)
+
+
+def get_position_amounts(sqrtPriceX96: int, tickLower: int, tickUpper: int, liquidity: int) -> tuple[int, int]:
+    """Return the token amounts a position's liquidity is currently worth, not counting uncollected fees."""
+    return get_amounts_for_liquidity(sqrtRatioX96=sqrtPriceX96, sqrtRatioAX96=get_sqrt_ratio_at_tick(tick=tickLower), sqrtRatioBX96=get_sqrt_ratio_at_tick(tick=tickUpper), liquidity=liquidity)
+
+
+def get_fee_growth_inside(tickCurrent: int, tickLower: int, tickUpper: int, feeGrowthGlobalX128: int, feeGrowthOutsideLowerX128: int, feeGrowthOutsideUpperX128: int) -> int:
+    """Return the fee growth per unit of liquidity inside the range, as Tick.getFeeGrowthInside computes it (wrapping at 2^256)."""
+    feeGrowthBelowX128 = feeGrowthOutsideLowerX128 if tickCurrent >= tickLower else (feeGrowthGlobalX128 - feeGrowthOutsideLowerX128) % (MAX_UINT256 + 1)
+    feeGrowthAboveX128 = feeGrowthOutsideUpperX128 if tickCurrent < tickUpper else (feeGrowthGlobalX128 - feeGrowthOutsideUpperX128) % (MAX_UINT256 + 1)
+    return (feeGrowthGlobalX128 - feeGrowthBelowX128 - feeGrowthAboveX128) % (MAX_UINT256 + 1)
+
+
+def get_uncollected_fees(liquidity: int, feeGrowthInsideX128: int, feeGrowthInsideLastX128: int, tokensOwed: int) -> int:
+    """Return what collect would pay out for one token: fees already credited to the position plus those accrued since its last update."""
+    return tokensOwed + ((feeGrowthInsideX128 - feeGrowthInsideLastX128) % (MAX_UINT256 + 1)) * liquidity // Q128
@@ -1,13 +1,19 @@
+import datetime
+
+import sqlalchemy
 from core.exceptions import BadRequestException
 from core.exceptions import NotFoundException
 from core.store.database import Database
+from core.store.retriever import IntegerFieldFilter
 from core.store.retriever import StringFieldFilter
 
 from rangeseeker.external.coinbase_cdp_client import CoinbaseCdpClient
 from rangeseeker.model import Agent
+from rangeseeker.model import AgentPosition
 from rangeseeker.model import AgentWallet
 from rangeseeker.model import User
 from rangeseeker.model import UserWallet
+from rangeseeker.model import WalletAllowance
 from rangeseeker.store import schema
 from rangeseeker.store.entity_repository import UUIDFieldFilter
 
@@ -139,3 +145,68 @@ class UserManager:
             database=self.database,
             fieldFilters=[],
         )
+
+    async def list_agent_positions(self, agentId: str) -> list[AgentPosition]:
+        return await schema.AgentPositionsRepository.list_many(
+            database=self.database,
+            fieldFilters=[UUIDFieldFilter(fieldName=schema.AgentPositionsTable.c.agentId.key, eq=agentId)],
+        )
+
+    async def list_all_agent_positions(self) -> list[AgentPosition]:
+        return await schema.AgentPositionsRepository.list_many(
+            database=self.database,
+            fieldFilters=[],
+        )
+
+    async def get_agent_positions_watermark(self) -> tuple[int, datetime.datetime | None]:
+        # Changes whenever a position is added, updated or deleted, so readers can tell their copy is out of date without listing every position
+        table = schema.AgentPositionsTable
+        result = await self.database.execute(query=sqlalchemy.select(sqlalchemy.func.count(), sqlalchemy.func.max(table.c.updatedDate)).select_from(table))
+        positionCount, latestUpdatedDate = result.one()
+        return int(positionCount), latestUpdatedDate
+
+    async def upsert_agent_position(self, agentId: str, walletAddress: str, tokenId: int, poolAddress: str, tickLower: int, tickUpper: int, liquidity: int, mintBlockNumber: int | None) -> AgentPosition:
+        return await schema.AgentPositionsRepository.upsert(
+            database=self.database,
+            constraintColumnNames=[schema.AgentPositionsTable.c.tokenId.key],
+            agentId=agentId,
+            walletAddress=walletAddress,
+            tokenId=tokenId,
+            poolAddress=poolAddress,
+            tickLower=tickLower,
+            tickUpper=tickUpper,
+            liquidity=liquidity,
+            mintBlockNumber=mintBlockNumber,
+        )
+
+    async def delete_agent_position(self, tokenId: int) -> None:
+        await schema.AgentPositionsRepository.delete(
+            database=self.database,
+            fieldFilters=[IntegerFieldFilter(fieldName=schema.AgentPositionsTable.c.tokenId.key, eq=tokenId)],
+        )
+
+    async def get_wallet_allowance(self, walletAddress: str, assetAddress: str, spenderAddress: str) -> WalletAllowance | None:
+        return await schema.WalletAllowancesRepository.get_one_or_none(
+            database=self.database,
+            fieldFilters=[
+                StringFieldFilter(fieldName=schema.WalletAllowancesTable.c.walletAddress.key, eq=walletAddress),
+                StringFieldFilter(fieldName=schema.WalletAllowancesTable.c.assetAddress.key, eq=assetAddress),
+                StringFieldFilter(fieldName=schema.WalletAllowancesTable.c.spenderAddress.key, eq=spenderAddress),
+            ],
+        )
+
+    async def upsert_wallet_allowance(self, walletAddress: str, assetAddress: str, spenderAddress: str, amount: int) -> WalletAllowance:
+        return await schema.WalletAllowancesRepository.upsert(
+            database=self.database,
+            constraintColumnNames=[schema.WalletAllowancesTable.c.walletAddress.key, schema.WalletAllowancesTable.c.assetAddress.key, schema.WalletAllowancesTable.c.spenderAddress.key],
+            walletAddress=walletAddress,
+            assetAddress=assetAddress,
+            spenderAddress=spenderAddress,
+            amount=amount,
+        )
+
+    async def delete_wallet_allowances(self, walletAddress: str) -> None:
+        await schema.WalletAllowancesRepository.delete(
+            database=self.database,
+            fieldFilters=[StringFieldFilter(fieldName=schema.WalletAllowancesTable.c.walletAddress.key, eq=walletAddress)],
+        )
@@ -0,0 +1,29 @@
+# ruff: noqa: T201
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from rangeseeker.create_app_manager import create_app_manager
+
+
+async def main() -> None:
+    appManager = create_app_manager()
+    await appManager.database.connect()
+    try:
+        agents = await appManager.userManager.list_all_agents()
+        print(f'Backfilling positions for {len(agents)} agents\n')
+        for agent in agents:
+            agentWallet = await appManager.userManager.get_agent_wallet_by_agent_id(agentId=agent.agentId)
+            agentPositions = await appManager.sync_agent_positions_from_chain(agentId=agent.agentId, walletAddress=agentWallet.walletAddress)
+            print(f'Agent {agent.agentId} ({agentWallet.walletAddress}): {len(agentPositions)} position(s)')
+            for agentPosition in agentPositions:
+                print(f'  Position #{agentPosition.tokenId} [{agentPosition.tickLower}, {agentPosition.tickUpper}] liquidity {agentPosition.liquidity}')
+    finally:
+        await appManager.database.disconnect()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
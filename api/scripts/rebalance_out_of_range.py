@@ -12,6 +12,7 @@ from web3.types import TxParams
 from web3.types import Wei
 
 from rangeseeker import constants
+from rangeseeker.app_manager import MINT_GAS_LIMIT
 from rangeseeker.app_manager import AppManager
 from rangeseeker.create_app_manager import create_app_manager
 
@@ -39,10 +40,7 @@ async def deposit_to_uniswap_v3_custom_range(
     deadline = int(datetime.datetime.now(tz=datetime.UTC).timestamp()) + 1200
 
     logging.info(f'[UNISWAP] Token amounts - WETH: {wethAmount}, USDC: {usdcAmount}')
-    logging.info(f'[UNISWAP] Checking/approving WETH to position manager')
-    await appManager._approve_token_if_needed(chainId, walletAddress, token0, positionManagerAddress, wethAmount)
-    logging.info(f'[UNISWAP] Checking/approving USDC to position manager')
-    await appManager._approve_token_if_needed(chainId, walletAddress, token1, positionManagerAddress, usdcAmount)
+    approvalHashes = await appManager._approve_position_manager_if_needed(chainId=chainId, walletAddress=walletAddress, wethAmount=wethAmount, usdcAmount=usdcAmount)
 
     data = appManager._encode_mint_params(
         token0=token0,
@@ -65,19 +63,10 @@ async def deposit_to_uniswap_v3_custom_range(
         'value': Wei(0),
         'data': typing.cast(HexStr, data),
     }
-    filledTransaction = await appManager.ethClient.fill_transaction_params(
-        params=transactionDict,
-        fromAddress=walletAddress,
-        chainId=chainId,
-    )
-    signedTx = await appManager.userManager.coinbaseCdpClient.sign_transaction(
-        walletAddress=walletAddress,
-        transactionDict=filledTransaction,
-    )
-    txHash = await appManager.ethClient.send_raw_transaction(transactionData=signedTx)
+    txHash = await appManager._send_transaction(chainId=chainId, walletAddress=walletAddress, transactionDict=transactionDict, gas=MINT_GAS_LIMIT if approvalHashes else None)
     logging.info(f'[UNISWAP] Mint transaction broadcast: {txHash}')
-    receipt = await appManager.ethClient.wait_for_transaction_receipt(transactionHash=txHash)
-    logging.info(f'[UNISWAP] Mint transaction mined in block {receipt["blockNumber"]}')
+    receipts = await appManager._wait_for_transactions(walletAddress=walletAddress, transactionHashes=[*approvalHashes, txHash])
+    logging.info(f'[UNISWAP] Mint transaction mined in block {receipts[-1]["blockNumber"]}')
 
 
 async def rebalance_out_of_range(agent_id: str, offset_percent: float = 20.0) -> None:
@@ -101,17 +90,7 @@ async def rebalance_out_of_range(agent_id: str, offset_percent: float = 20.0) ->
             logging.info(f'Agent wallet address: {agentWallet.walletAddress}')
 
             # Withdraw existing positions
-            positions = await appManager.get_wallet_uniswap_positions(walletAddress=agentWallet.walletAddress)
-            if positions:
-                logging.info(f'Found {len(positions)} existing positions, withdrawing...')
-                for position in positions:
-                    logging.info(f'Withdrawing position {position.tokenId}')
-                    await appManager._withdraw_from_uniswap_v3(
-                        chainId=constants.BASE_CHAIN_ID,
-                        walletAddress=agentWallet.walletAddress,
-                        tokenId=position.tokenId,
-                    )
-                logging.info('All positions withdrawn')
+            await appManager._withdraw_all_agent_positions(agentId=agent_id, walletAddress=agentWallet.walletAddress)
 
             # Get current balances
             balances = await appManager.get_wallet_balances(chainId=constants.BASE_CHAIN_ID, walletAddress=agentWallet.walletAddress)
@@ -163,6 +142,7 @@ async def rebalance_out_of_range(agent_id: str, offset_percent: float = 20.0) ->
                 tickLower=tickLower,
                 tickUpper=tickUpper,
             )
+            await appManager.sync_agent_positions_from_chain(agentId=agent_id, walletAddress=agentWallet.walletAddress)
 
             logging.info('✅ Successfully created out-of-range position for demo!')
     finally:
@@ -6,8 +6,13 @@ import sys
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from core.requester import Requester
+from core.web3.eth_client import RestEthClient
+
 from rangeseeker.external.amp_client import AmpClient
+from rangeseeker.external.multicall_client import MulticallClient
 from rangeseeker.external.uniswap_data_client import UniswapDataClient
+from rangeseeker.store.swap_store import SwapStore
 
 CHAIN_ID = 8453
 WETH_ADDRESS = '0x4200000000000000000000000000000000000006'
@@ -30,7 +35,8 @@ async def main() -> None:
         flightUrl='https://gateway.amp.staging.thegraph.com',
         token=AMP_TOKEN,
     )
-    uniswapClient = UniswapDataClient(ampClient=ampClient)
+    ethClient = RestEthClient(url=os.environ['RPC_NODE_URL_8453'], chainId=CHAIN_ID, requester=Requester())
+    uniswapClient = UniswapDataClient(ampClient=ampClient, ethClient=ethClient, multicallClient=MulticallClient(ethClient=ethClient), swapStore=SwapStore(rootDirectory=os.environ.get('SWAP_STORE_DIRECTORY', '/tmp/rangeseeker/swaps')))  # noqa: S108
 
     print('Fetching pool...')
     pool = await uniswapClient.get_pool(token0Address=WETH_ADDRESS, token1Address=USDC_ADDRESS)
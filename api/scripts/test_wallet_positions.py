@@ -6,14 +6,20 @@ import sys
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+from core.requester import Requester
+from core.web3.eth_client import RestEthClient
+
 from rangeseeker.external.amp_client import AmpClient
+from rangeseeker.external.multicall_client import MulticallClient
 from rangeseeker.external.uniswap_data_client import UniswapDataClient
+from rangeseeker.store.swap_store import SwapStore
 
 
 async def main() -> None:
     token = os.environ.get('THEGRAPHAMP_API_KEY', '')
     ampClient = AmpClient(flightUrl='https://gateway.amp.staging.thegraph.com', token=token)
-    uniswapClient = UniswapDataClient(ampClient=ampClient)
+    ethClient = RestEthClient(url=os.environ['RPC_NODE_URL_8453'], chainId=8453, requester=Requester())
+    uniswapClient = UniswapDataClient(ampClient=ampClient, ethClient=ethClient, multicallClient=MulticallClient(ethClient=ethClient), swapStore=SwapStore(rootDirectory=os.environ.get('SWAP_STORE_DIRECTORY', '/tmp/rangeseeker/swaps')))  # noqa: S108
 
     # My agent wallet from the rebalance
     walletAddress = '0x1E15E0B70C7f09A52c62eE0364b88C145c61118e'
@@ -1,6 +1,8 @@
 import asyncio
 import datetime
 import os
+import signal
+import socket
 import time
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler  # type: ignore[import-untyped]
@@ -8,7 +10,17 @@ from apscheduler.triggers.interval import IntervalTrigger  # type: ignore[import
 from core import logging
 
 from rangeseeker import constants
+from rangeseeker.agent_lease_manager import AgentLeaseManager
+from rangeseeker.app_manager import AppManager
+from rangeseeker.create_app_manager import RebalanceQueue
 from rangeseeker.create_app_manager import create_app_manager
+from rangeseeker.create_app_manager import create_rebalance_queue
+from rangeseeker.messages import ExitAgentToStableMessageContent
+from rangeseeker.messages import RebalanceAgentMessageContent
+from rangeseeker.model import Agent
+from rangeseeker.strategy_compiler import ACTION_EXIT_TO_STABLE
+from rangeseeker.strategy_compiler import ACTION_REBALANCE
+from rangeseeker.strategy_compiler import MarketSnapshot
 
 name = os.environ.get('NAME', 'rangeseeker-worker')
 version = os.environ.get('VERSION', 'local')
@@ -21,126 +33,274 @@ else:
     logging.init_json_logging(name=name, version=version, environment=environment)
 logging.init_external_loggers(loggerNames=['apscheduler'], loggingLevel=logging.WARNING)
 
+# The worker only evaluates the agents' strategies, the resulting rebalances and exits are queued for executor.py
+AGENT_CHECK_CONCURRENCY = int(os.environ.get('AGENT_CHECK_CONCURRENCY', '25'))
+AGENT_CHECK_TIMEOUT_SECONDS = float(os.environ.get('AGENT_CHECK_TIMEOUT_SECONDS', '60'))
+# An agent is not queued again until its previous message has had time to be executed
+AGENT_REBALANCE_ENQUEUE_COOLDOWN_SECONDS = float(os.environ.get('AGENT_REBALANCE_ENQUEUE_COOLDOWN_SECONDS', '600'))
+# In stream mode the worker follows the pool's swaps and the interval check becomes a slow safety sweep
+WORKER_MODE = os.environ.get('WORKER_MODE', 'interval')
+SWEEP_INTERVAL_MINUTES = int(os.environ.get('SWEEP_INTERVAL_MINUTES', '60' if WORKER_MODE == 'stream' else '15'))
+STREAM_POLL_SECONDS = float(os.environ.get('STREAM_POLL_SECONDS', '2'))
+# Agents are split between worker processes through leases in postgres, a crashed worker's leases expire after AGENT_LEASE_SECONDS
+WORKER_ID = os.environ.get('WORKER_ID', f'{socket.gethostname()}-{os.getpid()}')
+AGENT_LEASE_SECONDS = int(os.environ.get('AGENT_LEASE_SECONDS', '90'))
+AGENT_LEASE_RENEW_SECONDS = int(os.environ.get('AGENT_LEASE_RENEW_SECONDS', str(AGENT_LEASE_SECONDS // 3)))
+# Keeps the position ownership index close to the chain head so ownership lookups can read it without syncing
+POSITION_OWNERSHIP_SYNC_SECONDS = int(os.environ.get('POSITION_OWNERSHIP_SYNC_SECONDS', '60'))
+CLIENT_STATS_LOG_SECONDS = int(os.environ.get('CLIENT_STATS_LOG_SECONDS', '300'))
 
-async def check_and_rebalance_agents() -> None:
-    """Check all agents and rebalance if needed based on their strategy."""
-    startTime = time.time()
-    logging.info('[REBALANCE_WORKER] Starting agent rebalance check')
+checkSemaphore = asyncio.Semaphore(AGENT_CHECK_CONCURRENCY)
+inFlightAgentIds: set[str] = set()
+agentEnqueueTimes: dict[str, float] = {}
+leasedAgentIds: set[str] = set()
+# When each leased agent's lease was last renewed, a lease that couldn't be renewed may be claimed by another worker once it is AGENT_LEASE_SECONDS old
+agentLeaseRenewTimes: dict[str, float] = {}
 
-    appManager = create_app_manager()
-    await appManager.database.connect()
 
+def is_agent_leased(agentId: str) -> bool:
+    renewTime = agentLeaseRenewTimes.get(agentId)
+    return agentId in leasedAgentIds and renewTime is not None and time.time() - renewTime < AGENT_LEASE_SECONDS
+
+
+async def enqueue_agent_action(rebalanceQueue: RebalanceQueue, agent: Agent, action: str, currentTick: int) -> None:
+    lastEnqueueTime = agentEnqueueTimes.get(agent.agentId)
+    if lastEnqueueTime is not None and time.time() - lastEnqueueTime < AGENT_REBALANCE_ENQUEUE_COOLDOWN_SECONDS:
+        logging.info(f'[REBALANCE_WORKER] {action} for agent {agent.agentId} was queued {time.time() - lastEnqueueTime:.0f}s ago, skipping')
+        return
+    logging.info(f'[REBALANCE_WORKER] Queueing {action} for agent {agent.agentId}')
+    if action == ACTION_EXIT_TO_STABLE:
+        await rebalanceQueue.send_message(message=ExitAgentToStableMessageContent(agentId=agent.agentId, userId=agent.userId, tick=currentTick).to_message())
+    elif action == ACTION_REBALANCE:
+        await rebalanceQueue.send_message(message=RebalanceAgentMessageContent(agentId=agent.agentId, userId=agent.userId, tick=currentTick).to_message())
+    agentEnqueueTimes[agent.agentId] = time.time()
+
+
+async def check_agent(appManager: AppManager, rebalanceQueue: RebalanceQueue, agent: Agent, snapshot: MarketSnapshot) -> None:
+    if not is_agent_leased(agentId=agent.agentId):
+        logging.info(f'[REBALANCE_WORKER] Agent {agent.agentId} is not leased by this worker, skipping')
+        return
+    # The stream and the sweep can both flag the same agent, only one of them should act on it
+    if agent.agentId in inFlightAgentIds:
+        logging.info(f'[REBALANCE_WORKER] Agent {agent.agentId} is already being checked, skipping')
+        return
+    inFlightAgentIds.add(agent.agentId)
     try:
-        # Get all agents
-        agents = await appManager.userManager.database.execute(query='SELECT agent_id, user_id, strategy_id FROM agents')  # type: ignore[var-annotated,arg-type]
-        logging.info(f'[REBALANCE_WORKER] Found {len(list(agents))} agents to check')
-        for agent_row in agents:
-            agent_id = agent_row['agent_id']  # type: ignore[call-overload]
-            user_id = agent_row['user_id']  # type: ignore[call-overload]
-            try:
-                logging.info(f'[REBALANCE_WORKER] Checking agent {agent_id}')
-
-                # Get agent wallet
-                agentWallet = await appManager.userManager.get_agent_wallet(userId=user_id, agentId=agent_id)
-
-                # Get current positions
-                positions = await appManager.get_wallet_uniswap_positions(walletAddress=agentWallet.walletAddress)
-
-                if not positions:
-                    logging.info(f'[REBALANCE_WORKER] Agent {agent_id} has no positions, skipping')
-                    continue
-
-                # Get pool state
-                pool = await appManager.strategyManager.uniswapClient.get_pool(
-                    token0Address=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
-                    token1Address=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
-                    feeTier=500,
-                )
-                currentTick = pool.tick
-                currentPrice = appManager.strategyManager.uniswapClient.calculate_price_from_sqrt_price_x96(pool.sqrtPriceX96)
-
-                logging.info(f'[REBALANCE_WORKER] Current pool state - tick: {currentTick}, price: {currentPrice:.2f}')
-
-                # Check each position to see if it's out of range
-                needsRebalance = False
-                for position in positions:
-                    if position.tickLower is None or position.tickUpper is None:
-                        logging.warning(f'[REBALANCE_WORKER] Position {position.tokenId} missing tick data')
-                        continue
-
-                    # Check if current tick is outside the position range
-                    if currentTick < position.tickLower or currentTick > position.tickUpper:
-                        logging.info(f'[REBALANCE_WORKER] Position {position.tokenId} is OUT OF RANGE - current tick {currentTick} not in [{position.tickLower}, {position.tickUpper}]')
-                        needsRebalance = True
-                        break
-
-                    # Calculate how close we are to the edge (as a percentage of the range)
-                    rangeSize = position.tickUpper - position.tickLower
-                    distanceFromLower = currentTick - position.tickLower
-                    distanceFromUpper = position.tickUpper - currentTick
-
-                    # If we're within 10% of either edge, consider rebalancing
-                    edgeThreshold = rangeSize * 0.1
-                    if distanceFromLower < edgeThreshold or distanceFromUpper < edgeThreshold:
-                        logging.info(f'[REBALANCE_WORKER] Position {position.tokenId} is near edge - distance from lower: {distanceFromLower}, from upper: {distanceFromUpper}, threshold: {edgeThreshold}')
-                        needsRebalance = True
-                        break
-
-                if needsRebalance:
-                    logging.info(f'[REBALANCE_WORKER] Triggering rebalance for agent {agent_id}')
-                    await appManager.deposit_made_to_agent(userId=user_id, agentId=agent_id)
-                    logging.info(f'[REBALANCE_WORKER] Successfully rebalanced agent {agent_id}')
-                else:
-                    logging.info(f'[REBALANCE_WORKER] Agent {agent_id} positions are in range, no rebalance needed')
+        async with checkSemaphore:
+            logging.info(f'[REBALANCE_WORKER] Checking agent {agent.agentId}')
+            action = await asyncio.wait_for(appManager.get_agent_action(agent=agent, snapshot=snapshot), timeout=AGENT_CHECK_TIMEOUT_SECONDS)
+        if action not in {ACTION_REBALANCE, ACTION_EXIT_TO_STABLE}:
+            return
+        await enqueue_agent_action(rebalanceQueue=rebalanceQueue, agent=agent, action=action, currentTick=snapshot.tick)
+    except TimeoutError:
+        logging.error(f'[REBALANCE_WORKER] Timed out processing agent {agent.agentId}')
+    except Exception as error:  # noqa: BLE001
+        logging.error(f'[REBALANCE_WORKER] Error checking agent {agent.agentId}: {error}')
+        logging.exception(error)
+    finally:
+        inFlightAgentIds.discard(agent.agentId)
+
 
+async def check_and_rebalance_agents(appManager: AppManager, rebalanceQueue: RebalanceQueue) -> None:
+    """Evaluate every leased agent's strategy against one market snapshot and queue the rebalances and exits it calls for."""
+    startTime = time.time()
+    logging.info('[REBALANCE_WORKER] Starting agent rebalance check')
+    try:
+        agents = await appManager.userManager.list_all_agents()
+        logging.info(f'[REBALANCE_WORKER] Found {len(agents)} agents')
+        # Get the market state once per cycle, every agent is evaluated against the same snapshot
+        snapshot = await appManager.get_market_snapshot()
+        logging.info(f'[REBALANCE_WORKER] Current market snapshot - tick: {snapshot.tick}, price: {snapshot.priceUsd:.2f}, volatility: {snapshot.volatility:.4f}')
+        # Positions minted through the api are written to the positions table, a single query picks them all up
+        await appManager.rebuild_position_index()
+        leasedAgents = [agent for agent in agents if is_agent_leased(agentId=agent.agentId)]
+        agentActions = await appManager.evaluate_agent_strategies(agents=leasedAgents, snapshot=snapshot)
+        logging.info(f'[REBALANCE_WORKER] Strategies call for action on {len(agentActions)} of {len(leasedAgents)} leased agents')
+        for agent in leasedAgents:
+            action = agentActions.get(agent.agentId)
+            # Agents the stream is already checking are left to it, and a lease may have expired while the strategies were evaluated
+            if action is None or agent.agentId in inFlightAgentIds or not is_agent_leased(agentId=agent.agentId):
+                continue
+            try:
+                await enqueue_agent_action(rebalanceQueue=rebalanceQueue, agent=agent, action=action, currentTick=snapshot.tick)
             except Exception as error:  # noqa: BLE001
-                logging.error(f'[REBALANCE_WORKER] Error checking agent {agent_id}: {error}')
+                logging.error(f'[REBALANCE_WORKER] Error queueing {action} for agent {agent.agentId}: {error}')
                 logging.exception(error)
-                continue
-
         duration = time.time() - startTime
         logging.info(f'[REBALANCE_WORKER] Completed agent rebalance check in {duration:.2f}s')
-
     except Exception as error:  # noqa: BLE001
         logging.error(f'[REBALANCE_WORKER] Error in rebalance worker: {error}')
         logging.exception(error)
-    finally:
-        await appManager.database.disconnect()
+
+
+def drop_expired_agent_leases() -> None:
+    expiredAgentIds = {agentId for agentId in leasedAgentIds if not is_agent_leased(agentId=agentId)}
+    if len(expiredAgentIds) == 0:
+        return
+    logging.error(f'[REBALANCE_WORKER] Leases on {len(expiredAgentIds)} agents expired without being renewed, no longer checking them')
+    leasedAgentIds.difference_update(expiredAgentIds)
+    for agentId in expiredAgentIds:
+        agentLeaseRenewTimes.pop(agentId, None)
+
+
+async def renew_agent_leases(agentLeaseManager: AgentLeaseManager) -> None:
+    # Taken before the claim so it is never later than the expiry the claim writes
+    renewTime = time.time()
+    try:
+        await agentLeaseManager.heartbeat()
+        claimedAgentIds = await agentLeaseManager.claim_agent_leases()
+    except Exception as error:  # noqa: BLE001
+        # Keep working on the current leases until they expire
+        logging.error(f'[REBALANCE_WORKER] Error renewing agent leases: {error}')
+        logging.exception(error)
+        drop_expired_agent_leases()
+        return
+    # Updated in place so running checks see the new set
+    leasedAgentIds.intersection_update(claimedAgentIds)
+    leasedAgentIds.update(claimedAgentIds)
+    for agentId in set(agentLeaseRenewTimes) - claimedAgentIds:
+        del agentLeaseRenewTimes[agentId]
+    for agentId in claimedAgentIds:
+        agentLeaseRenewTimes[agentId] = renewTime
+
+
+async def sync_position_ownership(appManager: AppManager) -> None:
+    try:
+        await appManager.positionOwnershipManager.sync()
+    except Exception as error:  # noqa: BLE001
+        logging.error(f'[REBALANCE_WORKER] Error syncing position ownership: {error}')
+        logging.exception(error)
+
+
+async def follow_pool_tick_stream(appManager: AppManager, rebalanceQueue: RebalanceQueue) -> None:
+    """Follow the WETH/USDC pool's swaps by block cursor and check only the agents whose ranges a new tick crossed."""
+    uniswapClient = appManager.strategyManager.uniswapClient
+    pool = await uniswapClient.get_pool(
+        token0Address=constants.CHAIN_WETH_MAP[constants.BASE_CHAIN_ID],
+        token1Address=constants.CHAIN_USDC_MAP[constants.BASE_CHAIN_ID],
+        feeTier=500,
+    )
+    blockCursor = await appManager.ethClient.get_latest_block_number()
+    previousTick = pool.tick
+    logging.info(f'[REBALANCE_WORKER] Following swaps on {pool.address} from block {blockCursor}, tick {previousTick}')
+    tasks: set[asyncio.Task[None]] = set()
+    while True:
+        await asyncio.sleep(STREAM_POLL_SECONDS)
+        try:
+            latestBlockNumber = await appManager.ethClient.get_latest_block_number()
+            if latestBlockNumber <= blockCursor:
+                continue
+            swapStates = await uniswapClient.get_pool_swap_states(poolAddress=pool.address, startBlockNumber=blockCursor + 1, endBlockNumber=latestBlockNumber)
+            blockCursor = latestBlockNumber
+            await appManager.refresh_position_index()
+            crossedAgentIds: set[str] = set()
+            for swapState in swapStates:
+                crossedAgentIds.update(appManager.positionIndex.get_agent_ids_crossed(poolAddress=pool.address, fromTick=previousTick, toTick=swapState.tick))
+                previousTick = swapState.tick
+            if not crossedAgentIds:
+                continue
+            logging.info(f'[REBALANCE_WORKER] Tick {previousTick} crossed the ranges of {len(crossedAgentIds)} agents')
+            snapshot = (await appManager.get_market_snapshot()).model_copy(update={'tick': previousTick})
+            drop_expired_agent_leases()
+            for agentId in (crossedAgentIds & leasedAgentIds) - inFlightAgentIds:
+                agent = await appManager.userManager.get_agent_raw(agentId=agentId)
+                task = asyncio.create_task(check_agent(appManager=appManager, rebalanceQueue=rebalanceQueue, agent=agent, snapshot=snapshot))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except Exception as error:  # noqa: BLE001
+            logging.error(f'[REBALANCE_WORKER] Error following pool tick stream: {error}')
+            logging.exception(error)
 
 
 async def main() -> None:
     logging.info('[REBALANCE_WORKER] Starting rebalance worker')
-
+    # One app manager (and so one db connection pool, http client and set of client caches) lives for the whole process
+    appManager = create_app_manager()
+    await appManager.database.connect()
+    agentLeaseManager = AgentLeaseManager(database=appManager.database, workerId=WORKER_ID, leaseSeconds=AGENT_LEASE_SECONDS)
+    rebalanceQueue = create_rebalance_queue(database=appManager.database)
+    await rebalanceQueue.connect()
     scheduler = AsyncIOScheduler()
+    stopEvent = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stopSignal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stopSignal, stopEvent.set)
+    try:
+        logging.info('[REBALANCE_WORKER] Warming up clients')
+        await appManager.warm_up()
+        logging.info('[REBALANCE_WORKER] Building position index')
+        await appManager.rebuild_position_index()
+        logging.info(f'[REBALANCE_WORKER] Claiming agent leases as worker {WORKER_ID}')
+        await renew_agent_leases(agentLeaseManager=agentLeaseManager)
 
-    # Run every 15 minutes
-    trigger = IntervalTrigger(
-        minutes=15,
-        start_date=datetime.datetime.now(tz=datetime.UTC),
-    )
+        scheduler.add_job(
+            func=renew_agent_leases,
+            kwargs={'agentLeaseManager': agentLeaseManager},
+            trigger=IntervalTrigger(seconds=AGENT_LEASE_RENEW_SECONDS, start_date=datetime.datetime.now(tz=datetime.UTC)),
+            id='renew-agent-leases',
+            name='renew-agent-leases',
+            replace_existing=True,
+        )
 
-    scheduler.add_job(
-        func=check_and_rebalance_agents,
-        trigger=trigger,
-        id='rebalance-agents',
-        name='rebalance-agents',
-        replace_existing=True,
-    )
+        scheduler.add_job(
+            func=sync_position_ownership,
+            kwargs={'appManager': appManager},
+            trigger=IntervalTrigger(seconds=POSITION_OWNERSHIP_SYNC_SECONDS, start_date=datetime.datetime.now(tz=datetime.UTC)),
+            id='sync-position-ownership',
+            name='sync-position-ownership',
+            replace_existing=True,
+        )
 
-    scheduler.start()
-    logging.info('[REBALANCE_WORKER] Scheduler started, checking agents every 15 minutes')
+        scheduler.add_job(
+            func=appManager.log_client_stats,
+            trigger=IntervalTrigger(seconds=CLIENT_STATS_LOG_SECONDS, start_date=datetime.datetime.now(tz=datetime.UTC)),
+            id='log-client-stats',
+            name='log-client-stats',
+            replace_existing=True,
+        )
 
-    # Run once immediately on startup
-    logging.info('[REBALANCE_WORKER] Running initial check')
-    await check_and_rebalance_agents()
+        trigger = IntervalTrigger(
+            minutes=SWEEP_INTERVAL_MINUTES,
+            start_date=datetime.datetime.now(tz=datetime.UTC),
+        )
 
-    # Keep the worker running
-    event = asyncio.Event()
-    try:
-        await event.wait()
+        scheduler.add_job(
+            func=check_and_rebalance_agents,
+            kwargs={'appManager': appManager, 'rebalanceQueue': rebalanceQueue},
+            trigger=trigger,
+            id='rebalance-agents',
+            name='rebalance-agents',
+            replace_existing=True,
+        )
+
+        scheduler.start()
+        logging.info(f'[REBALANCE_WORKER] Scheduler started, checking agents every {SWEEP_INTERVAL_MINUTES} minutes')
+
+        # Run once immediately on startup
+        logging.info('[REBALANCE_WORKER] Running initial check')
+        await check_and_rebalance_agents(appManager=appManager, rebalanceQueue=rebalanceQueue)
+
+        if WORKER_MODE == 'stream':
+            streamTask = asyncio.create_task(follow_pool_tick_stream(appManager=appManager, rebalanceQueue=rebalanceQueue))
+            stopTask = asyncio.create_task(stopEvent.wait())
+            doneTasks, _ = await asyncio.wait([streamTask, stopTask], return_when=asyncio.FIRST_COMPLETED)
+            streamTask.cancel()
+            stopTask.cancel()
+            if streamTask in doneTasks:
+                # Surfaces the error if the stream stopped by itself
+                streamTask.result()
+        else:
+            # Keep the worker running until it is asked to stop
+            await stopEvent.wait()
     finally:
-        logging.info('[REBALANCE_WORKER] Shutting down scheduler...')
-        scheduler.shutdown()
+        logging.info('[REBALANCE_WORKER] Shutting down...')
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+        await agentLeaseManager.release_agent_leases()
+        await rebalanceQueue.disconnect()
+        await appManager.database.disconnect()
+        await appManager.requester.close_connections()
+        await appManager.strategyManager.uniswapClient.ampClient.close_connections()
 
 
 if __name__ == '__main__':